@@ -0,0 +1,48 @@
+"""Post embeddings store
+
+Revision ID: 002
+Revises: 001
+Create Date: 2025-11-24 10:12:41.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create post_embeddings table
+    op.create_table('post_embeddings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.String(length=100), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('embedding', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_post_embedding_key', 'post_embeddings', ['post_id', 'content_hash', 'model'], unique=True)
+    op.create_index('idx_post_embedding_client_model', 'post_embeddings', ['client_id', 'model'], unique=False)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE post_embeddings ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_post_embeddings ON post_embeddings
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('post_embeddings')
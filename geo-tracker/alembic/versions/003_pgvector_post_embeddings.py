@@ -0,0 +1,77 @@
+"""pgvector index for post embeddings
+
+Revision ID: 003
+Revises: 002
+Create Date: 2025-11-26 16:40:05.532871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match EMBEDDING_DIMENSIONS
+EMBEDDING_DIMENSIONS = 1536
+
+
+def _vector_available() -> bool:
+    """Whether the pgvector extension can be installed on this server"""
+    bind = op.get_bind()
+    return bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'vector'")
+    ).scalar() is not None
+
+
+def upgrade() -> None:
+    # Deployments without pgvector use the in-process similarity index instead
+    if not _vector_available():
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+    # Create post_embedding_vectors table
+    op.create_table('post_embedding_vectors',
+        sa.Column('post_embedding_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.String(length=100), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('embedding', Vector(EMBEDDING_DIMENSIONS), nullable=False),
+        sa.ForeignKeyConstraint(['post_embedding_id'], ['post_embeddings.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.PrimaryKeyConstraint('post_embedding_id')
+    )
+    op.create_index('idx_post_vector_client_model', 'post_embedding_vectors', ['client_id', 'model'], unique=False)
+    op.create_index(
+        'idx_post_vector_hnsw', 'post_embedding_vectors', ['embedding'], unique=False,
+        postgresql_using='hnsw',
+        postgresql_with={'m': 16, 'ef_construction': 64},
+        postgresql_ops={'embedding': 'vector_cosine_ops'},
+    )
+
+    # Copy embeddings already stored as JSON
+    op.execute(f"""
+        INSERT INTO post_embedding_vectors (post_embedding_id, client_id, post_id, model, embedding)
+        SELECT id, client_id, post_id, model, embedding::text::vector
+        FROM post_embeddings
+        WHERE json_array_length(embedding) = {EMBEDDING_DIMENSIONS}
+    """)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE post_embedding_vectors ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_post_embedding_vectors ON post_embedding_vectors
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS post_embedding_vectors")
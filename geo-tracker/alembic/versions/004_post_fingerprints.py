@@ -0,0 +1,47 @@
+"""Post MinHash fingerprints
+
+Revision ID: 004
+Revises: 003
+Create Date: 2025-11-28 09:21:37.640518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create post_fingerprints table
+    op.create_table('post_fingerprints',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.String(length=100), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('minhash', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_post_fingerprint_post', 'post_fingerprints', ['post_id'], unique=True)
+    op.create_index('idx_post_fingerprint_client', 'post_fingerprints', ['client_id'], unique=False)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE post_fingerprints ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_post_fingerprints ON post_fingerprints
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('post_fingerprints')
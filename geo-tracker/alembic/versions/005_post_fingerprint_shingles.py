@@ -0,0 +1,32 @@
+"""Hashed shingles on post fingerprints
+
+Revision ID: 005
+Revises: 004
+Create Date: 2025-12-01 14:02:55.907316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '005'
+down_revision: Union[str, None] = '004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Signatures are now built from hashed shingles; stored ones are
+    # regenerated on the next sync or similarity run
+    op.execute("DELETE FROM post_fingerprints")
+
+    op.add_column('post_fingerprints', sa.Column('shingles', sa.LargeBinary(), nullable=False))
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM post_fingerprints")
+
+    op.drop_column('post_fingerprints', 'shingles')
@@ -0,0 +1,52 @@
+"""Post passages
+
+Revision ID: 006
+Revises: 005
+Create Date: 2025-12-03 11:47:18.274930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '006'
+down_revision: Union[str, None] = '005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create post_passages table
+    op.create_table('post_passages',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('post_id', sa.String(length=100), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('passage_index', sa.Integer(), nullable=False),
+        sa.Column('start_offset', sa.Integer(), nullable=False),
+        sa.Column('end_offset', sa.Integer(), nullable=False),
+        sa.Column('embedding', sa.JSON(), nullable=False),
+        sa.Column('shingles', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_post_passage_key', 'post_passages', ['post_id', 'model', 'passage_index'], unique=True)
+    op.create_index('idx_post_passage_client_model', 'post_passages', ['client_id', 'model'], unique=False)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE post_passages ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_post_passages ON post_passages
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('post_passages')
@@ -0,0 +1,48 @@
+"""Answer embeddings store
+
+Revision ID: 007
+Revises: 006
+Create Date: 2025-12-05 16:33:09.518264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '007'
+down_revision: Union[str, None] = '006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create answer_embeddings table
+    op.create_table('answer_embeddings',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('answer_id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('embedding', sa.JSON(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.ForeignKeyConstraint(['answer_id'], ['answers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_answer_embedding_key', 'answer_embeddings', ['answer_id', 'model'], unique=True)
+    op.create_index('idx_answer_embedding_client_model', 'answer_embeddings', ['client_id', 'model'], unique=False)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE answer_embeddings ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_answer_embeddings ON answer_embeddings
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('answer_embeddings')
@@ -0,0 +1,34 @@
+"""Term counts on post fingerprints for BM25
+
+Revision ID: 008
+Revises: 007
+Create Date: 2025-12-08 10:17:42.630981
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '008'
+down_revision: Union[str, None] = '007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Stored fingerprints have no term counts; they are regenerated on the
+    # next sync or similarity run
+    op.execute("DELETE FROM post_fingerprints")
+
+    op.add_column('post_fingerprints', sa.Column('terms', sa.LargeBinary(), nullable=False))
+    op.add_column('post_fingerprints', sa.Column('term_counts', sa.LargeBinary(), nullable=False))
+
+
+def downgrade() -> None:
+    op.execute("DELETE FROM post_fingerprints")
+
+    op.drop_column('post_fingerprints', 'term_counts')
+    op.drop_column('post_fingerprints', 'terms')
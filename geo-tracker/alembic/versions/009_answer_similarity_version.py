@@ -0,0 +1,30 @@
+"""Corpus version answers were scored against
+
+Revision ID: 009
+Revises: 008
+Create Date: 2025-12-09 11:48:06.274519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '009'
+down_revision: Union[str, None] = '008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('answers', sa.Column('similarity_corpus_version', sa.String(length=64), nullable=True))
+    op.create_index(
+        'idx_answer_hash_version', 'answers', ['response_hash', 'similarity_corpus_version']
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_answer_hash_version', table_name='answers')
+    op.drop_column('answers', 'similarity_corpus_version')
@@ -0,0 +1,93 @@
+"""Per-answer KPI features
+
+Revision ID: 010
+Revises: 009
+Create Date: 2025-12-10 09:12:41.602318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '010'
+down_revision: Union[str, None] = '009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def mentions(text: str, name: str) -> str:
+    """
+    SQL condition: the name occurs in the text as a whole word, ignoring case
+
+    Same rule as the search service's patterns: the name is trimmed, its
+    punctuation escaped, and it must not touch a word character on
+    either side, so "Acme" is not found in "Acmeville". Blank names
+    match nothing.
+    """
+    return (
+        rf"coalesce(btrim({name}) <> '' AND {text} ~* ('(?<!\w)' || "
+        rf"regexp_replace(btrim({name}), '([^[:alnum:]_ ])', '\\\1', 'g') || '(?!\w)'), false)"
+    )
+
+
+def upgrade() -> None:
+    # Create answer_features table
+    op.create_table('answer_features',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('answer_id', sa.Integer(), nullable=False),
+        sa.Column('cites_client', sa.Boolean(), nullable=False),
+        sa.Column('cited_domains', sa.Integer(), nullable=False),
+        sa.Column('citation_count', sa.Integer(), nullable=False),
+        sa.Column('mentions_client', sa.Boolean(), nullable=False),
+        sa.Column('mentions_entity', sa.Boolean(), nullable=False),
+        sa.Column('best_similarity', sa.Float(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.ForeignKeyConstraint(['answer_id'], ['answers.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_answer_feature_answer', 'answer_features', ['answer_id'], unique=True)
+    op.create_index('idx_answer_feature_client', 'answer_features', ['client_id'], unique=False)
+
+    # Features of answers stored before this revision
+    op.execute(f"""
+        INSERT INTO answer_features (
+            client_id, answer_id, cites_client, cited_domains, citation_count,
+            mentions_client, mentions_entity, best_similarity, created_at, updated_at
+        )
+        SELECT
+            r.client_id,
+            a.id,
+            EXISTS (SELECT 1 FROM citations c WHERE c.answer_id = a.id AND c.domain = cl.domain),
+            (SELECT count(DISTINCT c.domain) FROM citations c WHERE c.answer_id = a.id),
+            (SELECT count(*) FROM citations c WHERE c.answer_id = a.id),
+            {mentions("a.raw_response", "cl.name")},
+            EXISTS (
+                SELECT 1 FROM wordpress_entities e
+                WHERE e.client_id = r.client_id
+                AND {mentions("a.raw_response", "e.name")}
+            ),
+            (SELECT max(s.similarity_score) FROM similarities s WHERE s.answer_id = a.id),
+            now(),
+            now()
+        FROM answers a
+        JOIN runs r ON r.id = a.run_id
+        JOIN clients cl ON cl.id = r.client_id
+    """)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE answer_features ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_answer_features ON answer_features
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('answer_features')
@@ -0,0 +1,51 @@
+"""Metric rate numerators and denominator
+
+Revision ID: 011
+Revises: 010
+Create Date: 2025-12-11 10:03:27.914406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '011'
+down_revision: Union[str, None] = '010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNT_COLUMNS = [
+    'answer_count',
+    'citing_answers',
+    'extracted_answers',
+    'present_answers',
+    'co_visible_answers',
+]
+
+
+def upgrade() -> None:
+    for column in COUNT_COLUMNS:
+        op.add_column('metrics', sa.Column(column, sa.Integer(), nullable=True, server_default='0'))
+
+    # Recover counts of existing rows from their answer ids and rates
+    # (older inclusion rates counted citation rows and could exceed 100%)
+    op.execute("""
+        UPDATE metrics SET answer_count = json_array_length(metadata_json -> 'answer_ids')
+        WHERE json_typeof(metadata_json -> 'answer_ids') = 'array'
+    """)
+    op.execute("""
+        UPDATE metrics SET
+            citing_answers = least(answer_count, round(inclusion_rate * answer_count / 100.0)),
+            extracted_answers = least(answer_count, round(extraction_rate * answer_count / 100.0)),
+            present_answers = least(answer_count, round(presence_rate * answer_count / 100.0)),
+            co_visible_answers = least(answer_count, round(co_visibility_rate * answer_count / 100.0))
+        WHERE answer_count > 0
+    """)
+
+
+def downgrade() -> None:
+    for column in reversed(COUNT_COLUMNS):
+        op.drop_column('metrics', column)
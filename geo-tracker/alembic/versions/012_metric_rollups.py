@@ -0,0 +1,76 @@
+"""Weekly and monthly metric rollups
+
+Revision ID: 012
+Revises: 011
+Create Date: 2025-12-12 14:21:55.380127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '012'
+down_revision: Union[str, None] = '011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNT_COLUMNS = [
+    'total_queries',
+    'successful_runs',
+    'answer_count',
+    'citing_answers',
+    'extracted_answers',
+    'present_answers',
+    'co_visible_answers',
+    'total_citations',
+    'client_mentions',
+]
+
+
+def upgrade() -> None:
+    # Create metric_rollups table
+    op.create_table('metric_rollups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=10), nullable=False),
+        sa.Column('period_start', sa.DateTime(), nullable=False),
+        sa.Column('engine', sa.String(length=50), nullable=False),
+        sa.Column('topic', sa.String(length=255), nullable=False),
+        *[sa.Column(column, sa.Integer(), nullable=True) for column in COUNT_COLUMNS],
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'idx_metric_rollup_key', 'metric_rollups',
+        ['client_id', 'period', 'period_start', 'engine', 'topic'], unique=True
+    )
+
+    # Roll up existing daily metrics
+    counts = ", ".join(COUNT_COLUMNS)
+    sums = ", ".join(f"sum(m.{column})" for column in COUNT_COLUMNS)
+    for period in ('week', 'month'):
+        op.execute(f"""
+            INSERT INTO metric_rollups (
+                client_id, period, period_start, engine, topic, {counts}, created_at
+            )
+            SELECT m.client_id, '{period}', date_trunc('{period}', m.date), m.engine, q.topic, {sums}, now()
+            FROM metrics m
+            JOIN queries q ON q.id = m.query_id
+            GROUP BY m.client_id, date_trunc('{period}', m.date), m.engine, q.topic
+        """)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE metric_rollups ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_metric_rollups ON metric_rollups
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('metric_rollups')
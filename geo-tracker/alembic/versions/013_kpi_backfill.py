@@ -0,0 +1,63 @@
+"""KPI backfill jobs and unit checkpoints
+
+Revision ID: 013
+Revises: 012
+Create Date: 2025-12-15 10:02:41.516208
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '013'
+down_revision: Union[str, None] = '012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create kpi_backfill_jobs table
+    op.create_table('kpi_backfill_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('date_from', sa.DateTime(), nullable=False),
+        sa.Column('date_to', sa.DateTime(), nullable=False),
+        sa.Column('client_ids', sa.JSON(), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_kpi_backfill_jobs_id'), 'kpi_backfill_jobs', ['id'], unique=False)
+
+    # Create kpi_backfill_units table
+    op.create_table('kpi_backfill_units',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('date', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=50), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=True),
+        sa.Column('metrics_count', sa.Integer(), nullable=True),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['kpi_backfill_jobs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_kpi_backfill_units_id'), 'kpi_backfill_units', ['id'], unique=False)
+    op.create_index('idx_backfill_unit_key', 'kpi_backfill_units', ['job_id', 'client_id', 'date'], unique=True)
+    op.create_index('idx_backfill_unit_status', 'kpi_backfill_units', ['job_id', 'status'], unique=False)
+
+    # No Row Level Security: the job runner creates and pages through units
+    # of every client without a tenant set; the API only exposes a job to
+    # the single client it covers
+
+
+def downgrade() -> None:
+    op.drop_table('kpi_backfill_units')
+    op.drop_table('kpi_backfill_jobs')
@@ -0,0 +1,67 @@
+"""Unique key on daily metrics
+
+Revision ID: 014
+Revises: 013
+Create Date: 2025-12-16 09:41:18.227405
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '014'
+down_revision: Union[str, None] = '013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNT_COLUMNS = [
+    'total_queries',
+    'successful_runs',
+    'answer_count',
+    'citing_answers',
+    'extracted_answers',
+    'present_answers',
+    'co_visible_answers',
+    'total_citations',
+    'client_mentions',
+]
+
+
+def upgrade() -> None:
+    # Keep the newest row of each duplicated (client, query, engine, day)
+    op.execute("""
+        DELETE FROM metrics m
+        USING metrics newer
+        WHERE newer.client_id = m.client_id
+          AND newer.query_id = m.query_id
+          AND newer.engine = m.engine
+          AND newer.date = m.date
+          AND newer.id > m.id
+    """)
+
+    op.create_index(
+        'idx_metric_key', 'metrics',
+        ['client_id', 'query_id', 'engine', 'date'], unique=True
+    )
+
+    # Rollups summed the duplicates too; rebuild them from the remaining rows
+    op.execute("TRUNCATE metric_rollups")
+
+    counts = ", ".join(COUNT_COLUMNS)
+    sums = ", ".join(f"sum(m.{column})" for column in COUNT_COLUMNS)
+    for period in ('week', 'month'):
+        op.execute(f"""
+            INSERT INTO metric_rollups (
+                client_id, period, period_start, engine, topic, {counts}, created_at
+            )
+            SELECT m.client_id, '{period}', date_trunc('{period}', m.date), m.engine, q.topic, {sums}, now()
+            FROM metrics m
+            JOIN queries q ON q.id = m.query_id
+            GROUP BY m.client_id, date_trunc('{period}', m.date), m.engine, q.topic
+        """)
+
+
+def downgrade() -> None:
+    op.drop_index('idx_metric_key', table_name='metrics')
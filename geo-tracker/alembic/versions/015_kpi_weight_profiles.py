@@ -0,0 +1,49 @@
+"""Per-client KPI weight profiles
+
+Revision ID: 015
+Revises: 014
+Create Date: 2025-12-17 11:26:05.734190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '015'
+down_revision: Union[str, None] = '014'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Create kpi_weight_profiles table
+    op.create_table('kpi_weight_profiles',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('inclusion', sa.Float(), nullable=False),
+        sa.Column('extraction', sa.Float(), nullable=False),
+        sa.Column('presence', sa.Float(), nullable=False),
+        sa.Column('co_visibility', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['client_id'], ['clients.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('client_id')
+    )
+    op.create_index(op.f('ix_kpi_weight_profiles_id'), 'kpi_weight_profiles', ['id'], unique=False)
+
+    # Enable Row Level Security
+    op.execute("ALTER TABLE kpi_weight_profiles ENABLE ROW LEVEL SECURITY")
+
+    op.execute("""
+        CREATE POLICY tenant_isolation_kpi_weight_profiles ON kpi_weight_profiles
+        USING (client_id = current_setting('app.current_client_id', '0')::int)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('kpi_weight_profiles')
@@ -3,7 +3,7 @@ Posts API endpoints for WordPress integration
 """
 
 from typing import List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import schemas
@@ -18,12 +18,15 @@ logger = structlog.get_logger(__name__)
 @router.post("/sync", response_model=schemas.PostSyncResponse)
 async def sync_posts(
     sync_data: schemas.PostSyncRequest,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(deps.get_tenant_db),
     current_client: schemas.Client = Depends(deps.get_current_client),
     _: None = Depends(deps.check_rate_limit),
 ) -> Any:
     """
     Sync posts, entities, and AnswerCards from WordPress plugin
+
+    Synced posts are embedded and indexed in the background after the response.
     """
     try:
         logger.info(
@@ -39,6 +42,13 @@ async def sync_posts(
             sync_data=sync_data,
         )
 
+        if sync_data.posts:
+            background_tasks.add_task(
+                post_service.index_synced_posts,
+                current_client.id,
+                [post_data.id for post_data in sync_data.posts],
+            )
+
         logger.info(
             "Posts sync completed",
             client_id=current_client.id,
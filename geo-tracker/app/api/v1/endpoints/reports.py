@@ -2,18 +2,204 @@
 Reports API endpoints for KPI data and analytics
 """
 
-from fastapi import APIRouter
+import json
+from datetime import date, timedelta
+from typing import List, Any, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import schemas
+from app.api import deps
+from app.services.report_service import report_service
+from app.services.kpi_backfill_service import kpi_backfill_service
+from app.services.kpi_frame_service import kpi_frame_service
+from app.services.kpi_service import kpi_service
+import structlog
 
 router = APIRouter()
+logger = structlog.get_logger(__name__)
+
+
+@router.get("/", response_model=schemas.ReportResponse)
+async def get_report(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    engines: List[str] = Query([]),
+    topics: List[str] = Query([]),
+    db: AsyncSession = Depends(deps.get_tenant_db),
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Get KPI report for a date range, by default the last 30 days
+    """
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from must not be after date_to",
+        )
+
+    try:
+        return await report_service.get_report(
+            db,
+            current_client,
+            date_from,
+            date_to,
+            engines=engines,
+            topics=topics,
+        )
+
+    except Exception as e:
+        logger.error(
+            "Report failed",
+            client_id=current_client.id,
+            error=str(e),
+            exc_info=True,
+        )
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to build report",
+        )
+
+
+@router.get("/weights", response_model=schemas.KpiWeightProfile)
+async def get_weights(
+    db: AsyncSession = Depends(deps.get_tenant_db),
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Get the client's visibility index weights
+    """
+    version, weights = await kpi_service.get_weight_profile(db, current_client.id)
+    return {"version": version, "weights": weights}
+
+
+@router.put("/weights", response_model=schemas.KpiWeightProfile)
+async def update_weights(
+    update: schemas.KpiWeightsUpdate,
+    db: AsyncSession = Depends(deps.get_tenant_db),
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Change the client's visibility index weights; stored metrics are not recomputed
+    """
+    try:
+        version, weights = await kpi_service.set_weight_profile(
+            db, current_client.id, update.model_dump(exclude_none=True)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"version": version, "weights": weights}
+
+
+@router.post("/what-if", response_model=schemas.WhatIfResponse)
+async def what_if(
+    request: schemas.WhatIfRequest,
+    db: AsyncSession = Depends(deps.get_tenant_db),
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    KPIs for a date range under another extraction threshold or visibility weights
+    """
+    if request.date_from > request.date_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="date_from must not be after date_to",
+        )
+
+    try:
+        _, profile = await kpi_service.get_weight_profile(db, current_client.id)
+        weights = kpi_service.resolve_weights({**profile, **request.weights})
+
+        frame = await kpi_frame_service.get_extract(
+            db, current_client.id, request.date_from, request.date_to, refresh=request.refresh
+        )
+        result = kpi_frame_service.compute(
+            frame,
+            by=request.group_by,
+            extraction_threshold=request.extraction_threshold,
+            weights=weights,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    threshold = request.extraction_threshold
+    return {
+        "client_id": current_client.id,
+        "runs": len(frame),
+        "extraction_threshold": kpi_service.extraction_threshold if threshold is None else threshold,
+        "weights": weights,
+        # Through JSON, so NumPy scalars and timestamps come out as plain values
+        "rows": json.loads(
+            result.reset_index(drop=not request.group_by).to_json(orient="records", date_format="iso")
+        ),
+    }
+
+
+@router.post("/backfill", response_model=schemas.KpiBackfillJob, status_code=status.HTTP_202_ACCEPTED)
+async def start_backfill(
+    backfill: schemas.KpiBackfillRequest,
+    background_tasks: BackgroundTasks,
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Recompute the client's daily metrics for a date range in the background
+
+    Jobs over several clients are started with the backfill command.
+    """
+    try:
+        job_id = await kpi_backfill_service.create_job(
+            backfill.date_from,
+            backfill.date_to,
+            [current_client.id],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    logger.info("KPI backfill triggered", job_id=job_id, client_id=current_client.id)
+    background_tasks.add_task(kpi_backfill_service.run_job, job_id)
+
+    return await kpi_backfill_service.get_job(job_id, client_id=current_client.id)
+
+
+@router.get("/backfill/{job_id}", response_model=schemas.KpiBackfillJob)
+async def get_backfill(
+    job_id: int,
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Get a backfill job's status and unit counts
+    """
+    # Other clients' jobs are reported as missing
+    job = await kpi_backfill_service.get_job(job_id, client_id=current_client.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Backfill job not found")
+    return job
+
+
+@router.post("/backfill/{job_id}/resume", response_model=schemas.KpiBackfillJob, status_code=status.HTTP_202_ACCEPTED)
+async def resume_backfill(
+    job_id: int,
+    background_tasks: BackgroundTasks,
+    current_client: schemas.Client = Depends(deps.get_current_client),
+) -> Any:
+    """
+    Rerun a backfill job's unfinished units in the background
+    """
+    # Other clients' jobs are reported as missing
+    job = await kpi_backfill_service.get_job(job_id, client_id=current_client.id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Backfill job not found")
 
+    logger.info("KPI backfill resumed", job_id=job_id, client_id=current_client.id)
+    background_tasks.add_task(kpi_backfill_service.run_job, job_id)
 
-@router.get("/")
-async def get_report():
-    """Get KPI report"""
-    return {"report": "KPI data here"}
+    return job
 
 
 @router.get("/export")
 async def export_data():
     """Export data as CSV/JSON"""
-    return {"export": "Data export here"}
\ No newline at end of file
+    return {"export": "Data export here"}
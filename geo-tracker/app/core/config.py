@@ -48,6 +48,8 @@ class Settings(BaseSettings):
     POSTGRES_PORT: int = 5432
 
     DATABASE_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 10  # Pooled connections, enough for concurrent tenant sessions
+    DB_MAX_OVERFLOW: int = 5
 
     @property
     def sql_database_url(self) -> str:
@@ -79,6 +81,41 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
     OPENAI_MODEL: str = "text-embedding-ada-002"
 
+    # Embedding Batching
+    EMBEDDING_BATCH_SIZE: int = 256  # Max inputs per embeddings request
+    EMBEDDING_BATCH_MAX_TOKENS: int = 100000  # Token budget per embeddings request
+    EMBEDDING_MAX_INPUT_TOKENS: int = 8000  # Per-input limit, longer texts are chunked
+    EMBEDDING_DIMENSIONS: int = 1536  # Vector size of the OpenAI embedding model
+    EMBEDDING_PROVIDER: str = "openai"  # openai or local (offline TF-IDF + SVD)
+    EMBEDDING_MICROBATCH_WAIT_MS: float = 5.0  # How long concurrent requests are gathered
+    EMBEDDING_MICROBATCH_CONCURRENCY: int = 4  # Max coalesced provider calls in flight
+
+    # Local Embeddings (EMBEDDING_PROVIDER=local)
+    LOCAL_EMBEDDING_DIR: str = "data/embeddings/local"  # Fitted model versions
+    LOCAL_EMBEDDING_DIMENSIONS: int = 256  # SVD components per vector
+    LOCAL_EMBEDDING_FEATURES: int = 2 ** 16  # Hashed word and bigram buckets
+    LOCAL_EMBEDDING_WORKERS: int = 2  # Worker processes for fitting and embedding
+
+    # Similarity
+    SIMILARITY_TOP_K: int = 50  # Max embedding matches kept per answer
+    SIMILARITY_INDEX_BACKEND: str = "matrix"  # matrix (in-process NumPy), pgvector or ivf
+    SIMILARITY_MATRIX_DTYPE: str = "float32"  # float32 (in memory), float16 or int8 (memory-mapped files)
+    SIMILARITY_STAGES: str = "embedding,lsh"  # Candidate stages in order: bm25 (prefilter, first), embedding, lsh
+    BM25_TOP_N: int = 200  # Posts the bm25 prefilter passes to later stages
+    PASSAGE_MAX_WORDS: int = 120  # Words per post passage
+    PASSAGE_OVERLAP_WORDS: int = 20  # Words shared by consecutive passages
+    SIMILARITY_BATCH_ANSWERS: int = 500  # Answers paged and embedded per bulk chunk
+    SIMILARITY_BATCH_MEMORY_MB: int = 256  # Cap on each answers x posts score block
+
+    # Vector Index Files (IVF indexes and quantized matrices)
+    VECTOR_INDEX_DIR: str = "data/vector_index"  # Per-client index files
+    IVF_NLIST: int = 64  # k-means clusters per client index
+    IVF_NPROBE: int = 8  # Clusters scanned per query
+
+    # pgvector HNSW search (one index shared by all clients and models)
+    PGVECTOR_EF_SEARCH: int = 200  # Candidates the HNSW scan visits, raised to top_k if lower
+    PGVECTOR_ITERATIVE_SCAN: str = ""  # relaxed_order or strict_order, needs pgvector >= 0.8
+
     # AI Engine API Keys
     PERPLEXITY_API_KEY: Optional[str] = None
     BRAVE_API_KEY: Optional[str] = None
@@ -96,6 +133,9 @@ class Settings(BaseSettings):
     # Batch Processing
     BATCH_SIZE: int = 100
     MAX_WORKERS: int = 4
+    KPI_CONCURRENCY: int = 4  # Clients whose metrics are computed at once, one session each
+    KPI_BACKFILL_CHUNK_SIZE: int = 500  # (client, day) units loaded and run per round
+    KPI_BACKFILL_MAX_ATTEMPTS: int = 3  # Runs of a job that may retry a failing unit
 
     # Monitoring
     PROMETHEUS_PORT: int = 9090
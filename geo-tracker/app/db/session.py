@@ -4,7 +4,6 @@ Database session configuration
 
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 from sqlalchemy import text
 
 from app.core.config import settings
@@ -14,9 +13,11 @@ database_url = settings.sql_database_url
 if database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
+# Pooled, so concurrent tenant-scoped sessions each get their own connection
 engine = create_async_engine(
     database_url.replace("postgresql://", "postgresql+asyncpg://"),
-    poolclass=StaticPool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
     echo=settings.DEBUG,
     future=True,
 )
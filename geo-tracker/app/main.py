@@ -28,9 +28,14 @@ async def lifespan(app: FastAPI):
     """
     logger.info("Starting KHM GEO Tracker", version=settings.VERSION)
 
-    # Create database tables
+    # Create database tables (the pgvector table needs the extension installed)
+    tables = [
+        table for table in Base.metadata.sorted_tables
+        if table.name != "post_embedding_vectors"
+        or settings.SIMILARITY_INDEX_BACKEND == "pgvector"
+    ]
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(Base.metadata.create_all, tables=tables)
 
     logger.info("Database tables created/verified")
 
@@ -76,8 +81,14 @@ def create_application() -> FastAPI:
 
     @app.get("/health")
     async def health_check():
-        """Health check endpoint"""
-        return {"status": "healthy", "version": settings.VERSION}
+        """Health check endpoint, with similarity pipeline stage timings"""
+        from app.services.similarity_service import similarity_engine
+
+        return {
+            "status": "healthy",
+            "version": settings.VERSION,
+            "similarity_stages": similarity_engine.stage_timings(),
+        }
 
     @app.exception_handler(Exception)
     async def global_exception_handler(request: Request, exc: Exception):
@@ -4,9 +4,12 @@ SQLAlchemy database models for GEO Tracker
 
 from datetime import datetime
 from typing import Dict, Any, Optional
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, Float, JSON, ForeignKey, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
+from pgvector.sqlalchemy import Vector
+
+from app.core.config import settings
 
 Base = declarative_base()
 
@@ -100,6 +103,7 @@ class Answer(Base):
     normalized_response = Column(Text, nullable=True)
     response_hash = Column(String(64), nullable=False, index=True)  # SHA-256 hash
     metadata_json = Column(JSON, nullable=True)  # Engine-specific metadata
+    similarity_corpus_version = Column(String(64), nullable=True)  # Corpus its similarities were scored against
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -110,6 +114,7 @@ class Answer(Base):
     __table_args__ = (
         Index('idx_answer_run_id', 'run_id'),
         Index('idx_answer_hash', 'response_hash'),
+        Index('idx_answer_hash_version', 'response_hash', 'similarity_corpus_version'),
     )
 
 
@@ -186,6 +191,50 @@ class Similarity(Base):
     )
 
 
+class AnswerEmbedding(Base):
+    """
+    Stored answer embeddings, reused when answers are re-scored
+    """
+    __tablename__ = "answer_embeddings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    answer_id = Column(Integer, ForeignKey("answers.id", ondelete="CASCADE"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of the answer text
+    model = Column(String(100), nullable=False)  # Embedding model name
+    embedding = Column(JSON, nullable=False)  # List of floats
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_answer_embedding_key', 'answer_id', 'model', unique=True),
+        Index('idx_answer_embedding_client_model', 'client_id', 'model'),
+    )
+
+
+class AnswerFeature(Base):
+    """
+    Per-answer KPI inputs, computed when the answer is stored
+    """
+    __tablename__ = "answer_features"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    answer_id = Column(Integer, ForeignKey("answers.id", ondelete="CASCADE"), nullable=False)
+    cites_client = Column(Boolean, nullable=False, default=False)  # Client domain among the citations
+    cited_domains = Column(Integer, nullable=False, default=0)  # Distinct cited domains
+    citation_count = Column(Integer, nullable=False, default=0)
+    mentions_client = Column(Boolean, nullable=False, default=False)  # Client name in the answer text
+    mentions_entity = Column(Boolean, nullable=False, default=False)  # A client WordPress entity name in the text
+    best_similarity = Column(Float, nullable=True)  # Highest similarity score to a client post
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_answer_feature_answer', 'answer_id', unique=True),
+        Index('idx_answer_feature_client', 'client_id'),
+    )
+
+
 class Metric(Base):
     """
     Aggregated KPIs per client/topic/engine/day
@@ -203,7 +252,7 @@ class Metric(Base):
     extraction_rate = Column(Float, default=0.0)  # % with text overlap ≥ threshold
     presence_rate = Column(Float, default=0.0)   # % mentioning client/entity by name
     co_visibility_rate = Column(Float, default=0.0)  # % mentioning both client and publisher
-    visibility_index = Column(Float, default=0.0)   # Weighted aggregate KPI
+    visibility_index = Column(Float, default=0.0)   # Weighted aggregate KPI, default weights
 
     # Supporting data
     total_queries = Column(Integer, default=0)
@@ -211,6 +260,13 @@ class Metric(Base):
     total_citations = Column(Integer, default=0)
     client_mentions = Column(Integer, default=0)
 
+    # Rate numerators and denominator, so rates can be updated and re-aggregated exactly
+    answer_count = Column(Integer, default=0)  # Runs with an answer
+    citing_answers = Column(Integer, default=0)
+    extracted_answers = Column(Integer, default=0)
+    present_answers = Column(Integer, default=0)
+    co_visible_answers = Column(Integer, default=0)
+
     metadata_json = Column(JSON, nullable=True)  # Additional metric data
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -219,12 +275,106 @@ class Metric(Base):
     client = relationship("Client")
 
     __table_args__ = (
+        Index('idx_metric_key', 'client_id', 'query_id', 'engine', 'date', unique=True),
         Index('idx_metric_client_date', 'client_id', 'date'),
         Index('idx_metric_engine_date', 'engine', 'date'),
         Index('idx_metric_query_date', 'query_id', 'date'),
     )
 
 
+class MetricRollup(Base):
+    """
+    Daily metric counts summed per week or month, engine and query topic
+    """
+    __tablename__ = "metric_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    period = Column(String(10), nullable=False)  # week, month
+    period_start = Column(DateTime, nullable=False)  # Monday or first of the month
+    engine = Column(String(50), nullable=False)
+    topic = Column(String(255), nullable=False)
+
+    # Summed counts; rates are derived from them when read
+    total_queries = Column(Integer, default=0)
+    successful_runs = Column(Integer, default=0)
+    answer_count = Column(Integer, default=0)
+    citing_answers = Column(Integer, default=0)
+    extracted_answers = Column(Integer, default=0)
+    present_answers = Column(Integer, default=0)
+    co_visible_answers = Column(Integer, default=0)
+    total_citations = Column(Integer, default=0)
+    client_mentions = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_metric_rollup_key', 'client_id', 'period', 'period_start', 'engine', 'topic', unique=True),
+    )
+
+
+class KpiWeightProfile(Base):
+    """
+    A client's visibility index weights, applied when metrics are read
+    """
+    __tablename__ = "kpi_weight_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False, unique=True)
+    version = Column(Integer, nullable=False, default=1)  # Bumped on every change
+    inclusion = Column(Float, nullable=False)
+    extraction = Column(Float, nullable=False)
+    presence = Column(Float, nullable=False)
+    co_visibility = Column(Float, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class KpiBackfillJob(Base):
+    """
+    Recomputation of daily metrics over a date range and set of clients
+    """
+    __tablename__ = "kpi_backfill_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    date_from = Column(DateTime, nullable=False)
+    date_to = Column(DateTime, nullable=False)
+    client_ids = Column(JSON, nullable=False)
+    status = Column(String(50), default="pending")  # pending, running, completed, failed
+    error_message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    units = relationship("KpiBackfillUnit", back_populates="job")
+
+
+class KpiBackfillUnit(Base):
+    """
+    Checkpoint of one client's day within a backfill job
+    """
+    __tablename__ = "kpi_backfill_units"
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(Integer, ForeignKey("kpi_backfill_jobs.id", ondelete="CASCADE"), nullable=False)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    date = Column(DateTime, nullable=False)
+    status = Column(String(50), default="pending")  # pending, completed, failed
+    attempts = Column(Integer, default=0)
+    metrics_count = Column(Integer, nullable=True)
+    error_message = Column(Text, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    job = relationship("KpiBackfillJob", back_populates="units")
+
+    __table_args__ = (
+        Index('idx_backfill_unit_key', 'job_id', 'client_id', 'date', unique=True),
+        Index('idx_backfill_unit_status', 'job_id', 'status'),
+    )
+
+
 class Post(Base):
     """
     WordPress posts synced from clients
@@ -263,6 +413,111 @@ class Post(Base):
     )
 
 
+class PostEmbedding(Base):
+    """
+    Stored post embeddings, keyed by post, content hash and embedding model
+    """
+    __tablename__ = "post_embeddings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    post_id = Column(String(100), ForeignKey("posts.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of post content
+    model = Column(String(100), nullable=False)  # Embedding model name
+    embedding = Column(JSON, nullable=False)  # List of floats
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    post = relationship("Post")
+
+    __table_args__ = (
+        Index('idx_post_embedding_key', 'post_id', 'content_hash', 'model', unique=True),
+        Index('idx_post_embedding_client_model', 'client_id', 'model'),
+    )
+
+
+class PostFingerprint(Base):
+    """
+    Hashed n-gram shingles, MinHash signature and term counts of a post, for lexical matching
+    """
+    __tablename__ = "post_fingerprints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    post_id = Column(String(100), ForeignKey("posts.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of post content
+    shingles = Column(LargeBinary, nullable=False)  # Sorted uint64 shingle hashes
+    minhash = Column(LargeBinary, nullable=False)  # uint32 signature bytes
+    terms = Column(LargeBinary, nullable=False)  # Sorted uint64 term hashes
+    term_counts = Column(LargeBinary, nullable=False)  # uint32 count of each term
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    post = relationship("Post")
+
+    __table_args__ = (
+        Index('idx_post_fingerprint_post', 'post_id', unique=True),
+        Index('idx_post_fingerprint_client', 'client_id'),
+    )
+
+
+class PostPassage(Base):
+    """
+    Embedded and shingled passage of a post, with its span in the post content
+    """
+    __tablename__ = "post_passages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    post_id = Column(String(100), ForeignKey("posts.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of post content
+    model = Column(String(100), nullable=False)  # Embedding model name
+    passage_index = Column(Integer, nullable=False)  # Order within the post
+    start_offset = Column(Integer, nullable=False)  # Character span in post content
+    end_offset = Column(Integer, nullable=False)
+    embedding = Column(JSON, nullable=False)  # List of floats
+    shingles = Column(LargeBinary, nullable=False)  # Sorted uint64 shingle hashes
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    post = relationship("Post")
+
+    __table_args__ = (
+        Index('idx_post_passage_key', 'post_id', 'model', 'passage_index', unique=True),
+        Index('idx_post_passage_client_model', 'client_id', 'model'),
+    )
+
+
+class PostEmbeddingVector(Base):
+    """
+    pgvector copy of post embeddings for approximate nearest neighbour search
+
+    Only created when SIMILARITY_INDEX_BACKEND is "pgvector" (needs the extension).
+    """
+    __tablename__ = "post_embedding_vectors"
+
+    post_embedding_id = Column(
+        Integer, ForeignKey("post_embeddings.id", ondelete="CASCADE"), primary_key=True
+    )
+    client_id = Column(Integer, ForeignKey("clients.id"), nullable=False)
+    post_id = Column(String(100), nullable=False)
+    model = Column(String(100), nullable=False)
+    embedding = Column(Vector(settings.EMBEDDING_DIMENSIONS), nullable=False)
+
+    # Relationships
+    post_embedding = relationship("PostEmbedding")
+
+    __table_args__ = (
+        Index('idx_post_vector_client_model', 'client_id', 'model'),
+        Index(
+            'idx_post_vector_hnsw', 'embedding',
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'vector_cosine_ops'},
+        ),
+    )
+
+
 class WordPressEntity(Base):
     """
     Entities extracted from WordPress content (people, organizations, locations, etc.)
@@ -2,7 +2,7 @@
 Pydantic schemas for API request/response models
 """
 
-from datetime import datetime
+from datetime import datetime, date
 from typing import List, Optional, Dict, Any
 from pydantic import BaseModel, Field
 
@@ -152,9 +152,61 @@ class ReportResponse(BaseModel):
     engine_breakdown: Dict[str, KPIMetrics]
     topic_breakdown: Dict[str, KPIMetrics]
     top_citations: List[Dict[str, Any]]
+    weights: Dict[str, float] = {}  # Visibility index weights applied
+    weights_version: int = 0  # Client's weight profile version, 0 for the defaults
     generated_at: datetime
 
 
+# KPI backfill schemas
+class KpiBackfillRequest(BaseModel):
+    date_from: date
+    date_to: date
+
+
+class KpiBackfillJob(BaseModel):
+    id: int
+    status: str
+    date_from: datetime
+    date_to: datetime
+    client_ids: List[int]
+    units: Dict[str, int] = {}  # Unit count per status
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+
+# KPI weight profile schemas
+class KpiWeightsUpdate(BaseModel):
+    inclusion: Optional[float] = Field(None, ge=0.0)
+    extraction: Optional[float] = Field(None, ge=0.0)
+    presence: Optional[float] = Field(None, ge=0.0)
+    co_visibility: Optional[float] = Field(None, ge=0.0)
+
+
+class KpiWeightProfile(BaseModel):
+    version: int  # 0 while the client uses the defaults
+    weights: Dict[str, float]
+
+
+# What-if KPI schemas
+class WhatIfRequest(BaseModel):
+    date_from: date
+    date_to: date
+    group_by: List[str] = ["engine"]  # Any of date, engine, topic, query_id
+    extraction_threshold: Optional[float] = Field(None, ge=0.0, le=1.0)
+    weights: Dict[str, float] = {}  # Overrides of inclusion, extraction, presence, co_visibility
+    refresh: bool = False  # Reload the cached extract
+
+
+class WhatIfResponse(BaseModel):
+    client_id: int
+    runs: int
+    extraction_threshold: float
+    weights: Dict[str, float]
+    rows: List[Dict[str, Any]]
+
+
 # Token schemas
 class Token(BaseModel):
     access_token: str
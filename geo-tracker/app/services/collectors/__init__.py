@@ -34,5 +34,4 @@ __all__ = [
     "PerplexityCollector",
     "BraveCollector",
     "CollectorFactory",
-]</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/collectors/__init__.py
\ No newline at end of file
+]
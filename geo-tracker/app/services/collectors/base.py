@@ -189,5 +189,4 @@ class CollectorResult:
             "entities": self.entities,
             "metadata": self.metadata,
             "timestamp": self.timestamp.isoformat(),
-        }</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/collectors/base.py
\ No newline at end of file
+        }
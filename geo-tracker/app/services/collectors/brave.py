@@ -172,5 +172,4 @@ class BraveCollector(BaseCollector):
             parsed = urlparse(url)
             return parsed.netloc
         except:
-            return url</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/collectors/brave.py
\ No newline at end of file
+            return url
@@ -162,5 +162,4 @@ class PerplexityCollector(BaseCollector):
             parsed = urlparse(url)
             return parsed.netloc
         except:
-            return url</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/collectors/perplexity.py
\ No newline at end of file
+            return url
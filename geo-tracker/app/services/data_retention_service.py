@@ -51,6 +51,7 @@ class DataRetentionService:
             "entities_deleted": 0,
             "similarities_deleted": 0,
             "metrics_deleted": 0,
+            "rollups_deleted": 0,
             "errors": 0,
         }
 
@@ -121,6 +122,7 @@ class DataRetentionService:
             "entities_deleted": 0,
             "similarities_deleted": 0,
             "metrics_deleted": 0,
+            "rollups_deleted": 0,
         }
 
         cutoff_date = datetime.utcnow() - timedelta(hours=self.safety_buffer_hours)
@@ -192,6 +194,13 @@ class DataRetentionService:
                 )
                 stats["metrics_deleted"] = metrics_result.rowcount
 
+                rollups_result = await session.execute(
+                    delete(models.MetricRollup)
+                    .where(models.MetricRollup.client_id == client_id)
+                    .where(models.MetricRollup.period_start < kpi_cutoff)
+                )
+                stats["rollups_deleted"] = rollups_result.rowcount
+
                 # Commit the changes
                 await session.commit()
 
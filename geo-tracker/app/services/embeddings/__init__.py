@@ -0,0 +1,41 @@
+"""
+Embedding providers and helpers for the similarity engine
+"""
+
+from .base import BaseEmbeddingProvider
+from .batching import EmbeddingBatcher, estimate_tokens, split_text
+from .local import LocalEmbeddingProvider
+from .microbatcher import EmbeddingMicroBatcher
+from .openai_provider import OpenAIEmbeddingProvider
+
+
+class EmbeddingProviderFactory:
+    """
+    Factory for creating embedding providers
+    """
+
+    @staticmethod
+    def create_provider(provider: str) -> BaseEmbeddingProvider:
+        """
+        Create the embedding provider with the given name
+        """
+        provider = provider.lower()
+
+        if provider == "openai":
+            return OpenAIEmbeddingProvider()
+        elif provider == "local":
+            return LocalEmbeddingProvider()
+        else:
+            raise ValueError(f"Unsupported embedding provider: {provider}")
+
+
+__all__ = [
+    "BaseEmbeddingProvider",
+    "EmbeddingBatcher",
+    "EmbeddingMicroBatcher",
+    "EmbeddingProviderFactory",
+    "LocalEmbeddingProvider",
+    "OpenAIEmbeddingProvider",
+    "estimate_tokens",
+    "split_text",
+]
@@ -0,0 +1,41 @@
+"""
+Base embedding provider class
+"""
+
+from abc import ABC, abstractmethod
+from typing import List
+
+
+class BaseEmbeddingProvider(ABC):
+    """
+    Abstract base class for embedding providers
+
+    Vectors from different models are not comparable, so every stored
+    embedding is keyed by the provider's model name.
+    """
+
+    @property
+    @abstractmethod
+    def model(self) -> str:
+        """Model name stored with every embedding"""
+
+    @property
+    @abstractmethod
+    def dimensions(self) -> int:
+        """Vector size of the model"""
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, returning one vector per text in order
+        """
+
+    def refresh(self) -> None:
+        """
+        Switch to the newest model version, for providers whose model can be refitted
+        """
+
+    async def close(self) -> None:
+        """
+        Release API clients or worker processes
+        """
@@ -0,0 +1,202 @@
+"""
+Token-aware batching for embedding requests
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+import structlog
+
+from app.core.config import settings
+
+logger = structlog.get_logger(__name__)
+
+# Conservative characters-per-token ratio, so estimates err on the high side
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate for a text (no tokenizer dependency)
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_text(text: str, max_tokens: int) -> List[str]:
+    """
+    Split text into chunks that each fit within max_tokens
+
+    Splits on whitespace where possible; single words longer than a chunk
+    are cut hard.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return [text]
+
+    chunks = []
+    current: List[str] = []
+    current_length = 0
+
+    for word in text.split():
+        while len(word) > max_chars:
+            if current:
+                chunks.append(" ".join(current))
+                current, current_length = [], 0
+            chunks.append(word[:max_chars])
+            word = word[max_chars:]
+
+        if current and current_length + len(word) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current, current_length = [], 0
+
+        current.append(word)
+        current_length += len(word) + 1
+
+    if current:
+        chunks.append(" ".join(current))
+
+    return chunks
+
+
+@dataclass
+class EmbeddingChunk:
+    """A piece of an input text, sent as one embeddings input"""
+    text_index: int
+    text: str
+    tokens: int
+
+
+class EmbeddingBatcher:
+    """
+    Packs many texts into as few embeddings requests as the provider allows
+
+    Texts over the per-input limit are split into chunks; chunk embeddings
+    are combined back into one vector per text (token-weighted mean).
+    """
+
+    def __init__(
+        self,
+        client,
+        model: str,
+        max_batch_size: Optional[int] = None,
+        max_batch_tokens: Optional[int] = None,
+        max_input_tokens: Optional[int] = None,
+    ):
+        self.client = client
+        self.model = model
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_batch_tokens = max_batch_tokens or settings.EMBEDDING_BATCH_MAX_TOKENS
+        self.max_input_tokens = max_input_tokens or settings.EMBEDDING_MAX_INPUT_TOKENS
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in packed batches, returning one vector per text in order
+        """
+        if not texts:
+            return []
+
+        chunks = self._chunk_texts(texts)
+        batches = self._pack(chunks)
+
+        chunk_vectors: List[List[float]] = []
+        for batch in batches:
+            chunk_vectors.extend(await self._embed_batch(batch))
+
+        logger.debug(
+            "Embedded texts in batches",
+            texts=len(texts),
+            chunks=len(chunks),
+            requests=len(batches),
+        )
+
+        return self._combine(len(texts), chunks, chunk_vectors)
+
+    def _chunk_texts(self, texts: List[str]) -> List[EmbeddingChunk]:
+        """
+        Split texts into provider-sized chunks
+        """
+        chunks = []
+        for index, text in enumerate(texts):
+            # Empty inputs are rejected by the API
+            pieces = split_text(text, self.max_input_tokens) if text.strip() else [" "]
+            for piece in pieces:
+                chunks.append(EmbeddingChunk(index, piece, estimate_tokens(piece)))
+        return chunks
+
+    def _pack(self, chunks: List[EmbeddingChunk]) -> List[List[EmbeddingChunk]]:
+        """
+        Greedily pack chunks into batches within size and token budgets
+        """
+        batches: List[List[EmbeddingChunk]] = []
+        current: List[EmbeddingChunk] = []
+        current_tokens = 0
+
+        for chunk in chunks:
+            if current and (
+                len(current) >= self.max_batch_size
+                or current_tokens + chunk.tokens > self.max_batch_tokens
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+
+            current.append(chunk)
+            current_tokens += chunk.tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    async def _embed_batch(self, batch: List[EmbeddingChunk]) -> List[List[float]]:
+        """
+        Send one embeddings request for a packed batch
+        """
+        try:
+            response = await self.client.embeddings.create(
+                input=[chunk.text for chunk in batch],
+                model=self.model
+            )
+
+            # Results carry their input index; don't rely on response order
+            data = sorted(response.data, key=lambda item: item.index)
+            return [item.embedding for item in data]
+
+        except Exception as e:
+            logger.error(
+                "Embedding batch request failed",
+                error=str(e),
+                batch_size=len(batch),
+                batch_tokens=sum(chunk.tokens for chunk in batch),
+            )
+            raise
+
+    @staticmethod
+    def _combine(
+        text_count: int,
+        chunks: List[EmbeddingChunk],
+        chunk_vectors: List[List[float]],
+    ) -> List[List[float]]:
+        """
+        Map chunk embeddings back to their texts
+        """
+        grouped: List[List[int]] = [[] for _ in range(text_count)]
+        for position, chunk in enumerate(chunks):
+            grouped[chunk.text_index].append(position)
+
+        vectors = []
+        for positions in grouped:
+            if len(positions) == 1:
+                vectors.append(chunk_vectors[positions[0]])
+                continue
+
+            matrix = np.asarray([chunk_vectors[p] for p in positions], dtype=np.float64)
+            weights = np.asarray([chunks[p].tokens for p in positions], dtype=np.float64)
+            combined = np.average(matrix, axis=0, weights=weights)
+
+            norm = np.linalg.norm(combined)
+            if norm > 0:
+                combined = combined / norm
+            vectors.append(combined.tolist())
+
+        return vectors
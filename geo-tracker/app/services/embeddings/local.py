@@ -0,0 +1,210 @@
+"""
+Local embedding provider: hashed n-grams, TF-IDF and truncated SVD
+
+No network calls, so latency does not depend on an external API. Fitting
+and embedding run in worker processes to keep the event loop free;
+workers memory-map the fitted arrays from disk.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+from app.core.config import settings
+from .base import BaseEmbeddingProvider
+
+logger = structlog.get_logger(__name__)
+
+CURRENT_FILE = "CURRENT"
+
+# Fitted arrays memory-mapped by this process, keyed by version directory
+_loaded: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _vectorizer(n_features: int):
+    from sklearn.feature_extraction.text import HashingVectorizer
+
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm=None,
+    )
+
+
+def _fit(texts: List[str], model_dir: str, dimensions: int, n_features: int) -> str:
+    """
+    Fit TF-IDF weights and SVD components and save them as a new version (worker)
+    """
+    from sklearn.decomposition import TruncatedSVD
+    from sklearn.feature_extraction.text import TfidfTransformer
+
+    tfidf = TfidfTransformer(sublinear_tf=True)
+    weighted = tfidf.fit_transform(_vectorizer(n_features).transform(texts))
+    svd = TruncatedSVD(n_components=dimensions, random_state=0).fit(weighted)
+
+    idf = tfidf.idf_.astype(np.float32)
+    # Small corpora yield fewer components; pad so vector size never changes
+    components = np.zeros((dimensions, n_features), dtype=np.float32)
+    components[:len(svd.components_)] = svd.components_
+
+    digest = hashlib.sha256(idf.tobytes())
+    digest.update(components.tobytes())
+    version = digest.hexdigest()[:16]
+
+    version_dir = Path(model_dir) / version
+    version_dir.mkdir(parents=True, exist_ok=True)
+    np.save(version_dir / "idf.npy", idf)
+    np.save(version_dir / "components.npy", components)
+
+    # Atomic switch; processes started later load the new version
+    pointer = Path(model_dir) / f"{CURRENT_FILE}.{os.getpid()}"
+    pointer.write_text(version)
+    os.replace(pointer, Path(model_dir) / CURRENT_FILE)
+
+    return version
+
+
+def _load(version_dir: str) -> Tuple[np.ndarray, np.ndarray]:
+    if version_dir not in _loaded:
+        _loaded[version_dir] = (
+            np.load(Path(version_dir) / "idf.npy", mmap_mode="r"),
+            np.load(Path(version_dir) / "components.npy", mmap_mode="r"),
+        )
+    return _loaded[version_dir]
+
+
+def _transform(texts: List[str], idf: np.ndarray, components: np.ndarray) -> np.ndarray:
+    """
+    Project texts onto the fitted components, one unit vector per text
+
+    Same result as TfidfTransformer(sublinear_tf=True) followed by
+    TruncatedSVD.transform, without unpickling sklearn estimators.
+    """
+    from sklearn.preprocessing import normalize
+
+    counts = _vectorizer(idf.shape[0]).transform(texts).tocsr().astype(np.float32)
+    counts.data = 1.0 + np.log(counts.data)
+    weighted = normalize(counts.multiply(idf).tocsr())
+
+    return normalize(np.asarray(weighted @ components.T, dtype=np.float32))
+
+
+def _embed_chunk(version_dir: str, texts: List[str]) -> np.ndarray:
+    """Embed one chunk of texts (worker)"""
+    idf, components = _load(version_dir)
+    return _transform(texts, idf, components)
+
+
+class LocalEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Latent semantic analysis embeddings computed in a process pool
+
+    The model must be fitted once on a representative corpus; its version
+    is part of the model name, so refitting re-embeds stored content.
+    Providers in other processes pick up a new version from the CURRENT
+    pointer when refreshed between scoring passes.
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[str] = None,
+        dimensions: Optional[int] = None,
+        n_features: Optional[int] = None,
+        workers: Optional[int] = None,
+    ):
+        self.model_dir = Path(model_dir or settings.LOCAL_EMBEDDING_DIR)
+        self._dimensions = dimensions or settings.LOCAL_EMBEDDING_DIMENSIONS
+        self.n_features = n_features or settings.LOCAL_EMBEDDING_FEATURES
+        self.workers = workers or settings.LOCAL_EMBEDDING_WORKERS
+        self.chunk_size = settings.EMBEDDING_BATCH_SIZE
+        self.version: Optional[str] = None
+        self._pointer_mtime: Optional[int] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.refresh()
+
+    @property
+    def model(self) -> str:
+        return f"local-lsa-{self.version or 'unfitted'}"
+
+    @property
+    def dimensions(self) -> int:
+        return self._dimensions
+
+    @staticmethod
+    def current_version(model_dir: Path) -> Optional[str]:
+        """Version the CURRENT pointer names, if a model has been fitted"""
+        try:
+            return (Path(model_dir) / CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    def refresh(self) -> None:
+        """Follow the CURRENT pointer when another process fits a new version"""
+        try:
+            mtime = (self.model_dir / CURRENT_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if mtime != self._pointer_mtime:
+            self._pointer_mtime = mtime
+            self.version = self.current_version(self.model_dir)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process that runs an event loop and threads is unsafe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._pool
+
+    async def fit(self, texts: List[str]) -> str:
+        """
+        Fit the model on a corpus and make it the current version
+        """
+        texts = [text for text in texts if text and text.strip()]
+        if not texts:
+            raise ValueError("Cannot fit local embeddings on an empty corpus")
+
+        loop = asyncio.get_running_loop()
+        self.version = await loop.run_in_executor(
+            self._executor(), _fit, texts, str(self.model_dir), self._dimensions, self.n_features
+        )
+
+        logger.info(
+            "Local embedding model fitted",
+            model=self.model,
+            texts=len(texts),
+            dimensions=self._dimensions,
+        )
+        return self.version
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self.version is None:
+            raise RuntimeError("Local embedding model is not fitted")
+
+        loop = asyncio.get_running_loop()
+        version_dir = str(self.model_dir / self.version)
+        blocks = await asyncio.gather(*(
+            loop.run_in_executor(
+                self._executor(), _embed_chunk, version_dir, texts[start:start + self.chunk_size]
+            )
+            for start in range(0, len(texts), self.chunk_size)
+        ))
+
+        return [vector for block in blocks for vector in block.tolist()]
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
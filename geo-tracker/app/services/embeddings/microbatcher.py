@@ -0,0 +1,163 @@
+"""
+Coalescing of concurrent embedding requests into shared provider calls
+"""
+
+import asyncio
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+import structlog
+
+from app.core.config import settings
+from .base import BaseEmbeddingProvider
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class PendingRequest:
+    """One caller's texts, waiting to be sent with others"""
+    texts: List[str]
+    future: asyncio.Future
+
+
+class EmbeddingMicroBatcher:
+    """
+    Queue in front of an embedding provider shared by concurrent callers
+
+    Requests arriving within max_wait_ms of each other are sent as one
+    provider call, flushed early once max_batch_texts are queued. At most
+    max_concurrency calls are in flight; further batches wait their turn.
+    A caller cancelled while queued is dropped from its batch, and one
+    cancelled after dispatch simply does not receive its vectors.
+    """
+
+    def __init__(
+        self,
+        provider: BaseEmbeddingProvider,
+        max_wait_ms: Optional[float] = None,
+        max_batch_texts: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.provider = provider
+        self.max_wait = (
+            settings.EMBEDDING_MICROBATCH_WAIT_MS if max_wait_ms is None else max_wait_ms
+        ) / 1000
+        self.max_batch_texts = max_batch_texts or settings.EMBEDDING_BATCH_SIZE
+        self.max_concurrency = max_concurrency or settings.EMBEDDING_MICROBATCH_CONCURRENCY
+
+        # Queue state belongs to one event loop and is reset if another one calls
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[PendingRequest] = []
+        self._pending_texts = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts together with other callers' queued texts
+        """
+        if not texts:
+            return []
+
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._reset(loop)
+
+        request = PendingRequest(list(texts), loop.create_future())
+        self._pending.append(request)
+        self._pending_texts += len(request.texts)
+
+        if self._pending_texts >= self.max_batch_texts:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        try:
+            return await request.future
+        except asyncio.CancelledError:
+            if request in self._pending:
+                self._pending.remove(request)
+                self._pending_texts -= len(request.texts)
+            raise
+
+    async def flush(self) -> None:
+        """
+        Send everything queued now and wait for in-flight calls to finish
+        """
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _reset(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._pending = []
+        self._pending_texts = 0
+        self._timer = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = set()
+
+    def _flush(self) -> None:
+        """
+        Split the queue into batches of at most max_batch_texts and dispatch them
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        pending = [request for request in self._pending if not request.future.done()]
+        self._pending = []
+        self._pending_texts = 0
+
+        batch: List[PendingRequest] = []
+        batch_texts = 0
+        for request in pending:
+            # A single request larger than the limit goes alone
+            if batch and batch_texts + len(request.texts) > self.max_batch_texts:
+                self._dispatch(batch)
+                batch, batch_texts = [], 0
+            batch.append(request)
+            batch_texts += len(request.texts)
+
+        if batch:
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[PendingRequest]) -> None:
+        task = self._loop.create_task(self._embed_batch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[PendingRequest]) -> None:
+        """
+        Make one provider call for a batch and hand each caller its vectors
+        """
+        async with self._semaphore:
+            # Callers may have been cancelled while waiting for a slot
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                return
+
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = await self.provider.embed(texts)
+            except Exception as e:
+                logger.error(
+                    "Micro-batched embedding request failed",
+                    error=str(e),
+                    callers=len(batch),
+                    texts=len(texts),
+                )
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                return
+
+        logger.debug("Coalesced embedding requests", callers=len(batch), texts=len(texts))
+
+        offset = 0
+        for request in batch:
+            end = offset + len(request.texts)
+            if not request.future.done():
+                request.future.set_result(vectors[offset:end])
+            offset = end
@@ -0,0 +1,52 @@
+"""
+OpenAI embeddings API provider
+"""
+
+from typing import List, Optional
+
+from openai import AsyncOpenAI
+
+from app.core.config import settings
+from .base import BaseEmbeddingProvider
+from .batching import EmbeddingBatcher
+
+
+class OpenAIEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Embeddings from the OpenAI API, sent in token-aware batches
+    """
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.api_key = api_key or settings.OPENAI_API_KEY
+        self._model = model or settings.OPENAI_MODEL or "text-embedding-3-small"
+        self._client: Optional[AsyncOpenAI] = None
+        self._batcher: Optional[EmbeddingBatcher] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """API client, created on first use so idle providers hold no connections"""
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=self.api_key)
+        return self._client
+
+    @property
+    def batcher(self) -> EmbeddingBatcher:
+        if self._batcher is None:
+            self._batcher = EmbeddingBatcher(self.client, self._model)
+        return self._batcher
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    @property
+    def dimensions(self) -> int:
+        return settings.EMBEDDING_DIMENSIONS
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        return await self.batcher.embed(texts)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = self._batcher = None
@@ -0,0 +1,347 @@
+"""
+KPI backfill service: recomputes historical daily metrics in checkpointed units
+
+Run from the command line with
+    python -m app.services.kpi_backfill_service --from 2024-01-01 --to 2024-12-31
+or resume an interrupted job with --resume JOB_ID.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, date, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import select, insert, update, func
+import structlog
+
+from app import models
+from app.core.config import settings
+from app.services.kpi_service import kpi_service
+
+logger = structlog.get_logger(__name__)
+
+
+class KpiBackfillService:
+    """
+    Service for recomputing daily metrics over date ranges and sets of clients
+
+    A job is split into (client, day) units. Each unit replaces one
+    client's day in that client's tenant-scoped session and marks itself
+    completed in the same transaction, so rerunning a job after a crash or
+    failures picks up exactly the units that did not commit. Units are
+    loaded in chunks and run with bounded parallelism; week and month
+    rollups are refreshed once per client at the end.
+    """
+
+    def __init__(self):
+        self.chunk_size = settings.KPI_BACKFILL_CHUNK_SIZE
+        self.max_attempts = settings.KPI_BACKFILL_MAX_ATTEMPTS
+
+    async def create_job(
+        self,
+        date_from: date,
+        date_to: date,
+        client_ids: Optional[List[int]] = None,
+        session_factory: Optional[Callable[[Optional[int]], Any]] = None,
+    ) -> int:
+        """
+        Record a backfill job and its pending units, returning the job id
+        """
+        if date_from > date_to:
+            raise ValueError("date_from must not be after date_to")
+
+        session_factory = self._session_factory(session_factory)
+        if client_ids is None:
+            client_ids = await kpi_service._active_client_ids()
+        client_ids = sorted(set(client_ids))
+        days = self._days(date_from, date_to)
+
+        async with session_factory(None) as db:
+            job = models.KpiBackfillJob(
+                date_from=kpi_service._day_start(date_from),
+                date_to=kpi_service._day_start(date_to),
+                client_ids=client_ids,
+                status="pending",
+            )
+            db.add(job)
+            await db.flush()
+            job_id = job.id
+
+            # Day-major, so each chunk spreads across clients
+            if client_ids:
+                await db.execute(insert(models.KpiBackfillUnit), [
+                    {
+                        "job_id": job_id,
+                        "client_id": client_id,
+                        "date": kpi_service._day_start(day),
+                        "status": "pending",
+                        "attempts": 0,
+                    }
+                    for day in days
+                    for client_id in client_ids
+                ])
+
+        logger.info(
+            "KPI backfill job created",
+            job_id=job_id,
+            date_from=date_from,
+            date_to=date_to,
+            clients=len(client_ids),
+            units=len(days) * len(client_ids)
+        )
+
+        return job_id
+
+    async def run_job(
+        self,
+        job_id: int,
+        concurrency: Optional[int] = None,
+        session_factory: Optional[Callable[[Optional[int]], Any]] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run or resume a job's unfinished units, then refresh the clients' rollups
+
+        Completed units are skipped and failed ones are retried until they
+        have been attempted max_attempts times. progress, if given, is
+        called with (finished, total) after each chunk.
+        """
+        session_factory = self._session_factory(session_factory)
+        concurrency = concurrency or settings.KPI_CONCURRENCY
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with session_factory(None) as db:
+            job = await db.get(models.KpiBackfillJob, job_id)
+            if job is None:
+                raise ValueError(f"Unknown backfill job: {job_id}")
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            job.error_message = None
+            client_ids = list(job.client_ids)
+            days = self._days(job.date_from.date(), job.date_to.date())
+
+            result = await db.execute(
+                select(func.count(models.KpiBackfillUnit.id)).where(
+                    models.KpiBackfillUnit.job_id == job_id,
+                    models.KpiBackfillUnit.status != "completed",
+                    models.KpiBackfillUnit.attempts < self.max_attempts
+                )
+            )
+            total = result.scalar()
+
+        summary: Dict[str, Any] = {
+            "job_id": job_id,
+            "units": total,
+            "succeeded": 0,
+            "failed": 0,
+            "metrics": 0,
+        }
+        started = time.perf_counter()
+
+        logger.info("Running KPI backfill job", job_id=job_id, units=total, concurrency=concurrency)
+
+        async def run_unit(unit) -> None:
+            async with semaphore:
+                try:
+                    summary["metrics"] += await self._run_unit(session_factory, unit)
+                    summary["succeeded"] += 1
+
+                except Exception as e:
+                    logger.error(
+                        "KPI backfill unit failed",
+                        job_id=job_id,
+                        client_id=unit.client_id,
+                        date=unit.date,
+                        error=str(e)
+                    )
+                    summary["failed"] += 1
+                    await self._record_failure(session_factory, unit, str(e))
+
+        last_id = 0
+        while True:
+            # Keyset pages, so a unit failing in this run is not retried until the next
+            async with session_factory(None) as db:
+                result = await db.execute(
+                    select(
+                        models.KpiBackfillUnit.id,
+                        models.KpiBackfillUnit.client_id,
+                        models.KpiBackfillUnit.date,
+                    ).where(
+                        models.KpiBackfillUnit.job_id == job_id,
+                        models.KpiBackfillUnit.status != "completed",
+                        models.KpiBackfillUnit.attempts < self.max_attempts,
+                        models.KpiBackfillUnit.id > last_id
+                    ).order_by(models.KpiBackfillUnit.id).limit(self.chunk_size)
+                )
+                units = result.all()
+
+            if not units:
+                break
+            last_id = units[-1].id
+
+            await asyncio.gather(*(run_unit(unit) for unit in units))
+
+            finished = summary["succeeded"] + summary["failed"]
+            logger.info(
+                "KPI backfill progress",
+                job_id=job_id,
+                finished=finished,
+                total=total,
+                failed=summary["failed"]
+            )
+            if progress is not None:
+                progress(finished, total)
+
+        async def refresh_client(client_id: int) -> None:
+            async with semaphore:
+                async with session_factory(client_id) as db:
+                    await kpi_service.refresh_rollups(db, days, client_id)
+
+        await asyncio.gather(*(refresh_client(client_id) for client_id in client_ids))
+
+        async with session_factory(None) as db:
+            counts = await self._unit_counts(db, job_id)
+            remaining = sum(count for status, count in counts.items() if status != "completed")
+
+            job = await db.get(models.KpiBackfillJob, job_id)
+            job.status = "failed" if remaining else "completed"
+            job.error_message = f"{remaining} units not completed" if remaining else None
+            job.completed_at = datetime.utcnow()
+
+        summary["remaining"] = remaining
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info("KPI backfill job finished", **summary)
+
+        return summary
+
+    async def get_job(
+        self,
+        job_id: int,
+        session_factory: Optional[Callable[[Optional[int]], Any]] = None,
+        client_id: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        A job with its unit counts per status, or None if it does not exist
+
+        With client_id, only a job covering just that client is returned.
+        """
+        session_factory = self._session_factory(session_factory)
+
+        async with session_factory(None) as db:
+            job = await db.get(models.KpiBackfillJob, job_id)
+            if job is None:
+                return None
+            if client_id is not None and job.client_ids != [client_id]:
+                return None
+
+            return {
+                "id": job.id,
+                "status": job.status,
+                "date_from": job.date_from,
+                "date_to": job.date_to,
+                "client_ids": job.client_ids,
+                "units": await self._unit_counts(db, job_id),
+                "error_message": job.error_message,
+                "created_at": job.created_at,
+                "started_at": job.started_at,
+                "completed_at": job.completed_at,
+            }
+
+    async def _run_unit(self, session_factory: Callable[[Optional[int]], Any], unit) -> int:
+        """
+        Replace one client's day and checkpoint the unit in the same transaction
+        """
+        target_date = unit.date.date()
+
+        async with session_factory(unit.client_id) as db:
+            metrics = await kpi_service._compute_day_metrics(db, target_date, unit.client_id)
+            await kpi_service._replace_day_metrics(db, target_date, metrics, unit.client_id)
+            await db.execute(
+                update(models.KpiBackfillUnit).where(
+                    models.KpiBackfillUnit.id == unit.id
+                ).values(
+                    status="completed",
+                    attempts=models.KpiBackfillUnit.attempts + 1,
+                    metrics_count=len(metrics),
+                    error_message=None,
+                    completed_at=datetime.utcnow()
+                )
+            )
+
+        return len(metrics)
+
+    async def _record_failure(
+        self,
+        session_factory: Callable[[Optional[int]], Any],
+        unit,
+        error: str,
+    ) -> None:
+        try:
+            async with session_factory(unit.client_id) as db:
+                await db.execute(
+                    update(models.KpiBackfillUnit).where(
+                        models.KpiBackfillUnit.id == unit.id
+                    ).values(
+                        status="failed",
+                        attempts=models.KpiBackfillUnit.attempts + 1,
+                        error_message=error[:1000]
+                    )
+                )
+        except Exception as e:
+            # The unit stays pending and is retried on the next run
+            logger.error("Failed to checkpoint KPI backfill unit", unit_id=unit.id, error=str(e))
+
+    async def _unit_counts(self, db, job_id: int) -> Dict[str, int]:
+        result = await db.execute(
+            select(
+                models.KpiBackfillUnit.status,
+                func.count(models.KpiBackfillUnit.id)
+            ).where(
+                models.KpiBackfillUnit.job_id == job_id
+            ).group_by(models.KpiBackfillUnit.status)
+        )
+        return dict(result.all())
+
+    @staticmethod
+    def _days(date_from: date, date_to: date) -> List[date]:
+        return [date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1)]
+
+    @staticmethod
+    def _session_factory(session_factory: Optional[Callable[[Optional[int]], Any]]):
+        if session_factory is None:
+            from app.db.session import TenantScopedSession
+            return TenantScopedSession
+        return session_factory
+
+
+# Create service instance
+kpi_backfill_service = KpiBackfillService()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Create and run a backfill job, or resume one"""
+    parser = argparse.ArgumentParser(description="Recompute daily KPI metrics for a date range")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat)
+    parser.add_argument("--client", dest="client_ids", type=int, action="append",
+                        help="Client id, repeatable (default: all active clients)")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="Resume an existing job")
+    parser.add_argument("--concurrency", type=int, help="Units run at once")
+    args = parser.parse_args(argv)
+
+    if args.resume is None and (args.date_from is None or args.date_to is None):
+        parser.error("--from and --to are required unless resuming with --resume")
+
+    async def run() -> Dict[str, Any]:
+        job_id = args.resume
+        if job_id is None:
+            job_id = await kpi_backfill_service.create_job(args.date_from, args.date_to, args.client_ids)
+        return await kpi_backfill_service.run_job(job_id, concurrency=args.concurrency)
+
+    summary = asyncio.run(run())
+    logger.info("KPI backfill command finished", **summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Columnar KPI engine for what-if analysis over a client's date range
+"""
+
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+import structlog
+
+from app import models
+from app.services.kpi_service import COUNT_FIELDS, kpi_service
+
+logger = structlog.get_logger(__name__)
+
+# Columns an extract can be grouped by
+GROUP_COLUMNS = ("date", "engine", "topic", "query_id")
+
+# Count each rate is taken from, keyed by the rate's visibility weight name
+RATE_COUNTS = {
+    "inclusion": "citing_answers",
+    "extraction": "extracted_answers",
+    "presence": "present_answers",
+    "co_visibility": "co_visible_answers",
+}
+
+
+class KpiFrameService:
+    """
+    Service for computing KPIs vectorized over an in-memory extract
+
+    An extract has one row per run in a client's date range with its first
+    answer's stored features, so rates under other extraction thresholds
+    or visibility weights are recomputed without querying the database.
+    Counts and rates match the ones KpiService stores for the same groups.
+    """
+
+    def __init__(self):
+        self.cache_size = 32
+        self.cache_ttl_seconds = 300
+        self._extracts: "OrderedDict[Tuple[int, date, date], Tuple[float, pd.DataFrame]]" = OrderedDict()
+
+    async def get_extract(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        date_from: date,
+        date_to: date,
+        refresh: bool = False,
+    ) -> pd.DataFrame:
+        """
+        A client's extract for an inclusive date range, cached for a few minutes
+        """
+        key = (client_id, date_from, date_to)
+        cached = self._extracts.get(key)
+        if cached is not None and not refresh and time.monotonic() - cached[0] < self.cache_ttl_seconds:
+            self._extracts.move_to_end(key)
+            return cached[1]
+
+        frame = await self.load_extract(db, client_id, date_from, date_to)
+
+        self._extracts[key] = (time.monotonic(), frame)
+        self._extracts.move_to_end(key)
+        while len(self._extracts) > self.cache_size:
+            self._extracts.popitem(last=False)
+
+        return frame
+
+    async def load_extract(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        date_from: date,
+        date_to: date,
+    ) -> pd.DataFrame:
+        """
+        Load the runs of active queries in the range with their answers' KPI features
+        """
+        runs, answers = kpi_service._range_answers(date_from, date_to, client_id)
+        features = models.AnswerFeature
+
+        result = await db.execute(
+            select(
+                runs.c.run_id,
+                runs.c.query_id,
+                runs.c.engine,
+                runs.c.topic,
+                runs.c.created_at,
+                runs.c.status,
+                answers.c.answer_id,
+                features.cites_client,
+                features.cited_domains,
+                features.citation_count,
+                features.mentions_client,
+                features.mentions_entity,
+                features.best_similarity,
+            ).select_from(runs).outerjoin(
+                answers, answers.c.run_id == runs.c.run_id
+            ).outerjoin(
+                features, features.answer_id == answers.c.answer_id
+            )
+        )
+        rows = pd.DataFrame(result.all(), columns=list(result.keys()))
+
+        frame = pd.DataFrame({
+            "run_id": rows["run_id"].astype(np.int64),
+            "query_id": rows["query_id"].astype(np.int64),
+            "engine": rows["engine"].astype("category"),
+            "topic": rows["topic"].fillna("").astype("category"),
+            "date": pd.to_datetime(rows["created_at"]).dt.normalize(),
+            "completed": (rows["status"] == "completed").to_numpy(),
+            "has_answer": rows["answer_id"].notna().to_numpy(),
+            "cites_client": rows["cites_client"].fillna(False).astype(bool),
+            "cited_domains": rows["cited_domains"].fillna(0).astype(np.int32),
+            "citation_count": rows["citation_count"].fillna(0).astype(np.int32),
+            "mentions_client": rows["mentions_client"].fillna(False).astype(bool),
+            "mentions_entity": rows["mentions_entity"].fillna(False).astype(bool),
+            "best_similarity": rows["best_similarity"].astype(np.float64),
+        })
+
+        logger.info(
+            "KPI extract loaded",
+            client_id=client_id,
+            date_from=date_from,
+            date_to=date_to,
+            runs=len(frame),
+            bytes=int(frame.memory_usage(deep=True).sum())
+        )
+
+        return frame
+
+    def compute(
+        self,
+        frame: pd.DataFrame,
+        by: Sequence[str] = ("engine",),
+        extraction_threshold: Optional[float] = None,
+        weights: Optional[Dict[str, float]] = None,
+    ) -> pd.DataFrame:
+        """
+        Counts, rates and visibility index per group of an extract
+
+        extraction_threshold and weights default to the ones KpiService
+        uses; weights may override only some rates. With no grouping
+        columns the whole extract is one row.
+        """
+        threshold = kpi_service.extraction_threshold if extraction_threshold is None else extraction_threshold
+
+        counts = self._group_sum(frame, self._count_columns(frame, threshold), by)
+
+        return self._with_rates(counts, self._weights(weights))
+
+    def sweep_extraction_thresholds(
+        self,
+        frame: pd.DataFrame,
+        thresholds: Sequence[float],
+        by: Sequence[str] = (),
+        weights: Optional[Dict[str, float]] = None,
+    ) -> pd.DataFrame:
+        """
+        Extraction rate and visibility index per group for each threshold
+
+        Every threshold is compared against the similarity column at once,
+        so the sweep costs one grouped sum. Rows are (group..., threshold).
+        """
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        weights = self._weights(weights)
+
+        counts = self._with_rates(
+            self._group_sum(frame, self._count_columns(frame, kpi_service.extraction_threshold), by),
+            weights,
+        )
+
+        # NaN similarity (no answer or no features) compares false
+        hits = frame["best_similarity"].to_numpy()[:, None] >= thresholds[None, :]
+        extracted = self._group_sum(
+            frame, pd.DataFrame(hits.astype(np.int64), columns=thresholds, index=frame.index), by
+        )
+
+        valid, answers = self._valid_answers(counts)
+        extraction = np.where(valid[:, None], extracted.to_numpy() / answers[:, None] * 100.0, 0.0)
+        others = counts["visibility_index"].to_numpy() - counts["extraction_rate"].to_numpy() * weights["extraction"]
+
+        sweep = pd.DataFrame({
+            "threshold": np.tile(thresholds, len(counts)),
+            "extraction_rate": extraction.ravel(),
+            "visibility_index": (others[:, None] + extraction * weights["extraction"]).ravel(),
+        }, index=counts.index.repeat(len(thresholds)))
+
+        return sweep.set_index("threshold", append=bool(by))
+
+    def _count_columns(self, frame: pd.DataFrame, threshold: float) -> pd.DataFrame:
+        """
+        Per-run 0/1 flags (and citation counts) that sum to the metric counts
+        """
+        cites = frame["cites_client"].to_numpy()
+        mentions = frame["mentions_client"].to_numpy()
+
+        return pd.DataFrame({
+            "total_queries": np.ones(len(frame), dtype=np.int64),
+            "successful_runs": frame["completed"].to_numpy(),
+            "answer_count": frame["has_answer"].to_numpy(),
+            "citing_answers": cites,
+            "extracted_answers": frame["best_similarity"].to_numpy() >= threshold,
+            "present_answers": mentions | frame["mentions_entity"].to_numpy(),
+            "co_visible_answers": cites & (frame["cited_domains"].to_numpy() > 1),
+            "total_citations": frame["citation_count"].to_numpy(),
+            "client_mentions": mentions,
+        }, index=frame.index).astype(np.int64)[list(COUNT_FIELDS)]
+
+    @staticmethod
+    def _group_sum(frame: pd.DataFrame, values: pd.DataFrame, by: Sequence[str]) -> pd.DataFrame:
+        unknown = set(by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unsupported grouping columns: {sorted(unknown)}")
+
+        if not by:
+            return values.sum().to_frame().T
+
+        return values.groupby([frame[column] for column in by], observed=True).sum()
+
+    @staticmethod
+    def _valid_answers(counts: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Groups whose rates are defined, and their answer counts with zeros made safe to divide by
+        """
+        answers = counts["answer_count"].to_numpy(dtype=np.float64)
+        valid = (counts["successful_runs"].to_numpy() > 0) & (answers > 0)
+        return valid, np.where(valid, answers, 1.0)
+
+    def _with_rates(self, counts: pd.DataFrame, weights: Dict[str, float]) -> pd.DataFrame:
+        valid, answers = self._valid_answers(counts)
+
+        counts = counts.copy()
+        visibility = np.zeros(len(counts))
+        for name, count in RATE_COUNTS.items():
+            rate = np.where(valid, counts[count].to_numpy() / answers * 100.0, 0.0)
+            counts[f"{name}_rate"] = rate
+            visibility += rate * weights[name]
+        counts["visibility_index"] = visibility
+
+        return counts
+
+    @staticmethod
+    def _weights(weights: Optional[Dict[str, float]]) -> Dict[str, float]:
+        return kpi_service.resolve_weights(weights)
+
+
+# Create service instance
+kpi_frame_service = KpiFrameService()
@@ -2,12 +2,14 @@
 KPI aggregation service for computing visibility metrics
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import time
 from datetime import datetime, date, timedelta
-from collections import defaultdict
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, delete, insert, func, and_, or_, case, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 import structlog
 
 from app import models
@@ -15,6 +17,42 @@ from app.core.config import settings
 
 logger = structlog.get_logger(__name__)
 
+# Rollup granularities, finest first
+ROLLUP_PERIODS = ("week", "month")
+
+# Metric counts the rates are derived from
+COUNT_FIELDS = (
+    "total_queries",
+    "successful_runs",
+    "answer_count",
+    "citing_answers",
+    "extracted_answers",
+    "present_answers",
+    "co_visible_answers",
+    "total_citations",
+    "client_mentions",
+)
+
+# Rates derived from the counts
+RATE_FIELDS = (
+    "inclusion_rate",
+    "extraction_rate",
+    "presence_rate",
+    "co_visibility_rate",
+    "visibility_index",
+)
+
+# Unique key of a daily metric row
+METRIC_KEY = ("client_id", "query_id", "engine", "date")
+
+# Weight of each rate in the visibility index
+VISIBILITY_WEIGHTS = {
+    "inclusion": 0.4,
+    "extraction": 0.3,
+    "presence": 0.2,
+    "co_visibility": 0.1,
+}
+
 
 class KpiService:
     """
@@ -23,6 +61,8 @@ class KpiService:
 
     def __init__(self):
         self.batch_size = settings.BATCH_SIZE
+        self.extraction_threshold = 0.82  # Similarity score counted as extraction
+        self.upsert_batch_size = 1000  # Rows per INSERT, well under the bind parameter limit
 
     async def compute_daily_metrics(
         self,
@@ -38,27 +78,19 @@ class KpiService:
         logger.info("Computing daily metrics", date=target_date)
 
         try:
-            # Get all active clients
-            clients = await self._get_active_clients(db)
-
-            metrics = []
-
-            for client in clients:
-                client_metrics = await self._compute_client_metrics(
-                    db, client, target_date
-                )
-                metrics.extend(client_metrics)
+            metrics = await self._compute_day_metrics(db, target_date)
 
-            # Store metrics in database
-            for metric in metrics:
-                db.add(metric)
+            # Replace the day's incrementally maintained rows
+            drifted = await self._replace_day_metrics(db, target_date, metrics)
+            await self.refresh_rollups(db, [target_date])
 
             await db.commit()
 
             logger.info(
                 "Daily metrics computed",
                 date=target_date,
-                metrics_count=len(metrics)
+                metrics_count=len(metrics),
+                drifted=drifted
             )
 
             return metrics
@@ -72,267 +104,656 @@ class KpiService:
             )
             raise
 
-    async def _compute_client_metrics(
+    async def compute_daily_metrics_parallel(
+        self,
+        target_date: Optional[date] = None,
+        client_ids: Optional[List[int]] = None,
+        concurrency: Optional[int] = None,
+        session_factory: Optional[Callable[[int], Any]] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Compute daily metrics with clients spread over concurrent tenant-scoped sessions
+
+        Each client is computed and committed in its own session, so a
+        failing client is logged and counted without affecting the others.
+        progress, if given, is called with (finished, total) after each client.
+        """
+        if target_date is None:
+            target_date = date.today()
+        if session_factory is None:
+            from app.db.session import TenantScopedSession
+            session_factory = TenantScopedSession
+        if client_ids is None:
+            client_ids = await self._active_client_ids()
+
+        concurrency = concurrency or settings.KPI_CONCURRENCY
+        semaphore = asyncio.Semaphore(concurrency)
+        summary: Dict[str, Any] = {
+            "clients": len(client_ids),
+            "succeeded": 0,
+            "failed": 0,
+            "metrics": 0,
+            "drifted": 0,
+            "errors": {},
+        }
+        started = time.perf_counter()
+
+        logger.info(
+            "Computing daily metrics in parallel",
+            date=target_date,
+            clients=len(client_ids),
+            concurrency=concurrency
+        )
+
+        async def compute_client(client_id: int) -> None:
+            async with semaphore:
+                try:
+                    metrics, drifted = await self._compute_client_day(
+                        session_factory, client_id, target_date
+                    )
+                    summary["succeeded"] += 1
+                    summary["metrics"] += metrics
+                    summary["drifted"] += drifted
+
+                except Exception as e:
+                    logger.error(
+                        "Client metrics computation failed",
+                        client_id=client_id,
+                        date=target_date,
+                        error=str(e)
+                    )
+                    summary["failed"] += 1
+                    summary["errors"][client_id] = str(e)
+
+                finished = summary["succeeded"] + summary["failed"]
+                logger.info(
+                    "Daily metrics progress",
+                    date=target_date,
+                    client_id=client_id,
+                    finished=finished,
+                    total=len(client_ids)
+                )
+                if progress is not None:
+                    progress(finished, len(client_ids))
+
+        await asyncio.gather(*(compute_client(client_id) for client_id in client_ids))
+
+        summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        logger.info(
+            "Daily metrics computed in parallel",
+            date=target_date,
+            **{key: value for key, value in summary.items() if key != "errors"}
+        )
+
+        return summary
+
+    async def _compute_client_day(
+        self,
+        session_factory: Callable[[int], Any],
+        client_id: int,
+        target_date: date,
+    ) -> Tuple[int, int]:
+        """
+        Recompute one client's day in its own session, returning (metrics, drifted)
+        """
+        async with session_factory(client_id) as db:
+            metrics = await self._compute_day_metrics(db, target_date, client_id)
+            drifted = await self._replace_day_metrics(db, target_date, metrics, client_id)
+            await self.refresh_rollups(db, [target_date], client_id)
+
+        return len(metrics), drifted
+
+    async def _active_client_ids(self) -> List[int]:
+        """Get the ids of all active clients"""
+        from app.db.session import async_session_factory
+
+        async with async_session_factory() as session:
+            result = await session.execute(
+                select(models.Client.id).where(models.Client.is_active == True)
+            )
+            return list(result.scalars().all())
+
+    async def _compute_day_metrics(
         self,
         db: AsyncSession,
-        client: models.Client,
         target_date: date,
+        client_id: Optional[int] = None,
     ) -> List[models.Metric]:
         """
-        Compute metrics for a specific client on a specific date
+        Build one Metric per (client, query, engine) with runs on the date
+
+        All counts come from a single grouped query over the answers'
+        stored features; a second one lists the answer ids kept in metadata.
         """
-        metrics = []
+        runs, answers = self._day_answers(target_date, client_id)
 
-        # Get all queries for this client
-        queries = await self._get_client_queries(db, client.id)
+        result = await db.execute(self._grouped_kpi_query(runs, answers))
+        groups = result.all()
 
-        # Get engines that were active on this date
-        engines = await self._get_active_engines(db, client.id, target_date)
+        answer_ids = await self._group_answer_ids(db, runs, answers)
 
-        for engine in engines:
-            for query in queries:
-                metric = await self._compute_query_engine_metric(
-                    db, client, query, engine, target_date
-                )
-                if metric:
-                    metrics.append(metric)
+        metrics = []
+        for group in groups:
+            key = (group.client_id, group.query_id, group.engine)
+
+            metric = models.Metric(
+                client_id=group.client_id,
+                query_id=group.query_id,
+                engine=group.engine,
+                date=self._day_start(target_date),
+                total_queries=group.total_runs,
+                successful_runs=group.successful_runs,
+                answer_count=group.answers,
+                citing_answers=group.citing,
+                extracted_answers=group.extracted,
+                present_answers=group.present,
+                co_visible_answers=group.co_visible,
+                total_citations=int(group.total_citations),
+                client_mentions=group.mentioning,
+                metadata_json={
+                    "total_runs": group.total_runs,
+                    "successful_runs": group.successful_runs,
+                    "answer_ids": sorted(answer_ids.get(key, [])),
+                },
+            )
+            self._derive_rates(metric)
+            metrics.append(metric)
 
         return metrics
 
-    async def _compute_query_engine_metric(
+    async def _replace_day_metrics(
         self,
         db: AsyncSession,
-        client: models.Client,
-        query: models.Query,
-        engine: str,
         target_date: date,
-    ) -> Optional[models.Metric]:
+        metrics: List[models.Metric],
+        client_id: Optional[int] = None,
+    ) -> int:
         """
-        Compute metrics for a specific client/query/engine combination
+        Swap a day's stored metrics for recomputed ones, returning how many had drifted
+
+        Rows are kept current by record_run; a difference in any count
+        means an incremental update was missed or double-applied.
         """
-        try:
-            # Get runs for this date range
-            start_date = datetime.combine(target_date, datetime.min.time())
-            end_date = datetime.combine(target_date, datetime.max.time())
+        day = self._day_start(target_date)
+        stored = select(models.Metric).where(models.Metric.date == day)
+        if client_id is not None:
+            stored = stored.where(models.Metric.client_id == client_id)
+
+        result = await db.execute(stored)
+        existing = {
+            (metric.client_id, metric.query_id, metric.engine): self._counts(metric)
+            for metric in result.scalars().all()
+        }
 
-            runs = await self._get_runs_for_date_range(
-                db, client.id, query.id, engine, start_date, end_date
+        drifted = sum(
+            1 for metric in metrics
+            if (metric.client_id, metric.query_id, metric.engine) in existing
+            and existing[(metric.client_id, metric.query_id, metric.engine)] != self._counts(metric)
+        )
+        if drifted:
+            logger.warning(
+                "Incremental metrics differ from recompute",
+                date=target_date,
+                client_id=client_id,
+                drifted=drifted
             )
 
-            if not runs:
-                return None
+        kept = await self._upsert_metrics(db, metrics)
 
-            # Compute KPIs
-            kpis = await self._compute_kpis(db, client, query, engine, runs)
+        # Combinations without runs any more, e.g. for a deactivated query
+        stale = delete(models.Metric).where(models.Metric.date == day)
+        if client_id is not None:
+            stale = stale.where(models.Metric.client_id == client_id)
+        if kept:
+            stale = stale.where(models.Metric.id.not_in(kept))
+        await db.execute(stale)
 
-            metric = models.Metric(
-                client_id=client.id,
-                query_id=query.id,
-                engine=engine,
-                date=target_date,
-                inclusion_rate=kpis["inclusion_rate"],
-                extraction_rate=kpis["extraction_rate"],
-                presence_rate=kpis["presence_rate"],
-                co_visibility_rate=kpis["co_visibility_rate"],
-                visibility_index=kpis["visibility_index"],
-                total_queries=len(runs),
-                successful_runs=len([r for r in runs if r.status == "completed"]),
-                total_citations=kpis["total_citations"],
-                client_mentions=kpis["client_mentions"],
-                metadata_json=kpis["metadata"],
-            )
+        return drifted
 
-            return metric
+    async def _upsert_metrics(self, db: AsyncSession, metrics: List[models.Metric]) -> List[int]:
+        """
+        Write metrics with multi-row INSERT ... ON CONFLICT DO UPDATE, returning their ids
+
+        Rows are keyed by (client_id, query_id, engine, date), so writing a
+        day again updates it in place instead of adding rows.
+        """
+        now = datetime.utcnow()
+        ids: List[int] = []
+
+        for start in range(0, len(metrics), self.upsert_batch_size):
+            rows = [
+                {
+                    **{column: getattr(metric, column) for column in METRIC_KEY + RATE_FIELDS + COUNT_FIELDS},
+                    "metadata_json": metric.metadata_json,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for metric in metrics[start:start + self.upsert_batch_size]
+            ]
+
+            statement = pg_insert(models.Metric).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=list(METRIC_KEY),
+                set_={
+                    **{
+                        column: statement.excluded[column]
+                        for column in RATE_FIELDS + COUNT_FIELDS + ("metadata_json",)
+                    },
+                    "updated_at": now,
+                }
+            ).returning(models.Metric)
+
+            # Refreshes rows this session already holds, e.g. from record_run
+            result = await db.execute(statement, execution_options={"populate_existing": True})
+            ids.extend(metric.id for metric in result.scalars().all())
+
+        return ids
+
+    async def record_run(self, db: AsyncSession, run: models.Run) -> Optional[models.Metric]:
+        """
+        Add a finished run to its day's metric so dashboards see it immediately
+
+        Counts are incremented in place and the rates re-derived from them.
+        A run landing in a week or month that has already ended also
+        rebuilds that period's rollups, which reports read instead of the
+        daily rows. Failures are logged and leave the caller's transaction
+        usable; the nightly recompute corrects any missed update.
+        """
+        try:
+            async with db.begin_nested():
+                metric = await self._apply_run(db, run)
+
+                # Open periods are read day by day and rebuilt nightly
+                day = metric.date.date()
+                if any(self.period_bounds(period, day)[1] <= date.today() for period in ROLLUP_PERIODS):
+                    await self.refresh_rollups(db, [day], run.client_id)
+
+                return metric
 
         except Exception as e:
-            logger.error(
-                "Failed to compute metric",
-                client_id=client.id,
-                query_id=query.id,
-                engine=engine,
-                date=target_date,
+            logger.warning(
+                "Incremental metric update failed",
+                run_id=run.id,
                 error=str(e)
             )
             return None
 
-    async def _compute_kpis(
+    async def _apply_run(self, db: AsyncSession, run: models.Run) -> models.Metric:
+        """
+        Increment the run's day metric by the run and its first answer's features
+        """
+        result = await db.execute(
+            select(models.Answer.id, models.AnswerFeature).outerjoin(
+                models.AnswerFeature, models.AnswerFeature.answer_id == models.Answer.id
+            ).where(
+                models.Answer.run_id == run.id
+            ).order_by(models.Answer.id).limit(1)
+        )
+        answer = result.first()
+
+        day = self._day_start((run.created_at or datetime.utcnow()).date())
+        locked = select(models.Metric).where(
+            and_(
+                models.Metric.client_id == run.client_id,
+                models.Metric.query_id == run.query_id,
+                models.Metric.engine == run.engine,
+                models.Metric.date == day
+            )
+        ).with_for_update()
+        result = await db.execute(locked)
+        metric = result.scalars().first()
+
+        if metric is None:
+            # Runs finishing together may both create the row; one insert wins
+            await db.execute(
+                pg_insert(models.Metric).values(
+                    client_id=run.client_id,
+                    query_id=run.query_id,
+                    engine=run.engine,
+                    date=day,
+                    metadata_json={},
+                    created_at=datetime.utcnow(),
+                    updated_at=datetime.utcnow(),
+                    **{field: 0 for field in COUNT_FIELDS}
+                ).on_conflict_do_nothing(index_elements=list(METRIC_KEY))
+            )
+            result = await db.execute(locked)
+            metric = result.scalars().one()
+
+        metric.total_queries += 1
+        if run.status == "completed":
+            metric.successful_runs += 1
+
+        answer_ids = list((metric.metadata_json or {}).get("answer_ids", []))
+        if answer is not None:
+            answer_id, features = answer
+            metric.answer_count += 1
+            answer_ids.append(answer_id)
+
+            if features is not None:
+                metric.citing_answers += int(features.cites_client)
+                metric.extracted_answers += int(
+                    features.best_similarity is not None
+                    and features.best_similarity >= self.extraction_threshold
+                )
+                metric.present_answers += int(features.mentions_client or features.mentions_entity)
+                metric.co_visible_answers += int(features.cites_client and features.cited_domains > 1)
+                metric.total_citations += features.citation_count
+                metric.client_mentions += int(features.mentions_client)
+
+        # Reassigned so the JSON column is seen as changed
+        metric.metadata_json = {
+            "total_runs": metric.total_queries,
+            "successful_runs": metric.successful_runs,
+            "answer_ids": sorted(answer_ids),
+        }
+        self._derive_rates(metric)
+
+        return metric
+
+    async def refresh_rollups(
         self,
         db: AsyncSession,
-        client: models.Client,
-        query: models.Query,
-        engine: str,
-        runs: List[models.Run],
-    ) -> Dict[str, Any]:
-        """
-        Compute all KPI values for the given runs
+        days: Iterable[date],
+        client_id: Optional[int] = None,
+    ) -> int:
         """
-        total_runs = len(runs)
-        successful_runs = len([r for r in runs if r.status == "completed"])
+        Rebuild the week and month rollups containing the given days from daily metrics
 
-        if successful_runs == 0:
-            return self._empty_kpis()
+        Only periods with a changed day are rewritten, each with one DELETE
+        and one INSERT ... SELECT. Returns the number of periods refreshed.
+        """
+        periods = {
+            (period, *self.period_bounds(period, day))
+            for day in days
+            for period in ROLLUP_PERIODS
+        }
 
-        # Get answers for successful runs
-        answer_ids = [r.answers[0].id for r in runs if r.answers]
+        # Daily rows added in this session must be visible to INSERT ... SELECT
+        await db.flush()
 
-        # Inclusion Rate: % of queries where domain appears in citations
-        inclusion_rate = await self._compute_inclusion_rate(db, client, answer_ids)
+        for period, start, end in sorted(periods):
+            period_start = self._day_start(start)
 
-        # Extraction Rate: % with text overlap ≥ threshold
-        extraction_rate = await self._compute_extraction_rate(db, client, answer_ids)
+            stale = delete(models.MetricRollup).where(
+                models.MetricRollup.period == period,
+                models.MetricRollup.period_start == period_start
+            )
+            source = select(
+                models.Metric.client_id,
+                literal(period),
+                literal(period_start),
+                models.Metric.engine,
+                models.Query.topic,
+                *[func.sum(getattr(models.Metric, field)) for field in COUNT_FIELDS]
+            ).join(
+                models.Query, models.Metric.query_id == models.Query.id
+            ).where(
+                models.Metric.date >= period_start,
+                models.Metric.date < self._day_start(end)
+            ).group_by(models.Metric.client_id, models.Metric.engine, models.Query.topic)
+
+            if client_id is not None:
+                stale = stale.where(models.MetricRollup.client_id == client_id)
+                source = source.where(models.Metric.client_id == client_id)
+
+            await db.execute(stale)
+            await db.execute(
+                insert(models.MetricRollup).from_select(
+                    ["client_id", "period", "period_start", "engine", "topic", *COUNT_FIELDS],
+                    source
+                )
+            )
 
-        # Presence Rate: % mentioning client/entity by name
-        presence_rate = await self._compute_presence_rate(db, client, answer_ids)
+        return len(periods)
 
-        # Co-visibility Rate: % mentioning both client and publisher
-        co_visibility_rate = await self._compute_co_visibility_rate(db, client, answer_ids)
+    @staticmethod
+    def period_bounds(period: str, day: date) -> Tuple[date, date]:
+        """
+        First day of the week (Monday) or month containing day, and the first day after it
+        """
+        if period == "week":
+            start = day - timedelta(days=day.weekday())
+            return start, start + timedelta(days=7)
+        elif period == "month":
+            start = day.replace(day=1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        else:
+            raise ValueError(f"Unsupported rollup period: {period}")
+
+    @staticmethod
+    def _counts(metric) -> Dict[str, int]:
+        return {field: getattr(metric, field) for field in COUNT_FIELDS}
+
+    @staticmethod
+    def _day_start(target_date: date) -> datetime:
+        return datetime.combine(target_date, datetime.min.time())
+
+    def _day_answers(self, target_date: date, client_id: Optional[int] = None):
+        """
+        CTEs of the day's runs (active clients and queries) and each run's first answer
+        """
+        return self._range_answers(target_date, target_date, client_id)
 
-        # Visibility Index: Weighted aggregate KPI
-        visibility_index = self._compute_visibility_index(
-            inclusion_rate, extraction_rate, presence_rate, co_visibility_rate
+    def _range_answers(self, date_from: date, date_to: date, client_id: Optional[int] = None):
+        """
+        CTEs of the runs on an inclusive date range and each run's first answer
+        """
+        start_date = datetime.combine(date_from, datetime.min.time())
+        end_date = datetime.combine(date_to, datetime.max.time())
+
+        runs = select(
+            models.Run.id.label("run_id"),
+            models.Run.client_id,
+            models.Run.query_id,
+            models.Run.engine,
+            models.Run.status,
+            models.Run.created_at,
+            models.Query.topic,
+        ).join(
+            models.Client, models.Run.client_id == models.Client.id
+        ).join(
+            models.Query, models.Run.query_id == models.Query.id
+        ).where(
+            and_(
+                models.Client.is_active == True,
+                models.Query.is_active == True,
+                models.Run.created_at >= start_date,
+                models.Run.created_at <= end_date
+            )
         )
+        if client_id is not None:
+            runs = runs.where(models.Run.client_id == client_id)
+        runs = runs.cte("day_runs")
 
-        # Supporting data
-        total_citations = await self._count_total_citations(db, answer_ids)
-        client_mentions = await self._count_client_mentions(db, client, answer_ids)
-
-        return {
-            "inclusion_rate": inclusion_rate,
-            "extraction_rate": extraction_rate,
-            "presence_rate": presence_rate,
-            "co_visibility_rate": co_visibility_rate,
-            "visibility_index": visibility_index,
-            "total_citations": total_citations,
-            "client_mentions": client_mentions,
-            "metadata": {
-                "total_runs": total_runs,
-                "successful_runs": successful_runs,
-                "answer_ids": answer_ids,
-            }
-        }
+        answers = select(
+            models.Answer.run_id,
+            func.min(models.Answer.id).label("answer_id"),
+        ).where(
+            models.Answer.run_id.in_(select(runs.c.run_id))
+        ).group_by(models.Answer.run_id).cte("run_answers")
+
+        return runs, answers
 
-    async def _compute_inclusion_rate(
+    def _grouped_kpi_query(self, runs, answers):
+        """
+        Per-(client, query, engine) run and answer counts from stored answer features
+        """
+        features = models.AnswerFeature
+
+        return select(
+            runs.c.client_id,
+            runs.c.query_id,
+            runs.c.engine,
+            func.count(runs.c.run_id).label("total_runs"),
+            func.count(case((runs.c.status == "completed", 1))).label("successful_runs"),
+            func.count(answers.c.answer_id).label("answers"),
+            func.count(case((features.cites_client == True, 1))).label("citing"),
+            func.count(case((features.best_similarity >= self.extraction_threshold, 1))).label("extracted"),
+            func.count(case((
+                and_(features.cites_client == True, features.cited_domains > 1), 1
+            ))).label("co_visible"),
+            func.count(case((
+                or_(features.mentions_client == True, features.mentions_entity == True), 1
+            ))).label("present"),
+            func.count(case((features.mentions_client == True, 1))).label("mentioning"),
+            func.coalesce(func.sum(features.citation_count), 0).label("total_citations"),
+        ).select_from(runs).outerjoin(
+            answers, answers.c.run_id == runs.c.run_id
+        ).outerjoin(
+            features, features.answer_id == answers.c.answer_id
+        ).group_by(runs.c.client_id, runs.c.query_id, runs.c.engine)
+
+    async def _group_answer_ids(
         self,
         db: AsyncSession,
-        client: models.Client,
-        answer_ids: List[int],
-    ) -> float:
+        runs,
+        answers,
+    ) -> Dict[Tuple[int, int, str], List[int]]:
         """
-        % of queries where client's domain appears in citations
+        Answer ids of each (client, query, engine)
         """
-        if not answer_ids:
-            return 0.0
-
-        # Count answers that cite the client's domain
         result = await db.execute(
-            select(func.count(models.Citation.id)).where(
-                and_(
-                    models.Citation.answer_id.in_(answer_ids),
-                    models.Citation.domain == client.domain
-                )
-            )
+            select(
+                runs.c.client_id,
+                runs.c.query_id,
+                runs.c.engine,
+                answers.c.answer_id,
+            ).join(answers, answers.c.run_id == runs.c.run_id)
         )
-        citing_answers = result.scalar()
 
-        return (citing_answers / len(answer_ids)) * 100.0
+        answer_ids: Dict[Tuple[int, int, str], List[int]] = {}
+        for client_id, query_id, engine, answer_id in result.all():
+            answer_ids.setdefault((client_id, query_id, engine), []).append(answer_id)
 
-    async def _compute_extraction_rate(
+        return answer_ids
+
+    def _derive_rates(self, metric: models.Metric) -> None:
+        """
+        Set a metric's rates and visibility index from its counts
+        """
+        for name, value in self.rates_from_counts(self._counts(metric)).items():
+            setattr(metric, name, value)
+
+    def rates_from_counts(
         self,
-        db: AsyncSession,
-        client: models.Client,
-        answer_ids: List[int],
-    ) -> float:
+        counts: Dict[str, int],
+        weights: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, float]:
         """
-        % of queries with text overlap ≥ similarity threshold
+        Rates and visibility index from a metric's counts, or sums of them
         """
-        if not answer_ids:
-            return 0.0
+        def rate(count: int) -> float:
+            if not counts["successful_runs"] or not counts["answer_count"]:
+                return 0.0
+            return (count / counts["answer_count"]) * 100.0
+
+        rates = {
+            # Inclusion Rate: % of queries where domain appears in citations
+            "inclusion_rate": rate(counts["citing_answers"]),
+            # Extraction Rate: % with text overlap ≥ threshold
+            "extraction_rate": rate(counts["extracted_answers"]),
+            # Presence Rate: % mentioning client/entity by name
+            "presence_rate": rate(counts["present_answers"]),
+            # Co-visibility Rate: % mentioning both client and publisher
+            "co_visibility_rate": rate(counts["co_visible_answers"]),
+        }
 
-        # Count answers with high similarity matches
-        result = await db.execute(
-            select(func.count(func.distinct(models.Similarity.answer_id))).where(
-                and_(
-                    models.Similarity.answer_id.in_(answer_ids),
-                    models.Similarity.similarity_score >= 0.82
-                )
-            )
+        # Visibility Index: Weighted aggregate KPI
+        rates["visibility_index"] = self._compute_visibility_index(
+            rates["inclusion_rate"],
+            rates["extraction_rate"],
+            rates["presence_rate"],
+            rates["co_visibility_rate"],
+            weights,
         )
-        similar_answers = result.scalar()
 
-        return (similar_answers / len(answer_ids)) * 100.0
+        return rates
+
+    async def get_weight_profile(self, db: AsyncSession, client_id: int) -> Tuple[int, Dict[str, float]]:
+        """
+        A client's visibility weights and their version; version 0 means the defaults
+        """
+        result = await db.execute(
+            select(models.KpiWeightProfile).where(models.KpiWeightProfile.client_id == client_id)
+        )
+        return self._profile_weights(result.scalars().first())
 
-    async def _compute_presence_rate(
+    async def set_weight_profile(
         self,
         db: AsyncSession,
-        client: models.Client,
-        answer_ids: List[int],
-    ) -> float:
+        client_id: int,
+        weights: Dict[str, float],
+    ) -> Tuple[int, Dict[str, float]]:
         """
-        % of queries mentioning client/entity by name
+        Change some or all of a client's visibility weights, bumping the profile version
+
+        The profile row is locked while the change is merged into it, so
+        concurrent partial updates both apply. Weights that end up unchanged
+        keep the current version, so cached reports stay valid. Stored
+        metrics are not recomputed: readers derive the index from the
+        stored rates with whichever profile version is current.
         """
-        if not answer_ids:
-            return 0.0
+        locked = select(models.KpiWeightProfile).where(
+            models.KpiWeightProfile.client_id == client_id
+        ).with_for_update().execution_options(populate_existing=True)
+
+        result = await db.execute(locked)
+        profile = result.scalars().first()
+        version, current = self._profile_weights(profile)
+        merged = self.resolve_weights({**current, **weights})
+
+        if merged != current and profile is None:
+            # Clients changing their first weights together may both insert; one wins
+            await db.execute(
+                pg_insert(models.KpiWeightProfile).values(
+                    client_id=client_id,
+                    version=0,
+                    created_at=datetime.utcnow(),
+                    updated_at=datetime.utcnow(),
+                    **VISIBILITY_WEIGHTS
+                ).on_conflict_do_nothing(index_elements=["client_id"])
+            )
+            result = await db.execute(locked)
+            profile = result.scalars().one()
+            version, current = self._profile_weights(profile)
+            merged = self.resolve_weights({**current, **weights})
 
-        # Get client name and common entities
-        client_names = [client.name.lower()]
-        # TODO: Add entity names from WordPress entities
+        if merged != current:
+            for name, value in merged.items():
+                setattr(profile, name, value)
+            profile.version = version = version + 1
+            profile.updated_at = datetime.utcnow()
 
-        # Count answers that mention client name
-        mentioning_answers = 0
+        # Also ends the transaction holding the row lock
+        await db.commit()
 
-        for answer_id in answer_ids:
-            result = await db.execute(
-                select(models.Answer.raw_response).where(
-                    models.Answer.id == answer_id
-                )
-            )
-            answer = result.scalar_one_or_none()
+        if merged != current:
+            logger.info("KPI weight profile updated", client_id=client_id, version=version, **merged)
 
-            if answer and any(name in answer.lower() for name in client_names):
-                mentioning_answers += 1
+        return version, merged
 
-        return (mentioning_answers / len(answer_ids)) * 100.0
+    @staticmethod
+    def _profile_weights(profile: Optional[models.KpiWeightProfile]) -> Tuple[int, Dict[str, float]]:
+        if profile is None:
+            return 0, dict(VISIBILITY_WEIGHTS)
+        return profile.version, {name: getattr(profile, name) for name in VISIBILITY_WEIGHTS}
 
-    async def _compute_co_visibility_rate(
-        self,
-        db: AsyncSession,
-        client: models.Client,
-        answer_ids: List[int],
-    ) -> float:
+    @staticmethod
+    def resolve_weights(weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
         """
-        % mentioning both client and another publisher
+        Complete weights with the defaults, rejecting unknown names and negative or all-zero values
         """
-        if not answer_ids:
-            return 0.0
-
-        # This is a simplified version - in practice, you'd need to identify
-        # competitor/publisher mentions
-        co_visible_answers = 0
-
-        for answer_id in answer_ids:
-            # Check if answer cites client domain AND at least one other domain
-            result = await db.execute(
-                select(func.count(func.distinct(models.Citation.domain))).where(
-                    models.Citation.answer_id == answer_id
-                )
-            )
-            domain_count = result.scalar()
-
-            # Check if client domain is cited
-            client_citation = await db.execute(
-                select(func.count(models.Citation.id)).where(
-                    and_(
-                        models.Citation.answer_id == answer_id,
-                        models.Citation.domain == client.domain
-                    )
-                )
-            )
-            has_client = client_citation.scalar() > 0
+        unknown = set(weights or {}) - set(VISIBILITY_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown visibility weights: {sorted(unknown)}")
 
-            if has_client and domain_count > 1:
-                co_visible_answers += 1
+        resolved = {**VISIBILITY_WEIGHTS, **(weights or {})}
+        if any(value < 0 for value in resolved.values()) or not sum(resolved.values()):
+            raise ValueError("Visibility weights must be non-negative and not all zero")
 
-        return (co_visible_answers / len(answer_ids)) * 100.0
+        return resolved
 
     def _compute_visibility_index(
         self,
@@ -340,17 +761,12 @@ class KpiService:
         extraction_rate: float,
         presence_rate: float,
         co_visibility_rate: float,
+        weights: Optional[Dict[str, float]] = None,
     ) -> float:
         """
-        Weighted aggregate KPI
+        Weighted aggregate KPI, with the default weights unless others are given
         """
-        # Weights based on importance (can be adjusted)
-        weights = {
-            "inclusion": 0.4,
-            "extraction": 0.3,
-            "presence": 0.2,
-            "co_visibility": 0.1,
-        }
+        weights = weights or VISIBILITY_WEIGHTS
 
         return (
             inclusion_rate * weights["inclusion"] +
@@ -359,118 +775,6 @@ class KpiService:
             co_visibility_rate * weights["co_visibility"]
         )
 
-    def _empty_kpis(self) -> Dict[str, Any]:
-        """
-        Return empty KPI values
-        """
-        return {
-            "inclusion_rate": 0.0,
-            "extraction_rate": 0.0,
-            "presence_rate": 0.0,
-            "co_visibility_rate": 0.0,
-            "visibility_index": 0.0,
-            "total_citations": 0,
-            "client_mentions": 0,
-            "metadata": {},
-        }
-
-    async def _get_active_clients(self, db: AsyncSession) -> List[models.Client]:
-        """Get all active clients"""
-        result = await db.execute(
-            select(models.Client).where(models.Client.is_active == True)
-        )
-        return result.scalars().all()
-
-    async def _get_client_queries(self, db: AsyncSession, client_id: int) -> List[models.Query]:
-        """Get all active queries for a client"""
-        result = await db.execute(
-            select(models.Query).where(
-                and_(
-                    models.Query.client_id == client_id,
-                    models.Query.is_active == True
-                )
-            )
-        )
-        return result.scalars().all()
-
-    async def _get_active_engines(self, db: AsyncSession, client_id: int, target_date: date) -> List[str]:
-        """Get engines that had runs on the target date"""
-        start_date = datetime.combine(target_date, datetime.min.time())
-        end_date = datetime.combine(target_date, datetime.max.time())
-
-        result = await db.execute(
-            select(func.distinct(models.Run.engine)).where(
-                and_(
-                    models.Run.client_id == client_id,
-                    models.Run.created_at >= start_date,
-                    models.Run.created_at <= end_date
-                )
-            )
-        )
-        engines = result.scalars().all()
-        return list(engines)
-
-    async def _get_runs_for_date_range(
-        self,
-        db: AsyncSession,
-        client_id: int,
-        query_id: int,
-        engine: str,
-        start_date: datetime,
-        end_date: datetime,
-    ) -> List[models.Run]:
-        """Get runs for the specified parameters and date range"""
-        result = await db.execute(
-            select(models.Run).where(
-                and_(
-                    models.Run.client_id == client_id,
-                    models.Run.query_id == query_id,
-                    models.Run.engine == engine,
-                    models.Run.created_at >= start_date,
-                    models.Run.created_at <= end_date
-                )
-            ).options(
-                # Eager load answers to avoid N+1 queries
-                select.joinedload(models.Run.answers)
-            )
-        )
-        return result.scalars().all()
-
-    async def _count_total_citations(self, db: AsyncSession, answer_ids: List[int]) -> int:
-        """Count total citations across all answers"""
-        if not answer_ids:
-            return 0
-
-        result = await db.execute(
-            select(func.count(models.Citation.id)).where(
-                models.Citation.answer_id.in_(answer_ids)
-            )
-        )
-        return result.scalar()
-
-    async def _count_client_mentions(self, db: AsyncSession, client: models.Client, answer_ids: List[int]) -> int:
-        """Count answers that mention the client"""
-        if not answer_ids:
-            return 0
-
-        # Simple text search for client name
-        client_name_lower = client.name.lower()
-        mention_count = 0
-
-        for answer_id in answer_ids:
-            result = await db.execute(
-                select(models.Answer.raw_response).where(
-                    models.Answer.id == answer_id
-                )
-            )
-            answer = result.scalar_one_or_none()
-
-            if answer and client_name_lower in answer.lower():
-                mention_count += 1
-
-        return mention_count
-
 
 # Create service instance
-kpi_service = KpiService()</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/kpi_service.py
\ No newline at end of file
+kpi_service = KpiService()
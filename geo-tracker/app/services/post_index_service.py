@@ -0,0 +1,162 @@
+"""
+Post indexing service: keeps similarity data current after WordPress syncs
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func, and_
+import structlog
+
+from app import models
+
+logger = structlog.get_logger(__name__)
+
+
+class PostIndexService:
+    """
+    Service for refreshing post embeddings, similarity indexes and similarity rows
+    """
+
+    @staticmethod
+    async def index_posts(
+        db: AsyncSession,
+        client_id: int,
+        post_ids: List[str],
+    ) -> Dict[str, int]:
+        """
+        Embed, fingerprint and split new or changed published posts and update the client's index
+
+        New or edited posts are re-scored against the answers in the
+        retention window, from stored answer embeddings. Posts that are no
+        longer published are dropped from the index and their similarity
+        rows are deleted.
+        """
+        from app.services.similarity_service import similarity_engine
+        from app.services.similarity_batch_service import similarity_batch_service
+        from app.services.data_retention_service import data_retention_service
+
+        stats = {"indexed": 0, "removed": 0, "rescored": 0, "similarities_removed": 0}
+        if not post_ids:
+            return stats
+
+        result = await db.execute(
+            select(models.Post).where(
+                models.Post.client_id == client_id,
+                models.Post.id.in_(post_ids)
+            )
+        )
+        posts = result.scalars().all()
+
+        published = [post for post in posts if post.status == "publish"]
+        removed = [post.id for post in posts if post.status != "publish"]
+
+        # Content changes show as a fingerprint hash mismatch (new posts have none)
+        changed = await PostIndexService._changed_posts(db, client_id, published)
+
+        with similarity_engine.model_pass():
+            embeddings = await similarity_engine.get_post_embeddings(db, client_id, published)
+            await similarity_engine.sync_post_fingerprints(db, client_id, published)
+            await similarity_engine.get_post_passages(db, client_id, published)
+
+            if removed:
+                stats["similarities_removed"] = await PostIndexService._remove_posts(
+                    db, client_id, removed
+                )
+
+            if changed:
+                since = datetime.utcnow() - timedelta(days=data_retention_service.raw_data_retention_days)
+                rescored = await similarity_batch_service.rescore_posts(
+                    db, client_id, [post.id for post in changed], since=since
+                )
+                stats["rescored"] = rescored["answers"]
+
+        await db.commit()
+
+        if similarity_engine.index_backend == "ivf":
+            similarity_engine.update_ivf_index(client_id, embeddings, removed)
+
+        stats["indexed"] = len(embeddings)
+        stats["removed"] = len(removed)
+
+        logger.info(
+            "Posts indexed",
+            client_id=client_id,
+            changed=len(changed),
+            **stats,
+        )
+
+        return stats
+
+    @staticmethod
+    async def _changed_posts(
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> List[models.Post]:
+        """
+        Posts whose content differs from their stored fingerprint, or that have none
+        """
+        from app.services.similarity_service import similarity_engine
+
+        if not posts:
+            return []
+
+        result = await db.execute(
+            select(
+                models.PostFingerprint.post_id,
+                models.PostFingerprint.content_hash,
+            ).where(
+                models.PostFingerprint.client_id == client_id,
+                models.PostFingerprint.post_id.in_([post.id for post in posts])
+            )
+        )
+        stored_hashes = dict(result.all())
+
+        return [
+            post for post in posts
+            if stored_hashes.get(post.id) != similarity_engine._content_hash(post.content)
+        ]
+
+    @staticmethod
+    async def _remove_posts(
+        db: AsyncSession,
+        client_id: int,
+        post_ids: List[str],
+    ) -> int:
+        """
+        Bulk-delete similarity rows and lexical fingerprints of unpublished posts
+
+        Embeddings and passages are kept, so a republished post is not re-embedded.
+        """
+        from app.services.similarity_service import similarity_engine
+
+        client_answers = select(models.Answer.id).join(
+            models.Run, models.Answer.run_id == models.Run.id
+        ).where(models.Run.client_id == client_id)
+        matching = and_(
+            models.Similarity.post_id.in_(post_ids),
+            models.Similarity.answer_id.in_(client_answers)
+        )
+
+        result = await db.execute(
+            select(func.distinct(models.Similarity.answer_id)).where(matching)
+        )
+        affected = result.scalars().all()
+
+        result = await db.execute(delete(models.Similarity).where(matching))
+        if affected:
+            await similarity_engine.update_best_similarity(db, affected)
+        await db.execute(
+            delete(models.PostFingerprint).where(
+                models.PostFingerprint.client_id == client_id,
+                models.PostFingerprint.post_id.in_(post_ids)
+            )
+        )
+
+        return result.rowcount
+
+
+# Create service instance
+post_index_service = PostIndexService()
@@ -245,6 +245,32 @@ class PostService:
             )
             raise
 
+    @staticmethod
+    async def index_synced_posts(
+        client_id: int,
+        post_ids: List[str],
+    ) -> None:
+        """
+        Refresh embeddings and the similarity index for synced posts
+
+        Run as a background task once the sync has committed, in its own
+        tenant session. Failures are logged rather than raised.
+        """
+        from app.db.session import TenantScopedSession
+        from app.services.post_index_service import post_index_service
+
+        try:
+            async with TenantScopedSession(client_id) as db:
+                await post_index_service.index_posts(db, client_id, post_ids)
+        except Exception as e:
+            logger.error(
+                "Post indexing after sync failed",
+                client_id=client_id,
+                posts=len(post_ids),
+                error=str(e),
+                exc_info=True,
+            )
+
     @staticmethod
     async def get_sync_status(
         db: AsyncSession,
@@ -0,0 +1,317 @@
+"""
+Report service for KPI reports over date ranges
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import datetime, date, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, true, union_all
+import structlog
+
+from app import models
+from app.services.kpi_service import COUNT_FIELDS, ROLLUP_PERIODS, kpi_service
+
+logger = structlog.get_logger(__name__)
+
+
+class ReportService:
+    """
+    Service for building KPI reports from daily metrics and their rollups
+    """
+
+    def __init__(self):
+        self.top_citations_limit = 10
+        self.cache_size = 256
+        self.cache_ttl_seconds = 600
+        self._reports: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    async def get_report(
+        self,
+        db: AsyncSession,
+        client: models.Client,
+        date_from: date,
+        date_to: date,
+        engines: Optional[List[str]] = None,
+        topics: Optional[List[str]] = None,
+        today: Optional[date] = None,
+    ) -> Dict[str, Any]:
+        """
+        KPIs of a client over an inclusive date range, overall and per engine and topic
+
+        The visibility index is derived from the stored counts with the
+        client's current weight profile. Reports on ranges that have ended
+        are cached per worker, keyed on the profile version and a stamp of
+        the stored metrics and rollups, so a weight change or a recompute
+        by any process is visible at once.
+        """
+        today = today or date.today()
+        version, weights = await kpi_service.get_weight_profile(db, client.id)
+
+        # Days still collecting runs would go stale in the cache
+        cacheable = date_to < today
+        key = (
+            client.id, version, date_from, date_to,
+            tuple(sorted(engines or [])), tuple(sorted(topics or [])),
+            await self._data_stamp(db, client.id, date_from, date_to) if cacheable else None,
+        )
+        cached = self._reports.get(key)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl_seconds:
+            self._reports.move_to_end(key)
+            return {**cached[1], "generated_at": datetime.utcnow()}
+
+        report = await self._build_report(db, client, date_from, date_to, engines, topics, today, weights)
+        report["weights_version"] = version
+
+        if cacheable:
+            self._reports[key] = (time.monotonic(), report)
+            self._reports.move_to_end(key)
+            while len(self._reports) > self.cache_size:
+                self._reports.popitem(last=False)
+
+        return {**report, "generated_at": datetime.utcnow()}
+
+    async def _data_stamp(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        date_from: date,
+        date_to: date,
+    ) -> Tuple:
+        """
+        Latest change and row counts of the daily metrics and rollups a range can read
+
+        Metric writes set updated_at and rollups are rewritten as new rows,
+        so any recompute, backfill or recorded run changes the stamp.
+        """
+        start = datetime.combine(date_from, datetime.min.time())
+        end = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+
+        metrics = select(
+            func.max(models.Metric.updated_at), func.count(models.Metric.id)
+        ).where(
+            models.Metric.client_id == client_id,
+            models.Metric.date >= start,
+            models.Metric.date < end
+        ).subquery()
+        rollups = select(
+            func.max(models.MetricRollup.id), func.count(models.MetricRollup.id)
+        ).where(
+            models.MetricRollup.client_id == client_id,
+            models.MetricRollup.period_start >= start,
+            models.MetricRollup.period_start < end
+        ).subquery()
+
+        # One row each, joined into a single round trip
+        result = await db.execute(select(metrics, rollups).select_from(metrics.join(rollups, true())))
+        return tuple(result.one())
+
+    async def _build_report(
+        self,
+        db: AsyncSession,
+        client: models.Client,
+        date_from: date,
+        date_to: date,
+        engines: Optional[List[str]],
+        topics: Optional[List[str]],
+        today: date,
+        weights: Dict[str, float],
+    ) -> Dict[str, Any]:
+        """
+        Sum the segments' counts and derive the report's KPIs with the given weights
+        """
+        segments = self.plan_segments(date_from, date_to, today)
+
+        logger.info(
+            "Building report",
+            client_id=client.id,
+            date_from=date_from,
+            date_to=date_to,
+            segments=[source for source, _, _ in segments]
+        )
+
+        # Every segment's counts in one round trip
+        result = await db.execute(union_all(*[
+            self._segment_query(client.id, source, start, end, engines, topics)
+            for source, start, end in segments
+        ]))
+
+        overall = self._empty_counts()
+        by_engine: Dict[str, Dict[str, int]] = {}
+        by_topic: Dict[str, Dict[str, int]] = {}
+        for row in result.all():
+            for counts in (
+                overall,
+                by_engine.setdefault(row.engine, self._empty_counts()),
+                by_topic.setdefault(row.topic or "", self._empty_counts()),
+            ):
+                for field in COUNT_FIELDS:
+                    counts[field] += getattr(row, field) or 0
+
+        return {
+            "client_id": client.id,
+            "client_name": client.name,
+            "date_from": datetime.combine(date_from, datetime.min.time()),
+            "date_to": datetime.combine(date_to, datetime.min.time()),
+            "metrics": self._kpi_metrics(overall, weights),
+            "engine_breakdown": {engine: self._kpi_metrics(c, weights) for engine, c in by_engine.items()},
+            "topic_breakdown": {topic: self._kpi_metrics(c, weights) for topic, c in by_topic.items()},
+            "top_citations": await self._top_citations(db, client.id, date_from, date_to, engines, topics),
+            "weights": weights,
+        }
+
+    def plan_segments(
+        self,
+        date_from: date,
+        date_to: date,
+        today: Optional[date] = None,
+    ) -> List[Tuple[str, date, date]]:
+        """
+        Split an inclusive date range into the coarsest stored aggregates covering it
+
+        Whole months come from month rollups, whole weeks in the remaining
+        gaps from week rollups, and leftover days from daily metrics. Only
+        periods that ended before today are read from rollups, since the
+        current ones are still changing. Each segment is (source, start, end)
+        with end exclusive and source month, week or day.
+        """
+        return self._plan(
+            date_from,
+            date_to + timedelta(days=1),
+            tuple(reversed(ROLLUP_PERIODS)),
+            today or date.today(),
+        )
+
+    def _plan(
+        self,
+        start: date,
+        end: date,
+        periods: Tuple[str, ...],
+        today: date,
+    ) -> List[Tuple[str, date, date]]:
+        if start >= end:
+            return []
+        if not periods:
+            return [("day", start, end)]
+
+        period, finer = periods[0], periods[1:]
+        first, next_start = kpi_service.period_bounds(period, start)
+        if first < start:
+            first = next_start
+
+        # Whole closed periods are contiguous, so the gaps are at either end
+        segments: List[Tuple[str, date, date]] = []
+        cursor = first
+        while True:
+            period_start, period_end = kpi_service.period_bounds(period, cursor)
+            if period_end > end or period_end > today:
+                break
+            segments.append((period, period_start, period_end))
+            cursor = period_end
+
+        if not segments:
+            return self._plan(start, end, finer, today)
+
+        return (
+            self._plan(start, first, finer, today)
+            + segments
+            + self._plan(cursor, end, finer, today)
+        )
+
+    def _segment_query(
+        self,
+        client_id: int,
+        source: str,
+        start: date,
+        end: date,
+        engines: Optional[List[str]],
+        topics: Optional[List[str]],
+    ):
+        """
+        Summed counts per engine and topic for one segment
+        """
+        start_date = datetime.combine(start, datetime.min.time())
+
+        if source == "day":
+            engine, topic = models.Metric.engine, models.Query.topic
+            query = select(
+                engine, topic, *[func.sum(getattr(models.Metric, f)).label(f) for f in COUNT_FIELDS]
+            ).join(
+                models.Query, models.Metric.query_id == models.Query.id
+            ).where(
+                models.Metric.client_id == client_id,
+                models.Metric.date >= start_date,
+                models.Metric.date < datetime.combine(end, datetime.min.time())
+            )
+        else:
+            engine, topic = models.MetricRollup.engine, models.MetricRollup.topic
+            query = select(
+                engine, topic, *[func.sum(getattr(models.MetricRollup, f)).label(f) for f in COUNT_FIELDS]
+            ).where(
+                models.MetricRollup.client_id == client_id,
+                models.MetricRollup.period == source,
+                models.MetricRollup.period_start == start_date
+            )
+
+        if engines:
+            query = query.where(engine.in_(engines))
+        if topics:
+            query = query.where(topic.in_(topics))
+
+        return query.group_by(engine, topic)
+
+    async def _top_citations(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        date_from: date,
+        date_to: date,
+        engines: Optional[List[str]],
+        topics: Optional[List[str]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Most cited domains in the range's answers
+        """
+        count = func.count(models.Citation.id)
+        query = select(models.Citation.domain, count).join(
+            models.Answer, models.Citation.answer_id == models.Answer.id
+        ).join(
+            models.Run, models.Answer.run_id == models.Run.id
+        ).where(
+            models.Run.client_id == client_id,
+            models.Run.created_at >= datetime.combine(date_from, datetime.min.time()),
+            models.Run.created_at <= datetime.combine(date_to, datetime.max.time())
+        )
+        if engines:
+            query = query.where(models.Run.engine.in_(engines))
+        if topics:
+            query = query.join(
+                models.Query, models.Run.query_id == models.Query.id
+            ).where(models.Query.topic.in_(topics))
+
+        result = await db.execute(
+            query.group_by(models.Citation.domain).order_by(count.desc()).limit(self.top_citations_limit)
+        )
+        return [{"domain": domain, "citations": citations} for domain, citations in result.all()]
+
+    def _kpi_metrics(self, counts: Dict[str, int], weights: Dict[str, float]) -> Dict[str, Any]:
+        """
+        Rates derived from summed counts, with the supporting totals
+        """
+        return {
+            **kpi_service.rates_from_counts(counts, weights),
+            "total_queries": counts["total_queries"],
+            "successful_runs": counts["successful_runs"],
+            "total_citations": counts["total_citations"],
+            "client_mentions": counts["client_mentions"],
+        }
+
+    @staticmethod
+    def _empty_counts() -> Dict[str, int]:
+        return {field: 0 for field in COUNT_FIELDS}
+
+
+# Create service instance
+report_service = ReportService()
@@ -2,11 +2,14 @@
 Search service for orchestrating AI engine collectors
 """
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Pattern, Tuple
 from datetime import datetime
 import hashlib
+import re
+import time
 
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 import structlog
 
 from app import models, schemas
@@ -16,6 +19,19 @@ from app.core.config import settings
 logger = structlog.get_logger(__name__)
 
 
+def _word_pattern(names: List[str]) -> Optional[Pattern]:
+    """
+    Case-insensitive pattern matching any of the names as whole words
+    """
+    names = [name.strip() for name in names if name and name.strip()]
+    if not names:
+        return None
+    return re.compile(
+        r"(?<!\w)(?:" + "|".join(re.escape(name) for name in names) + r")(?!\w)",
+        re.IGNORECASE
+    )
+
+
 class SearchService:
     """
     Service for managing search runs across multiple AI engines
@@ -23,6 +39,8 @@ class SearchService:
 
     def __init__(self):
         self.collector_factory = CollectorFactory()
+        self.matcher_ttl_seconds = 300
+        self._matchers: Dict[int, Tuple[float, Tuple[str, Optional[Pattern], Optional[Pattern]]]] = {}
 
     async def run_search(
         self,
@@ -33,6 +51,8 @@ class SearchService:
         """
         Execute a search run using the specified engine
         """
+        from app.services.kpi_service import kpi_service
+
         try:
             logger.info(
                 "Starting search run",
@@ -65,6 +85,7 @@ class SearchService:
             run.status = "completed"
             run.completed_at = datetime.utcnow()
             db.add(run)
+            await kpi_service.record_run(db, run)
             await db.commit()
 
             logger.info(
@@ -90,6 +111,7 @@ class SearchService:
             run.error_message = str(e)
             run.completed_at = datetime.utcnow()
             db.add(run)
+            await kpi_service.record_run(db, run)
             await db.commit()
 
             raise
@@ -128,6 +150,10 @@ class SearchService:
             )
             db.add(citation)
 
+        # KPI inputs, so metrics never rescan the answer text
+        matchers = await self._client_matchers(db, run.client_id)
+        db.add(self._answer_features(run, answer, result.citations, matchers))
+
         # Store entities
         for entity_data in result.entities:
             entity = models.Entity(
@@ -142,6 +168,62 @@ class SearchService:
 
         await db.commit()
 
+    async def _client_matchers(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> Tuple[str, Optional[Pattern], Optional[Pattern]]:
+        """
+        Client domain and its name and entity name patterns, cached for a few minutes
+        """
+        cached = self._matchers.get(client_id)
+        if cached is not None and time.monotonic() - cached[0] < self.matcher_ttl_seconds:
+            return cached[1]
+
+        result = await db.execute(
+            select(models.Client.name, models.Client.domain).where(
+                models.Client.id == client_id
+            )
+        )
+        client_name, client_domain = result.one()
+
+        result = await db.execute(
+            select(models.WordPressEntity.name).where(
+                models.WordPressEntity.client_id == client_id
+            )
+        )
+        matchers = (client_domain, _word_pattern([client_name]), _word_pattern(result.scalars().all()))
+
+        self._matchers[client_id] = (time.monotonic(), matchers)
+        return matchers
+
+    def _answer_features(
+        self,
+        run: models.Run,
+        answer: models.Answer,
+        citations: List[Dict[str, Any]],
+        matchers: Tuple[str, Optional[Pattern], Optional[Pattern]],
+    ) -> models.AnswerFeature:
+        """
+        Compute the per-answer citation and mention flags used by KPIs
+
+        Names match as whole words, so "Acme" is not found in "Acmeville".
+        """
+        client_domain, client_pattern, entity_pattern = matchers
+        text = answer.raw_response or ""
+        domains = {citation["domain"] for citation in citations}
+
+        return models.AnswerFeature(
+            client_id=run.client_id,
+            answer_id=answer.id,
+            cites_client=client_domain in domains,
+            cited_domains=len(domains),
+            citation_count=len(citations),
+            mentions_client=bool(client_pattern and client_pattern.search(text)),
+            mentions_entity=bool(entity_pattern and entity_pattern.search(text)),
+            best_similarity=None,  # Set once similarities are computed
+        )
+
     def _normalize_response(self, raw_response: str) -> Optional[str]:
         """
         Normalize the response text for comparison
@@ -180,5 +262,4 @@ class SearchService:
 
 
 # Create service instance
-search_service = SearchService()</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/search_service.py
\ No newline at end of file
+search_service = SearchService()
@@ -0,0 +1,381 @@
+"""
+Bulk similarity scoring: re-score stored answers against a client's posts
+
+Run from the command line with
+    python -m app.services.similarity_batch_service --client 42 --since 2024-01-01
+or without --client to re-score every active client.
+"""
+
+import argparse
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, update
+import structlog
+
+from app import models
+from app.core.config import settings
+from app.services.text import BM25Index, LSHIndex, term_counts, tokenize
+from app.services.text.shingles import word_hashes
+from app.services.vector_index import CorpusMatrix, QuantizedMatrix, select_top_k
+
+logger = structlog.get_logger(__name__)
+
+
+@dataclass
+class ClientCorpus:
+    """A client's posts and their derived matrices, loaded once per bulk job"""
+
+    posts: Dict[str, models.Post]
+    documents: Union[CorpusMatrix, QuantizedMatrix]
+    post_shingles: Dict[str, np.ndarray]
+    lsh: LSHIndex
+    passages: List[models.PostPassage]
+    passage_matrix: CorpusMatrix
+    passage_ranges: Dict[str, Tuple[int, int]]
+    bm25: Optional[BM25Index] = None
+    document_rows: Dict[str, int] = field(init=False)
+
+    def __post_init__(self):
+        self.document_rows = {post_id: row for row, post_id in enumerate(self.documents.ids)}
+
+
+class SimilarityBatchService:
+    """
+    Service for scoring many answers at once with block matrix products
+    """
+
+    def __init__(self, engine=None):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        """Similarity engine whose thresholds and stores are used"""
+        if self._engine is None:
+            from app.services.similarity_service import similarity_engine
+            self._engine = similarity_engine
+        return self._engine
+
+    async def rescore_client(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """
+        Re-score a client's stored answers, replacing their similarity rows
+
+        Answers are paged in chunks of SIMILARITY_BATCH_ANSWERS. Each chunk
+        is embedded in batch requests (stored embeddings are reused), scored
+        against the whole corpus in memory-capped blocks and bulk-inserted.
+        """
+        with self.engine.model_pass():
+            try:
+                logger.info("Bulk similarity scoring started", client_id=client_id)
+
+                corpus = await self.load_corpus(db, client_id)
+                version = await self.engine.similarity_version(db, client_id)
+                stats = await self._score_stream(db, client_id, corpus, since, until, version=version)
+
+                await db.commit()
+
+                logger.info("Bulk similarity scoring completed", client_id=client_id, **stats)
+
+                return stats
+
+            except Exception as e:
+                await db.rollback()
+                logger.error(
+                    "Bulk similarity scoring failed",
+                    client_id=client_id,
+                    error=str(e),
+                    exc_info=True
+                )
+                raise
+
+    async def rescore_posts(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        post_ids: List[str],
+        since: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """
+        Re-score stored answers against changed posts only, replacing those posts' rows
+
+        Candidates are still chosen against the whole corpus, so the changed
+        posts' rows equal a full re-score's. Other posts' rows are kept as
+        they are: when a changed post enters or leaves an answer's top_k or
+        BM25_TOP_N shortlist and pushes another post out or in, that post's
+        row stays stale or missing until the next rescore_client. The
+        caller commits.
+        """
+        corpus = await self.load_corpus(db, client_id, post_ids)
+        if not corpus.posts:
+            return {"answers": 0, "similarities": 0}
+
+        return await self._score_stream(db, client_id, corpus, since, None, list(corpus.posts))
+
+    async def _score_stream(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        corpus: ClientCorpus,
+        since: Optional[datetime],
+        until: Optional[datetime],
+        post_ids: Optional[List[str]] = None,
+        version: Optional[str] = None,
+    ) -> Dict[str, int]:
+        """
+        Page through a client's answers in chunks and score each chunk
+
+        Chunks are fetched by keyset on the answer id, one query each, so the
+        connection is free for the chunk's writes between fetches. A full
+        re-score records the corpus version on the answers, so later
+        identical answers can reuse their rows.
+        """
+        stats = {"answers": 0, "similarities": 0}
+
+        query = select(models.Answer).join(
+            models.Run, models.Answer.run_id == models.Run.id
+        ).where(models.Run.client_id == client_id)
+        if since:
+            query = query.where(models.Answer.created_at >= since)
+        if until:
+            query = query.where(models.Answer.created_at < until)
+        query = query.order_by(models.Answer.id).limit(settings.SIMILARITY_BATCH_ANSWERS)
+
+        last_id = None
+        while True:
+            page = query if last_id is None else query.where(models.Answer.id > last_id)
+            answers = list((await db.execute(page)).scalars().all())
+            if not answers:
+                break
+
+            stats["similarities"] += await self.score_answers(
+                db, client_id, corpus, answers, post_ids
+            )
+            stats["answers"] += len(answers)
+            last_id = answers[-1].id
+
+            if version:
+                await db.execute(
+                    update(models.Answer).where(
+                        models.Answer.id.in_([answer.id for answer in answers])
+                    ).values(similarity_corpus_version=version)
+                )
+
+        return stats
+
+    async def load_corpus(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        post_ids: Optional[List[str]] = None,
+    ) -> ClientCorpus:
+        """
+        Load a client's posts, embeddings, shingles and passages once for a job
+
+        With post_ids only those posts are scored; the document matrix and
+        lexical indexes still cover every post, to rank candidates.
+        """
+        engine = self.engine
+
+        posts = await engine._get_client_posts(db, client_id)
+        await engine.sync_post_fingerprints(db, client_id, posts)
+        documents = await engine.get_corpus_matrix(db, client_id, posts)
+
+        if post_ids is not None:
+            targets = set(post_ids)
+            posts = [post for post in posts if post.id in targets]
+
+        post_shingles = await engine._get_post_shingles(db, client_id, posts)
+        passages, passage_matrix, passage_ranges = engine._passage_matrix(
+            await engine.get_post_passages(db, client_id, posts)
+        )
+        lsh = await engine.get_lsh_index(db, client_id)
+        bm25 = await engine.get_bm25_index(db, client_id) if "bm25" in engine.stages else None
+
+        return ClientCorpus(
+            posts={post.id: post for post in posts},
+            documents=documents,
+            post_shingles=post_shingles,
+            lsh=lsh,
+            passages=passages,
+            passage_matrix=passage_matrix,
+            passage_ranges=passage_ranges,
+            bm25=bm25,
+        )
+
+    async def score_answers(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        corpus: ClientCorpus,
+        answers: List[models.Answer],
+        post_ids: Optional[List[str]] = None,
+    ) -> int:
+        """
+        Score a chunk of answers and replace their similarity rows in bulk
+
+        With post_ids only the rows for those posts are replaced.
+        """
+        if not answers:
+            return 0
+
+        embeddings = await self.engine.get_answer_embeddings(db, client_id, answers)
+        vectors = [embeddings[answer.id] for answer in answers]
+
+        rows = []
+        for start, document_scores, passage_scores in self._score_blocks(corpus, vectors):
+            for offset in range(len(document_scores)):
+                rows.extend(self._answer_rows(
+                    corpus,
+                    answers[start + offset],
+                    document_scores[offset],
+                    passage_scores[offset],
+                ))
+
+        # Replace earlier results for these answers
+        stale = delete(models.Similarity).where(
+            models.Similarity.answer_id.in_([answer.id for answer in answers])
+        )
+        if post_ids is not None:
+            stale = stale.where(models.Similarity.post_id.in_(post_ids))
+        await db.execute(stale)
+        if rows:
+            await db.execute(insert(models.Similarity), rows)
+        await self.engine.update_best_similarity(db, [answer.id for answer in answers])
+
+        return len(rows)
+
+    def _block_size(self, columns: int) -> int:
+        """
+        Answers per block so a float32 (answers x columns) block fits the memory cap
+        """
+        cap_bytes = settings.SIMILARITY_BATCH_MEMORY_MB * 1024 * 1024
+        return max(1, cap_bytes // (4 * max(1, columns)))
+
+    def _score_blocks(
+        self,
+        corpus: ClientCorpus,
+        vectors: Sequence[Sequence[float]],
+    ) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Document and passage score matrices for consecutive blocks of answers
+        """
+        block = self._block_size(len(corpus.documents) + len(corpus.passage_matrix))
+
+        for start in range(0, len(vectors), block):
+            chunk = vectors[start:start + block]
+            yield (
+                start,
+                corpus.documents.score_many(chunk),
+                corpus.passage_matrix.score_many(chunk),
+            )
+
+    def _answer_rows(
+        self,
+        corpus: ClientCorpus,
+        answer: models.Answer,
+        document_scores: np.ndarray,
+        passage_scores: np.ndarray,
+    ) -> List[Dict[str, Any]]:
+        """
+        Similarity rows for one answer from its row of the block score matrices
+        """
+        engine = self.engine
+        answer_shingles = engine._shingles(answer.raw_response)
+
+        # Same candidates as the per-answer path, from the configured stages
+        shortlist = None
+        if "bm25" in engine.stages:
+            answer_terms = term_counts(answer.raw_response)[0]
+            shortlist = set(engine._bm25_shortlist(corpus.bm25, answer_terms))
+
+        embedding_scores: Dict[str, float] = {}
+        if "embedding" in engine.stages:
+            scores = document_scores
+            if shortlist is not None:
+                rows = [corpus.document_rows[post_id] for post_id in shortlist if post_id in corpus.document_rows]
+                scores = np.full_like(document_scores, -np.inf)
+                scores[rows] = document_scores[rows]
+
+            nearest = select_top_k(scores, engine.top_k, engine.min_similarity)
+            embedding_scores = {
+                corpus.documents.ids[i]: float(document_scores[i]) for i in nearest
+            }
+
+        lexical = set()
+        if "lsh" in engine.stages:
+            lexical = engine._lexical_shortlist(corpus.lsh, answer_shingles)
+
+        candidates = [
+            corpus.posts[post_id]
+            for post_id in sorted(engine._merge_candidates(shortlist, embedding_scores, lexical))
+            if post_id in corpus.posts
+        ]
+
+        passage_matches = engine._best_passages(
+            corpus.passages,
+            passage_scores,
+            corpus.passage_ranges,
+            answer_shingles,
+            [post.id for post in candidates],
+        )
+
+        return engine._score_posts(
+            answer,
+            answer_shingles,
+            np.unique(word_hashes(tokenize(answer.raw_response))),
+            candidates,
+            embedding_scores,
+            corpus.post_shingles,
+            passage_matches,
+        )
+
+
+# Create service instance
+similarity_batch_service = SimilarityBatchService()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Re-score stored answers of the given clients, or of every active client"""
+    parser = argparse.ArgumentParser(description="Re-score stored answers against client posts")
+    parser.add_argument("--client", dest="client_ids", type=int, action="append",
+                        help="Client id, repeatable (default: all active clients)")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Answers created at or after")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Answers created before")
+    args = parser.parse_args(argv)
+
+    async def run() -> Dict[str, int]:
+        from app.db.session import TenantScopedSession
+        from app.services.kpi_service import kpi_service
+
+        client_ids = args.client_ids or await kpi_service._active_client_ids()
+        totals = {"clients": 0, "answers": 0, "similarities": 0}
+
+        # One client at a time, so embedding requests stay within rate limits
+        try:
+            for client_id in client_ids:
+                async with TenantScopedSession(client_id) as db:
+                    stats = await similarity_batch_service.rescore_client(db, client_id, args.since, args.until)
+                totals["clients"] += 1
+                totals["answers"] += stats["answers"]
+                totals["similarities"] += stats["similarities"]
+        finally:
+            await similarity_batch_service.engine.provider.close()
+
+        return totals
+
+    summary = asyncio.run(run())
+    logger.info("Similarity rescore command finished", **summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,41 @@
 """
 Similarity engine for matching AI responses to WordPress content
+
+Fit the shared local embedding model from the command line with
+    python -m app.services.similarity_service
 """
 
-from typing import List, Dict, Any, Optional, Tuple
-import math
-from collections import Counter
+from typing import List, Dict, Any, Callable, Optional, Tuple, Union
+import argparse
+import asyncio
+import hashlib
+import time
+from contextlib import contextmanager
+from pathlib import Path
 
-import openai
-from openai import AsyncOpenAI
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, delete, func, insert, literal, update
 import structlog
 
 from app import models
 from app.core.config import settings
+from app.services.embeddings import EmbeddingMicroBatcher, EmbeddingProviderFactory
+from app.services.text import (
+    BM25Index, LSHIndex, MinHasher, jaccard, shingle_set, split_passages, term_counts, tokenize,
+)
+from app.services.text.shingles import from_bytes, ngram_hashes, to_bytes, word_hashes
+from app.services.vector_index import CorpusMatrix, IVFIndex, QuantizedMatrix
 
 logger = structlog.get_logger(__name__)
 
+# LSH shortlist keeps posts whose estimated Jaccard is within this margin
+# of the threshold (about two standard errors for 128-permutation MinHash)
+JACCARD_ESTIMATE_MARGIN = 0.07
+
+# Candidate stages: bm25 prefilters the corpus, embedding and lsh add candidates
+SIMILARITY_STAGES = ("bm25", "embedding", "lsh")
+
 
 class SimilarityEngine:
     """
@@ -24,10 +43,120 @@ class SimilarityEngine:
     """
 
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
-        self.model = settings.OPENAI_MODEL or "text-embedding-3-small"
+        self.provider = EmbeddingProviderFactory.create_provider(settings.EMBEDDING_PROVIDER)
+        # Concurrent answers share provider calls
+        self.embedding_queue = EmbeddingMicroBatcher(self.provider)
         self.similarity_threshold = 0.82  # Cosine similarity threshold
         self.jaccard_threshold = 0.15     # Jaccard n-gram threshold as backup
+        self.top_k = settings.SIMILARITY_TOP_K  # Max embedding matches per answer
+        self.index_backend = settings.SIMILARITY_INDEX_BACKEND
+        self.matrix_dtype = settings.SIMILARITY_MATRIX_DTYPE
+        self.stages = self._parse_stages(settings.SIMILARITY_STAGES)
+        self.bm25_top_n = settings.BM25_TOP_N
+        self._check_vector_dimensions()
+        # Scoring passes in flight; the model version only moves between passes
+        self._passes = 0
+
+        # Per-client post embedding matrices, keyed by corpus version
+        self._corpus_cache: Dict[int, Tuple[str, Union[CorpusMatrix, QuantizedMatrix]]] = {}
+        # Corpus versions already fully present in the pgvector table
+        self._indexed_versions: Dict[int, str] = {}
+        # Per-client IVF indexes, keyed by on-disk version
+        self._ivf_cache: Dict[int, Tuple[str, IVFIndex]] = {}
+
+        self.minhasher = MinHasher()
+        # Per-client LSH indexes, keyed by the fingerprint table's (count, max id)
+        self._lsh_cache: Dict[int, Tuple[Tuple[int, int], LSHIndex]] = {}
+        # Corpus versions whose fingerprints are all stored
+        self._fingerprinted_versions: Dict[int, str] = {}
+        # Per-client BM25 indexes, keyed like the LSH indexes
+        self._bm25_cache: Dict[int, Tuple[Tuple[int, int], BM25Index]] = {}
+
+        # Per-stage (calls, total ms, max ms) since startup
+        self._stage_totals: Dict[str, List[float]] = {}
+
+    @property
+    def model(self) -> str:
+        """Embedding model name stored with every vector"""
+        return self.provider.model
+
+    @property
+    def min_similarity(self) -> float:
+        """Lowest score that is stored as a similarity"""
+        return min(self.similarity_threshold, self.jaccard_threshold)
+
+    def _check_vector_dimensions(self) -> None:
+        """
+        Reject a provider whose vectors do not fit the pgvector column
+        """
+        if (
+            self.index_backend == "pgvector"
+            and self.provider.dimensions != settings.EMBEDDING_DIMENSIONS
+        ):
+            raise ValueError(
+                f"Embedding model {self.model} produces {self.provider.dimensions}-dimension "
+                f"vectors but the pgvector column holds {settings.EMBEDDING_DIMENSIONS}"
+            )
+
+    @contextmanager
+    def model_pass(self):
+        """
+        Pin the embedding model version for one scoring pass
+
+        A refitted model is picked up once no pass is in flight, so the
+        vectors of one pass all come from the same version.
+        """
+        if not self._passes:
+            self.provider.refresh()
+        self._passes += 1
+        try:
+            yield
+        finally:
+            self._passes -= 1
+
+    @staticmethod
+    def _parse_stages(value: str) -> List[str]:
+        """
+        Validate the configured candidate stages
+        """
+        stages = [stage.strip().lower() for stage in value.split(",") if stage.strip()]
+
+        if not stages or set(stages) - set(SIMILARITY_STAGES):
+            raise ValueError(f"Unsupported similarity stages: {value}")
+        if "bm25" in stages and stages[0] != "bm25":
+            raise ValueError("The bm25 prefilter must be the first similarity stage")
+
+        return stages
+
+    @contextmanager
+    def _stage(self, name: str, timings: Dict[str, float]):
+        """
+        Time a pipeline stage into an answer's timings and the running totals
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            timings[name] = timings.get(name, 0.0) + elapsed_ms
+
+            totals = self._stage_totals.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed_ms
+            totals[2] = max(totals[2], elapsed_ms)
+
+    def stage_timings(self) -> Dict[str, Dict[str, float]]:
+        """
+        Calls, mean and max milliseconds of each pipeline stage since startup
+        """
+        return {
+            name: {
+                "calls": int(calls),
+                "mean_ms": round(total / calls, 3),
+                "max_ms": round(peak, 3),
+            }
+            for name, (calls, total, peak) in self._stage_totals.items()
+        }
 
     async def compute_similarities(
         self,
@@ -37,88 +166,275 @@ class SimilarityEngine:
         """
         Compute similarities between an answer and all WordPress posts for its client
         """
-        try:
-            logger.info(
-                "Computing similarities",
-                answer_id=answer.id,
-                client_id=answer.run.client_id
-            )
+        with self.model_pass():
+            try:
+                logger.info(
+                    "Computing similarities",
+                    answer_id=answer.id,
+                    client_id=answer.run.client_id
+                )
 
-            # Get all posts for this client
-            posts = await self._get_client_posts(db, answer.run.client_id)
+                client_id = answer.run.client_id
+                timings: Dict[str, float] = {}
 
-            similarities = []
+                # Identical answers scored against the same corpus get the same rows
+                reused = await self._reuse_similarities(db, client_id, answer)
+                if reused is not None:
+                    await db.commit()
 
-            # Get embedding for the answer
-            answer_embedding = await self._get_embedding(answer.raw_response)
+                    logger.info(
+                        "Similarities reused",
+                        answer_id=answer.id,
+                        similarities_found=len(reused)
+                    )
 
-            for post in posts:
-                # Compute similarity scores
-                embedding_similarity = await self._compute_embedding_similarity(
-                    answer_embedding, post.content
-                )
+                    return reused
+
+                # Get embedding for the answer (stored for later re-scoring)
+                with self._stage("answer_embedding", timings):
+                    answer_embedding = (await self.get_answer_embeddings(db, client_id, [answer]))[answer.id]
 
-                jaccard_similarity = self._compute_jaccard_similarity(
-                    answer.raw_response, post.content
+                # Answer shingle, word and term hashes are built once and reused for every candidate
+                answer_shingles = self._shingles(answer.raw_response)
+                answer_words = np.unique(word_hashes(tokenize(answer.raw_response)))
+                answer_terms = term_counts(answer.raw_response)[0]
+
+                # Candidate posts from the configured stages
+                posts, embedding_scores = await self._candidate_posts(
+                    db, client_id, answer_embedding, answer_shingles, answer_terms, timings
                 )
 
-                # Use embedding similarity as primary, Jaccard as backup
-                final_similarity = embedding_similarity
-                similarity_type = "embedding"
-
-                if embedding_similarity < self.similarity_threshold:
-                    # If embedding similarity is too low, try Jaccard
-                    if jaccard_similarity >= self.jaccard_threshold:
-                        final_similarity = jaccard_similarity
-                        similarity_type = "ngram"
-                    else:
-                        final_similarity = max(embedding_similarity, jaccard_similarity)
-                        similarity_type = "combined"
-
-                # Only store if similarity meets minimum threshold
-                if final_similarity >= min(self.similarity_threshold, self.jaccard_threshold):
-                    # Find matched text (simple approach)
-                    matched_text = self._find_matched_text(
-                        answer.raw_response, post.content, similarity_type
+                # Best-matching passage of every candidate, scored in one matrix product
+                with self._stage("passages", timings):
+                    passage_matches = self._match_passages(
+                        answer_embedding,
+                        answer_shingles,
+                        await self.get_post_passages(db, client_id, posts),
                     )
 
-                    similarity = models.Similarity(
-                        answer_id=answer.id,
-                        post_id=post.id,
-                        similarity_score=float(final_similarity),
-                        similarity_type=similarity_type,
-                        matched_text=matched_text,
-                        metadata_json={
-                            "embedding_similarity": float(embedding_similarity),
-                            "jaccard_similarity": float(jaccard_similarity),
-                            "answer_length": len(answer.raw_response),
-                            "post_length": len(post.content),
-                        }
-                    )
-                    similarities.append(similarity)
+                with self._stage("scoring", timings):
+                    post_shingles = await self._get_post_shingles(db, client_id, posts)
+                    similarities = [
+                        models.Similarity(**row)
+                        for row in self._score_posts(
+                            answer, answer_shingles, answer_words, posts,
+                            embedding_scores, post_shingles, passage_matches,
+                        )
+                    ]
 
-            # Store similarities in database
-            for similarity in similarities:
-                db.add(similarity)
+                # Store similarities in database
+                for similarity in similarities:
+                    db.add(similarity)
+                await self.update_best_similarity(db, [answer.id])
+                answer.similarity_corpus_version = await self.similarity_version(db, client_id)
 
-            await db.commit()
+                await db.commit()
 
-            logger.info(
-                "Similarities computed",
-                answer_id=answer.id,
-                similarities_found=len(similarities)
-            )
+                logger.info(
+                    "Similarities computed",
+                    answer_id=answer.id,
+                    candidates=len(posts),
+                    similarities_found=len(similarities),
+                    stage_ms={name: round(ms, 2) for name, ms in timings.items()},
+                )
 
-            return similarities
+                return similarities
 
-        except Exception as e:
-            logger.error(
-                "Similarity computation failed",
-                answer_id=answer.id,
-                error=str(e),
-                exc_info=True
+            except Exception as e:
+                logger.error(
+                    "Similarity computation failed",
+                    answer_id=answer.id,
+                    error=str(e),
+                    exc_info=True
+                )
+                raise
+
+    async def similarity_version(self, db: AsyncSession, client_id: int) -> str:
+        """
+        Fingerprint of everything a client's similarity rows depend on
+
+        Stored post fingerprints change whenever a post is added, edited or
+        unpublished; the model, scoring settings and the candidate index
+        (whose approximations change which posts are scored) are included
+        so a configuration change invalidates earlier results too.
+        """
+        count, max_id = await self._fingerprint_version(db, client_id)
+        digest = hashlib.sha256(self.model.encode())
+        digest.update(repr((
+            self.stages,
+            self.similarity_threshold,
+            self.jaccard_threshold,
+            self.top_k,
+            self.bm25_top_n,
+            self.index_backend,
+            self.matrix_dtype,
+            settings.IVF_NLIST,
+            settings.IVF_NPROBE,
+            settings.PGVECTOR_EF_SEARCH,
+            settings.PGVECTOR_ITERATIVE_SCAN,
+            settings.PASSAGE_MAX_WORDS,
+            settings.PASSAGE_OVERLAP_WORDS,
+            count,
+            max_id,
+        )).encode())
+        return digest.hexdigest()
+
+    async def _reuse_similarities(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answer: models.Answer,
+    ) -> Optional[List[models.Similarity]]:
+        """
+        Copy the rows of an earlier identical answer scored against the current corpus
+
+        Rows and the stored answer embedding are copied with INSERT ... SELECT,
+        so nothing is embedded. Returns None when there is no such answer.
+        """
+        if not answer.response_hash:
+            return None
+
+        version = await self.similarity_version(db, client_id)
+        result = await db.execute(
+            select(models.Answer.id).join(
+                models.Run, models.Answer.run_id == models.Run.id
+            ).where(
+                models.Run.client_id == client_id,
+                models.Answer.response_hash == answer.response_hash,
+                models.Answer.similarity_corpus_version == version,
+                models.Answer.id != answer.id
+            ).order_by(models.Answer.id.desc()).limit(1)
+        )
+        source_id = result.scalar_one_or_none()
+        if source_id is None:
+            return None
+
+        columns = ["post_id", "similarity_score", "similarity_type", "matched_text", "metadata_json"]
+        await db.execute(
+            insert(models.Similarity).from_select(
+                ["answer_id", *columns],
+                select(
+                    literal(answer.id),
+                    *[getattr(models.Similarity, column) for column in columns]
+                ).where(models.Similarity.answer_id == source_id)
             )
-            raise
+        )
+
+        # Keep the answer re-scorable without an embeddings call
+        await db.execute(
+            delete(models.AnswerEmbedding).where(
+                models.AnswerEmbedding.answer_id == answer.id,
+                models.AnswerEmbedding.model == self.model
+            )
+        )
+        columns = ["client_id", "content_hash", "model", "embedding"]
+        await db.execute(
+            insert(models.AnswerEmbedding).from_select(
+                ["answer_id", *columns],
+                select(
+                    literal(answer.id),
+                    *[getattr(models.AnswerEmbedding, column) for column in columns]
+                ).where(
+                    models.AnswerEmbedding.answer_id == source_id,
+                    models.AnswerEmbedding.model == self.model
+                )
+            )
+        )
+
+        answer.similarity_corpus_version = version
+        await self.update_best_similarity(db, [answer.id])
+
+        result = await db.execute(
+            select(models.Similarity).where(models.Similarity.answer_id == answer.id)
+        )
+        return result.scalars().all()
+
+    async def update_best_similarity(self, db: AsyncSession, answer_ids) -> None:
+        """
+        Refresh the stored best similarity score of answers from their similarity rows
+
+        answer_ids may be a list or a subquery of answer ids.
+        """
+        best = select(func.max(models.Similarity.similarity_score)).where(
+            models.Similarity.answer_id == models.AnswerFeature.answer_id
+        ).scalar_subquery()
+
+        await db.execute(
+            update(models.AnswerFeature).where(
+                models.AnswerFeature.answer_id.in_(answer_ids)
+            ).values(best_similarity=best).execution_options(synchronize_session=False)
+        )
+
+    def _score_posts(
+        self,
+        answer: models.Answer,
+        answer_shingles: np.ndarray,
+        answer_words: np.ndarray,
+        posts: List[models.Post],
+        embedding_scores: Dict[str, float],
+        post_shingles: Dict[str, np.ndarray],
+        passage_matches: Dict[str, Tuple[models.PostPassage, float, models.PostPassage]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Similarity rows for the posts that meet the threshold, as column values
+        """
+        rows = []
+
+        for post in posts:
+            # Compute similarity scores
+            document_similarity = embedding_scores.get(post.id, 0.0)
+            match = passage_matches.get(post.id)
+
+            # An answer usually draws on part of a post, so the best passage counts
+            embedding_similarity = max(document_similarity, match[1]) if match else document_similarity
+
+            jaccard_similarity = self._jaccard(answer_shingles, post_shingles[post.id])
+
+            # Use embedding similarity as primary, Jaccard as backup
+            final_similarity = embedding_similarity
+            similarity_type = "embedding"
+
+            if embedding_similarity < self.similarity_threshold:
+                # If embedding similarity is too low, try Jaccard
+                if jaccard_similarity >= self.jaccard_threshold:
+                    final_similarity = jaccard_similarity
+                    similarity_type = "ngram"
+                else:
+                    final_similarity = max(embedding_similarity, jaccard_similarity)
+                    similarity_type = "combined"
+
+            # Only store if similarity meets minimum threshold
+            if final_similarity < self.min_similarity:
+                continue
+
+            passage = None
+            if match:
+                # Exact span of the best passage: by shared n-grams for
+                # n-gram matches, otherwise by embedding
+                passage = match[2] if similarity_type == "ngram" else match[0]
+                matched_text = post.content[passage.start_offset:passage.end_offset]
+            else:
+                matched_text = self._find_matched_text(
+                    answer_shingles, answer_words, post.content, similarity_type
+                )
+
+            rows.append({
+                "answer_id": answer.id,
+                "post_id": post.id,
+                "similarity_score": float(final_similarity),
+                "similarity_type": similarity_type,
+                "matched_text": matched_text,
+                "metadata_json": {
+                    "embedding_similarity": float(embedding_similarity),
+                    "document_similarity": float(document_similarity),
+                    "passage_index": passage.passage_index if passage else None,
+                    "jaccard_similarity": float(jaccard_similarity),
+                    "answer_length": len(answer.raw_response),
+                    "post_length": len(post.content),
+                },
+            })
+
+        return rows
 
     async def _get_client_posts(
         self,
@@ -136,131 +452,1098 @@ class SimilarityEngine:
         )
         return result.scalars().all()
 
-    async def _get_embedding(self, text: str) -> List[float]:
+    async def _get_posts_by_id(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        post_ids: List[str],
+    ) -> List[models.Post]:
         """
-        Get OpenAI embedding for text
+        Get published posts for a client by ID
         """
-        try:
-            # Truncate text if too long (OpenAI has token limits)
-            truncated_text = text[:8000]  # Rough character limit
+        if not post_ids:
+            return []
 
-            response = await self.client.embeddings.create(
-                input=truncated_text,
-                model=self.model
+        result = await db.execute(
+            select(models.Post).where(
+                models.Post.client_id == client_id,
+                models.Post.id.in_(post_ids),
+                models.Post.status == "publish"
             )
+        )
+        return result.scalars().all()
 
-            return response.data[0].embedding
+    async def _candidate_posts(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answer_embedding: List[float],
+        answer_shingles: np.ndarray,
+        answer_terms: np.ndarray,
+        timings: Dict[str, float],
+    ) -> Tuple[List[models.Post], Dict[str, float]]:
+        """
+        Posts to score against an answer, with their embedding similarities
 
-        except Exception as e:
-            logger.error(
-                "Failed to get embedding",
-                error=str(e),
-                text_length=len(text)
+        Candidates are the nearest posts by embedding plus the posts the LSH
+        index shortlists by estimated Jaccard, as the configured stages
+        allow. Every backend first brings the client's fingerprints up to
+        date, so posts added since an index was built are still shortlisted
+        by LSH. The IVF index is then queried directly; the other backends
+        score embeddings against the whole corpus.
+        """
+        if "bm25" in self.stages:
+            return await self._prefiltered_candidates(
+                db, client_id, answer_embedding, answer_shingles, answer_terms, timings
             )
-            raise
 
-    async def _compute_embedding_similarity(
+        embedding_scores: Dict[str, float] = {}
+        lexical: set = set()
+
+        posts = await self._get_client_posts(db, client_id)
+        await self.sync_post_fingerprints(db, client_id, posts)
+
+        if "embedding" in self.stages:
+            with self._stage("embedding", timings):
+                if self.index_backend == "ivf":
+                    index = await self.get_ivf_index(db, client_id)
+                    embedding_scores = dict(
+                        index.search(answer_embedding, self.top_k, self.min_similarity)
+                    )
+                else:
+                    embedding_scores = dict(
+                        await self._nearest_posts(db, client_id, posts, answer_embedding)
+                    )
+        if "lsh" in self.stages:
+            with self._stage("lsh", timings):
+                lexical = await self._lexical_candidates(db, client_id, answer_shingles)
+
+        candidate_ids = self._merge_candidates(None, embedding_scores, lexical)
+        return [post for post in posts if post.id in candidate_ids], embedding_scores
+
+    async def _prefiltered_candidates(
         self,
+        db: AsyncSession,
+        client_id: int,
         answer_embedding: List[float],
-        post_content: str,
-    ) -> float:
+        answer_shingles: np.ndarray,
+        answer_terms: np.ndarray,
+        timings: Dict[str, float],
+    ) -> Tuple[List[models.Post], Dict[str, float]]:
         """
-        Compute cosine similarity between answer embedding and post content
+        Candidates among the BM25 shortlist only
+
+        Only shortlisted posts are loaded, embedded and scored, whatever the
+        index backend.
         """
-        try:
-            post_embedding = await self._get_embedding(post_content)
-            return self._cosine_similarity(answer_embedding, post_embedding)
+        with self._stage("bm25", timings):
+            index = await self.get_bm25_index(db, client_id)
+            shortlist = self._bm25_shortlist(index, answer_terms)
+            posts = await self._get_posts_by_id(db, client_id, shortlist)
+
+        embedding_scores: Dict[str, float] = {}
+        lexical: set = set()
+
+        if "embedding" in self.stages:
+            with self._stage("embedding", timings):
+                embeddings = await self.get_post_embeddings(db, client_id, posts)
+                post_ids = [post.id for post in posts if post.id in embeddings]
+                corpus = CorpusMatrix(post_ids, [embeddings[post_id] for post_id in post_ids])
+                embedding_scores = dict(
+                    corpus.top_k(answer_embedding, self.top_k, self.min_similarity)
+                )
+        if "lsh" in self.stages:
+            with self._stage("lsh", timings):
+                lexical = await self._lexical_candidates(db, client_id, answer_shingles)
+
+        candidate_ids = self._merge_candidates(set(shortlist), embedding_scores, lexical)
+        return [post for post in posts if post.id in candidate_ids], embedding_scores
+
+    def _merge_candidates(
+        self,
+        shortlist: Optional[set],
+        embedding_scores: Dict[str, float],
+        lexical: set,
+    ) -> set:
+        """
+        IDs of the posts to score: stage candidates within the prefilter shortlist
+
+        With only the bm25 stage configured every shortlisted post is scored.
+        """
+        if "embedding" not in self.stages and "lsh" not in self.stages:
+            return set(shortlist or ())
+
+        candidate_ids = embedding_scores.keys() | lexical
+        if shortlist is not None:
+            candidate_ids &= shortlist
+        return candidate_ids
+
+    def _bm25_shortlist(self, index: BM25Index, answer_terms: np.ndarray) -> List[str]:
+        """
+        IDs of the posts that best match the answer's terms, best first
+        """
+        return [post_id for post_id, _ in index.top_n(answer_terms, self.bm25_top_n)]
 
+    async def _lexical_candidates(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answer_shingles: np.ndarray,
+    ) -> set:
+        """
+        Post IDs whose estimated Jaccard with the answer is near the threshold
+        """
+        index = await self.get_lsh_index(db, client_id)
+        return self._lexical_shortlist(index, answer_shingles)
+
+    def _lexical_shortlist(self, index: LSHIndex, answer_shingles: np.ndarray) -> set:
+        """
+        Query an LSH index with the answer's MinHash signature
+        """
+        signature = self.minhasher.signature(answer_shingles)
+        threshold = self.jaccard_threshold - JACCARD_ESTIMATE_MARGIN
+
+        return {post_id for post_id, _ in index.query(signature, threshold)}
+
+    async def get_lsh_index(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> LSHIndex:
+        """
+        Get the client's LSH index, rebuilt only when stored fingerprints change
+        """
+        version = await self._fingerprint_version(db, client_id)
+
+        cached = self._lsh_cache.get(client_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        result = await db.execute(
+            select(
+                models.PostFingerprint.post_id,
+                models.PostFingerprint.minhash,
+            ).where(models.PostFingerprint.client_id == client_id)
+        )
+        signatures = {
+            post_id: np.frombuffer(minhash, dtype=np.uint32)
+            for post_id, minhash in result.all()
+        }
+
+        index = LSHIndex.build({
+            post_id: signature
+            for post_id, signature in signatures.items()
+            if len(signature) == self.minhasher.num_perm
+        })
+        self._lsh_cache[client_id] = (version, index)
+
+        return index
+
+    async def get_bm25_index(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> BM25Index:
+        """
+        Get the client's BM25 index, rebuilt only when stored fingerprints change
+        """
+        version = await self._fingerprint_version(db, client_id)
+        if version[0] == 0:
+            # Nothing fingerprinted yet (new client, or right after a migration)
+            posts = await self._get_client_posts(db, client_id)
+            await self.sync_post_fingerprints(db, client_id, posts)
+            version = await self._fingerprint_version(db, client_id)
+
+        cached = self._bm25_cache.get(client_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        result = await db.execute(
+            select(
+                models.PostFingerprint.post_id,
+                models.PostFingerprint.terms,
+                models.PostFingerprint.term_counts,
+            ).where(models.PostFingerprint.client_id == client_id)
+        )
+        index = BM25Index.build({
+            post_id: (from_bytes(terms), np.frombuffer(counts, dtype=np.uint32))
+            for post_id, terms, counts in result.all()
+        })
+        self._bm25_cache[client_id] = (version, index)
+
+        return index
+
+    async def _fingerprint_version(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> Tuple[int, int]:
+        """
+        (count, max id) of a client's stored fingerprints; rows are only ever replaced
+        """
+        result = await db.execute(
+            select(
+                func.count(models.PostFingerprint.id),
+                func.max(models.PostFingerprint.id),
+            ).where(models.PostFingerprint.client_id == client_id)
+        )
+        count, max_id = result.one()
+        return (count, max_id or 0)
+
+    async def sync_post_fingerprints(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> None:
+        """
+        Store shingle hashes, MinHash signatures and term counts for new or changed posts
+
+        New rows are added to the session; the caller commits.
+        """
+        content_hashes = {post.id: self._content_hash(post.content) for post in posts}
+        version = self._corpus_version(content_hashes)
+
+        if self._fingerprinted_versions.get(client_id) == version:
+            return
+
+        result = await db.execute(
+            select(
+                models.PostFingerprint.post_id,
+                models.PostFingerprint.content_hash,
+            ).where(
+                models.PostFingerprint.client_id == client_id
+            )
+        )
+        stored_hashes = dict(result.all())
+
+        missing = [
+            post for post in posts
+            if stored_hashes.get(post.id) != content_hashes[post.id]
+        ]
+        if missing:
+            await db.execute(
+                delete(models.PostFingerprint).where(
+                    models.PostFingerprint.client_id == client_id,
+                    models.PostFingerprint.post_id.in_([post.id for post in missing])
+                )
+            )
+            for post in missing:
+                shingles = self._shingles(post.content)
+                terms, counts = term_counts(post.content)
+                db.add(models.PostFingerprint(
+                    client_id=client_id,
+                    post_id=post.id,
+                    content_hash=content_hashes[post.id],
+                    shingles=to_bytes(shingles),
+                    minhash=self.minhasher.signature(shingles).tobytes(),
+                    terms=to_bytes(terms),
+                    term_counts=counts.tobytes(),
+                ))
+
+        self._fingerprinted_versions[client_id] = version
+
+    async def get_post_passages(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> Dict[str, List[models.PostPassage]]:
+        """
+        Get embedded passages for posts, splitting and embedding only new or changed content
+
+        New rows are added to the session; the caller commits.
+        """
+        if not posts:
+            return {}
+
+        content_hashes = {post.id: self._content_hash(post.content) for post in posts}
+
+        result = await db.execute(
+            select(models.PostPassage).where(
+                models.PostPassage.client_id == client_id,
+                models.PostPassage.post_id.in_(list(content_hashes)),
+                models.PostPassage.model == self.model
+            ).order_by(models.PostPassage.post_id, models.PostPassage.passage_index)
+        )
+
+        passages: Dict[str, List[models.PostPassage]] = {}
+        for passage in result.scalars().all():
+            if content_hashes.get(passage.post_id) == passage.content_hash:
+                passages.setdefault(passage.post_id, []).append(passage)
+
+        missing = [post for post in posts if post.id not in passages]
+        if missing:
+            passages.update(
+                await self._embed_passages(db, client_id, missing, content_hashes)
+            )
+
+        return passages
+
+    async def _embed_passages(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+        content_hashes: Dict[str, str],
+    ) -> Dict[str, List[models.PostPassage]]:
+        """
+        Split posts into passages, embed them in batches and store the results
+        """
+        split = {
+            post.id: split_passages(
+                post.content, settings.PASSAGE_MAX_WORDS, settings.PASSAGE_OVERLAP_WORDS
+            )
+            for post in posts
+        }
+        texts = [passage.text for post in posts for passage in split[post.id]]
+        if not texts:
+            return {}
+
+        try:
+            vectors = iter(await self._get_embeddings(texts))
         except Exception as e:
+            # Posts without passages fall back to whole-document matching
             logger.warning(
-                "Failed to compute embedding similarity",
+                "Failed to embed post passages",
+                client_id=client_id,
+                posts=len(posts),
                 error=str(e)
             )
-            return 0.0
+            return {}
 
-    def _cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
+        # Drop passages of previous content versions
+        await db.execute(
+            delete(models.PostPassage).where(
+                models.PostPassage.client_id == client_id,
+                models.PostPassage.post_id.in_([post.id for post in posts]),
+                models.PostPassage.model == self.model
+            )
+        )
+
+        passages: Dict[str, List[models.PostPassage]] = {}
+        for post in posts:
+            for passage in split[post.id]:
+                post_passage = models.PostPassage(
+                    client_id=client_id,
+                    post_id=post.id,
+                    content_hash=content_hashes[post.id],
+                    model=self.model,
+                    passage_index=passage.index,
+                    start_offset=passage.start,
+                    end_offset=passage.end,
+                    embedding=next(vectors),
+                    shingles=to_bytes(self._shingles(passage.text)),
+                )
+                db.add(post_passage)
+                passages.setdefault(post.id, []).append(post_passage)
+
+        logger.info(
+            "Post passages updated",
+            client_id=client_id,
+            posts=len(posts),
+            passages=len(texts),
+        )
+
+        return passages
+
+    def _match_passages(
+        self,
+        answer_embedding: List[float],
+        answer_shingles: np.ndarray,
+        passages: Dict[str, List[models.PostPassage]],
+    ) -> Dict[str, Tuple[models.PostPassage, float, models.PostPassage]]:
         """
-        Calculate cosine similarity between two vectors
+        Best passage of each post by embedding score and by shared shingles
+
+        Returns post_id -> (best passage by embedding, its score, best passage
+        by shingle overlap). Every passage is scored in one matrix product.
         """
-        try:
-            dot_product = sum(a * b for a, b in zip(vec1, vec2))
-            norm1 = math.sqrt(sum(a * a for a in vec1))
-            norm2 = math.sqrt(sum(b * b for b in vec2))
+        flat, matrix, ranges = self._passage_matrix(passages)
+        return self._best_passages(
+            flat, matrix.score(answer_embedding), ranges, answer_shingles, list(passages)
+        )
 
-            if norm1 == 0 or norm2 == 0:
-                return 0.0
+    @staticmethod
+    def _passage_matrix(
+        passages: Dict[str, List[models.PostPassage]],
+    ) -> Tuple[List[models.PostPassage], CorpusMatrix, Dict[str, Tuple[int, int]]]:
+        """
+        All passages as one matrix, with each post's row range
+        """
+        flat: List[models.PostPassage] = []
+        ranges: Dict[str, Tuple[int, int]] = {}
+        for post_id, post_passages in passages.items():
+            ranges[post_id] = (len(flat), len(flat) + len(post_passages))
+            flat.extend(post_passages)
 
-            return dot_product / (norm1 * norm2)
+        matrix = CorpusMatrix(
+            list(range(len(flat))), [passage.embedding for passage in flat]
+        )
+        return flat, matrix, ranges
 
-        except Exception as e:
-            logger.error("Cosine similarity calculation failed", error=str(e))
-            return 0.0
+    @staticmethod
+    def _best_passages(
+        flat: List[models.PostPassage],
+        scores: np.ndarray,
+        ranges: Dict[str, Tuple[int, int]],
+        answer_shingles: np.ndarray,
+        post_ids: List[str],
+    ) -> Dict[str, Tuple[models.PostPassage, float, models.PostPassage]]:
+        """
+        Pick each post's best passages from precomputed passage scores
+        """
+        matches = {}
+        for post_id in post_ids:
+            if post_id not in ranges:
+                continue
+
+            start, end = ranges[post_id]
+            overlaps = [
+                len(np.intersect1d(answer_shingles, from_bytes(passage.shingles), assume_unique=True))
+                for passage in flat[start:end]
+            ]
+            by_score = start + int(np.argmax(scores[start:end]))
+            by_overlap = start + int(np.argmax(overlaps))
+            matches[post_id] = (flat[by_score], float(scores[by_score]), flat[by_overlap])
 
-    def _compute_jaccard_similarity(self, text1: str, text2: str) -> float:
+        return matches
+
+    async def _get_post_shingles(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> Dict[str, np.ndarray]:
         """
-        Compute Jaccard similarity using n-grams
+        Shingle hashes for posts, from their stored fingerprints where current
         """
-        try:
-            # Convert to lowercase and split into words
-            words1 = set(text1.lower().split())
-            words2 = set(text2.lower().split())
+        if not posts:
+            return {}
+
+        content_hashes = {post.id: self._content_hash(post.content) for post in posts}
+        shingles = await self._load_post_shingles(db, client_id, content_hashes)
+
+        for post in posts:
+            if post.id not in shingles:
+                shingles[post.id] = self._shingles(post.content)
+
+        return shingles
+
+    async def _load_post_shingles(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        content_hashes: Dict[str, str],
+    ) -> Dict[str, np.ndarray]:
+        """
+        Load stored shingle hashes whose content hash still matches the post
+        """
+        result = await db.execute(
+            select(
+                models.PostFingerprint.post_id,
+                models.PostFingerprint.content_hash,
+                models.PostFingerprint.shingles,
+            ).where(
+                models.PostFingerprint.client_id == client_id,
+                models.PostFingerprint.post_id.in_(list(content_hashes))
+            )
+        )
 
-            # Compute n-grams (2-grams and 3-grams)
-            ngrams1 = self._get_ngrams(text1.lower(), 2) | self._get_ngrams(text1.lower(), 3)
-            ngrams2 = self._get_ngrams(text2.lower(), 2) | self._get_ngrams(text2.lower(), 3)
+        return {
+            post_id: from_bytes(shingles)
+            for post_id, content_hash, shingles in result.all()
+            if content_hashes.get(post_id) == content_hash
+        }
+
+    async def _nearest_posts(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+        answer_embedding: List[float],
+    ) -> List[Tuple[str, float]]:
+        """
+        Top-k posts most similar to an answer embedding, as (post_id, score) pairs
+        """
+        if self.index_backend == "pgvector":
+            await self.sync_post_vectors(db, client_id, posts)
+            nearest = await self._pgvector_nearest(db, client_id, answer_embedding)
 
-            # Jaccard similarity
-            intersection = len(ngrams1 & ngrams2)
-            union = len(ngrams1 | ngrams2)
+            # The shared index is filtered by client and model after the
+            # approximate scan, so a small client can get too few neighbours
+            if len(nearest) >= min(self.top_k, len(posts)):
+                return self._above_threshold(nearest)
 
-            if union == 0:
-                return 0.0
+            logger.warning(
+                "pgvector returned too few neighbours, using exact scan",
+                client_id=client_id,
+                returned=len(nearest),
+                expected=min(self.top_k, len(posts))
+            )
+
+        # Score against the whole corpus in one matrix-vector product
+        corpus = await self.get_corpus_matrix(db, client_id, posts)
+        return corpus.top_k(answer_embedding, self.top_k, self.min_similarity)
+
+    async def _pgvector_top_k(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answer_embedding: List[float],
+    ) -> List[Tuple[str, float]]:
+        """
+        Ask Postgres for the nearest posts above the threshold using the HNSW index
+        """
+        return self._above_threshold(await self._pgvector_nearest(db, client_id, answer_embedding))
+
+    async def _pgvector_nearest(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answer_embedding: List[float],
+    ) -> List[Tuple[str, float]]:
+        """
+        Up to top_k nearest posts from the HNSW index, best first, before the threshold
+
+        The index holds every client's and model's vectors, so the scan
+        visits ef_search candidates (and, with iterative scans, keeps going)
+        to leave enough of this client's rows after filtering.
+        """
+        await db.execute(select(func.set_config(
+            "hnsw.ef_search", str(max(settings.PGVECTOR_EF_SEARCH, self.top_k)), True
+        )))
+        if settings.PGVECTOR_ITERATIVE_SCAN:
+            await db.execute(select(func.set_config(
+                "hnsw.iterative_scan", settings.PGVECTOR_ITERATIVE_SCAN, True
+            )))
+
+        distance = models.PostEmbeddingVector.embedding.cosine_distance(answer_embedding)
+
+        result = await db.execute(
+            select(
+                models.PostEmbeddingVector.post_id,
+                (1 - distance).label("score"),
+            ).where(
+                models.PostEmbeddingVector.client_id == client_id,
+                models.PostEmbeddingVector.model == self.model
+            ).order_by(distance).limit(self.top_k)
+        )
+
+        # Relaxed iterative scans may return neighbours slightly out of order
+        return sorted(
+            ((post_id, float(score)) for post_id, score in result.all()),
+            key=lambda pair: -pair[1]
+        )
+
+    def _above_threshold(self, nearest: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        # Threshold is applied after the index scan so the ORDER BY stays indexable
+        return [(post_id, score) for post_id, score in nearest if score >= self.min_similarity]
+
+    async def sync_post_vectors(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> None:
+        """
+        Make sure every post has an embedding for its current content
+
+        Used by the pgvector backend, where vectors are never loaded into
+        the process; only the stored content hashes are checked.
+        """
+        content_hashes = {post.id: self._content_hash(post.content) for post in posts}
+        version = self._corpus_version(content_hashes)
+
+        if self._indexed_versions.get(client_id) == version:
+            return
+
+        result = await db.execute(
+            select(
+                models.PostEmbedding.post_id,
+                models.PostEmbedding.content_hash,
+            ).where(
+                models.PostEmbedding.client_id == client_id,
+                models.PostEmbedding.model == self.model
+            )
+        )
+        stored_hashes = dict(result.all())
+
+        missing = [
+            post for post in posts
+            if stored_hashes.get(post.id) != content_hashes[post.id]
+        ]
+        embedded = await self._embed_posts(db, client_id, missing, content_hashes)
+
+        if len(embedded) == len(missing):
+            self._indexed_versions[client_id] = version
+
+    async def get_corpus_matrix(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> Union[CorpusMatrix, QuantizedMatrix]:
+        """
+        Get the client's post embedding matrix, rebuilt only when the corpus changes
+
+        With a quantized SIMILARITY_MATRIX_DTYPE the matrix is a memory-mapped
+        file shared by all worker processes, rebuilt by whichever worker
+        first sees the corpus change.
+        """
+        version = self._corpus_version(
+            {post.id: self._content_hash(post.content) for post in posts}
+        )
+
+        cached = self._corpus_cache.get(client_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        quantized = self.matrix_dtype != "float32"
+        if quantized:
+            stored = QuantizedMatrix.load(self._matrix_path(client_id))
+            if stored is not None and stored.corpus_version == version:
+                self._corpus_cache[client_id] = (version, stored)
+                return stored
+
+        embeddings = await self.get_post_embeddings(db, client_id, posts)
+        post_ids = [post.id for post in posts if post.id in embeddings]
+        corpus = CorpusMatrix(post_ids, [embeddings[post_id] for post_id in post_ids])
+
+        # Only cache complete corpora, so failed embeddings are retried
+        if len(post_ids) == len(posts):
+            if quantized:
+                corpus = self._save_quantized_matrix(client_id, version, corpus)
+            self._corpus_cache[client_id] = (version, corpus)
+
+        return corpus
+
+    def _matrix_path(self, client_id: int) -> Path:
+        """
+        Directory holding a client's quantized matrix for the current model and dtype
+        """
+        return (
+            Path(settings.VECTOR_INDEX_DIR) / f"client_{client_id}" / "matrix"
+            / self.model / self.matrix_dtype
+        )
+
+    def _save_quantized_matrix(
+        self,
+        client_id: int,
+        version: str,
+        corpus: CorpusMatrix,
+    ) -> QuantizedMatrix:
+        """
+        Quantize a full-precision matrix, log its recall and save it memory-mapped
+        """
+        quantized = QuantizedMatrix.build(corpus.ids, corpus.matrix, self.matrix_dtype)
+
+        # Recall@10 against full precision on a sample of the corpus's own rows
+        sample = np.random.default_rng(0).permutation(len(corpus))[:100]
+        recall = quantized.recall(corpus, corpus.matrix[sample], k=10)
+
+        path = self._matrix_path(client_id)
+        saved = quantized.save(path, version)
+
+        logger.info(
+            "Quantized corpus matrix saved",
+            client_id=client_id,
+            dtype=self.matrix_dtype,
+            posts=len(quantized),
+            recall_at_10=round(recall, 4),
+        )
+
+        # Memory-mapped if the saved version is still on disk
+        return QuantizedMatrix.load(path, saved) or quantized
+
+    def _ivf_path(self, client_id: int) -> Path:
+        """
+        Directory holding a client's IVF index for the current model
+        """
+        return Path(settings.VECTOR_INDEX_DIR) / f"client_{client_id}" / "ivf" / self.model
+
+    async def get_ivf_index(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> IVFIndex:
+        """
+        Get the client's IVF index, memory-mapped from disk or built on first use
+        """
+        path = self._ivf_path(client_id)
+        version = IVFIndex.current_version(path)
+
+        cached = self._ivf_cache.get(client_id)
+        if cached and version and cached[0] == version:
+            return cached[1]
+
+        # None too when a concurrent save pruned the version being loaded
+        index = IVFIndex.load(path, settings.IVF_NPROBE) if version else None
+        if index is None:
+            index, version = await self.build_ivf_index(db, client_id)
+
+        if version:
+            self._ivf_cache[client_id] = (version, index)
+
+        return index
+
+    async def build_ivf_index(
+        self,
+        db: AsyncSession,
+        client_id: int,
+    ) -> Tuple[IVFIndex, Optional[str]]:
+        """
+        Build a client's IVF index from all published posts and save it
+        """
+        posts = await self._get_client_posts(db, client_id)
+        embeddings = await self.get_post_embeddings(db, client_id, posts)
+        await self.sync_post_fingerprints(db, client_id, posts)
+        await db.commit()
+
+        post_ids = [post.id for post in posts if post.id in embeddings]
+        index = IVFIndex.build(
+            post_ids,
+            [embeddings[post_id] for post_id in post_ids],
+            nlist=settings.IVF_NLIST,
+            nprobe=settings.IVF_NPROBE,
+            dimensions=self.provider.dimensions,
+        )
 
-            return intersection / union
+        # Only persist complete indexes, so failed embeddings are retried
+        version = None
+        if len(post_ids) == len(posts):
+            version = index.save(self._ivf_path(client_id))
 
+        logger.info(
+            "IVF index built",
+            client_id=client_id,
+            posts=len(post_ids),
+            clusters=len(index.centroids),
+        )
+
+        return index, version
+
+    def update_ivf_index(
+        self,
+        client_id: int,
+        embeddings: Dict[str, List[float]],
+        removed_post_ids: List[str],
+    ) -> None:
+        """
+        Apply synced post embeddings and removals to a client's saved IVF index
+
+        Clients without a saved index get a full build on their next query.
+        """
+        path = self._ivf_path(client_id)
+        index = IVFIndex.load(path, settings.IVF_NPROBE)
+        if index is None:
+            return
+
+        index = index.upsert(list(embeddings), list(embeddings.values()))
+        index = index.remove(removed_post_ids)
+        self._ivf_cache[client_id] = (index.save(path), index)
+
+    def _corpus_version(self, content_hashes: Dict[str, str]) -> str:
+        """
+        Fingerprint of a client's corpus: post IDs, content hashes and model
+        """
+        digest = hashlib.sha256(self.model.encode())
+        for post_id in sorted(content_hashes):
+            digest.update(f"{post_id}:{content_hashes[post_id]}".encode())
+        return digest.hexdigest()
+
+    async def get_post_embeddings(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+    ) -> Dict[str, List[float]]:
+        """
+        Get embeddings for posts, embedding only new or changed content
+
+        Embeddings are stored per (post, content hash, model), so a post is
+        only sent to the embeddings API when its content or the model changes.
+        New rows are added to the session; the caller commits.
+        """
+        content_hashes = {post.id: self._content_hash(post.content) for post in posts}
+
+        embeddings = await self._load_post_embeddings(db, client_id, content_hashes)
+
+        missing = [post for post in posts if post.id not in embeddings]
+        if missing:
+            embeddings.update(
+                await self._embed_posts(db, client_id, missing, content_hashes)
+            )
+
+        return embeddings
+
+    async def _embed_posts(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+        content_hashes: Dict[str, str],
+    ) -> Dict[str, List[float]]:
+        """
+        Embed posts in batches and store the results
+        """
+        if not posts:
+            return {}
+
+        try:
+            vectors = await self._get_embeddings([post.content for post in posts])
         except Exception as e:
-            logger.error("Jaccard similarity calculation failed", error=str(e))
-            return 0.0
+            # Posts without an embedding still get n-gram scoring
+            logger.warning(
+                "Failed to embed posts",
+                client_id=client_id,
+                posts=len(posts),
+                error=str(e)
+            )
+            return {}
+
+        embeddings = {post.id: vector for post, vector in zip(posts, vectors)}
+
+        await self._store_post_embeddings(db, client_id, posts, content_hashes, embeddings)
+
+        logger.info(
+            "Post embeddings updated",
+            client_id=client_id,
+            embedded=len(posts),
+        )
+
+        return embeddings
+
+    async def get_answer_embeddings(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        answers: List[models.Answer],
+    ) -> Dict[int, List[float]]:
+        """
+        Get embeddings for answers, embedding only those not stored yet
+
+        Missing answers are embedded together in packed batch requests.
+        New rows are added to the session; the caller commits.
+        """
+        if not answers:
+            return {}
+
+        content_hashes = {answer.id: self._content_hash(answer.raw_response) for answer in answers}
+        embeddings = await self._load_answer_embeddings(db, content_hashes)
+
+        missing = [answer for answer in answers if answer.id not in embeddings]
+        if not missing:
+            return embeddings
+
+        vectors = await self._get_embeddings([answer.raw_response for answer in missing])
+
+        # Drop embeddings of edited answers
+        await db.execute(
+            delete(models.AnswerEmbedding).where(
+                models.AnswerEmbedding.answer_id.in_([answer.id for answer in missing]),
+                models.AnswerEmbedding.model == self.model
+            )
+        )
+
+        for answer, vector in zip(missing, vectors):
+            db.add(models.AnswerEmbedding(
+                client_id=client_id,
+                answer_id=answer.id,
+                content_hash=content_hashes[answer.id],
+                model=self.model,
+                embedding=vector,
+            ))
+            embeddings[answer.id] = vector
+
+        return embeddings
+
+    async def _load_answer_embeddings(
+        self,
+        db: AsyncSession,
+        content_hashes: Dict[int, str],
+    ) -> Dict[int, List[float]]:
+        """
+        Load stored answer embeddings whose text hash still matches
+        """
+        result = await db.execute(
+            select(
+                models.AnswerEmbedding.answer_id,
+                models.AnswerEmbedding.content_hash,
+                models.AnswerEmbedding.embedding,
+            ).where(
+                models.AnswerEmbedding.answer_id.in_(list(content_hashes)),
+                models.AnswerEmbedding.model == self.model
+            )
+        )
+
+        return {
+            answer_id: embedding
+            for answer_id, content_hash, embedding in result.all()
+            if content_hashes.get(answer_id) == content_hash
+        }
+
+    async def _load_post_embeddings(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        content_hashes: Dict[str, str],
+    ) -> Dict[str, List[float]]:
+        """
+        Load stored embeddings whose content hash still matches the post
+        """
+        result = await db.execute(
+            select(
+                models.PostEmbedding.post_id,
+                models.PostEmbedding.content_hash,
+                models.PostEmbedding.embedding,
+            ).where(
+                models.PostEmbedding.client_id == client_id,
+                models.PostEmbedding.post_id.in_(list(content_hashes)),
+                models.PostEmbedding.model == self.model
+            )
+        )
+
+        return {
+            post_id: embedding
+            for post_id, content_hash, embedding in result.all()
+            if content_hashes.get(post_id) == content_hash
+        }
+
+    async def _store_post_embeddings(
+        self,
+        db: AsyncSession,
+        client_id: int,
+        posts: List[models.Post],
+        content_hashes: Dict[str, str],
+        embeddings: Dict[str, List[float]],
+    ) -> None:
+        """
+        Replace stored embeddings for the given posts with fresh ones
+        """
+        if not posts:
+            return
+
+        # Drop embeddings of previous content versions
+        await db.execute(
+            delete(models.PostEmbedding).where(
+                models.PostEmbedding.client_id == client_id,
+                models.PostEmbedding.post_id.in_([post.id for post in posts]),
+                models.PostEmbedding.model == self.model
+            )
+        )
+
+        for post in posts:
+            post_embedding = models.PostEmbedding(
+                client_id=client_id,
+                post_id=post.id,
+                content_hash=content_hashes[post.id],
+                model=self.model,
+                embedding=embeddings[post.id],
+            )
+            db.add(post_embedding)
+
+            if self.index_backend == "pgvector":
+                db.add(models.PostEmbeddingVector(
+                    post_embedding=post_embedding,
+                    client_id=client_id,
+                    post_id=post.id,
+                    model=self.model,
+                    embedding=embeddings[post.id],
+                ))
+
+    @staticmethod
+    def _content_hash(content: str) -> str:
+        """
+        SHA-256 hash of post content, used to detect changed posts
+        """
+        return hashlib.sha256((content or "").encode()).hexdigest()
 
-    def _get_ngrams(self, text: str, n: int) -> set:
+    async def fit_embedding_model(
+        self,
+        client_ids: Optional[List[int]] = None,
+        session_factory: Optional[Callable[[Optional[int]], Any]] = None,
+    ) -> str:
         """
-        Generate n-grams from text
+        Fit the shared local embedding model on active clients' post passages
+
+        Every client's content is embedded with the one current version, so
+        the corpus is gathered client by client, each in its own tenant
+        session so row-level security applies.
         """
-        words = text.split()
-        ngrams = set()
+        from app.services.kpi_service import kpi_service
 
-        for i in range(len(words) - n + 1):
-            ngram = " ".join(words[i:i + n])
-            ngrams.add(ngram)
+        if not hasattr(self.provider, "fit"):
+            raise ValueError(f"Embedding model {self.model} cannot be fitted locally")
+
+        if session_factory is None:
+            from app.db.session import TenantScopedSession
+            session_factory = TenantScopedSession
+        if client_ids is None:
+            client_ids = await kpi_service._active_client_ids()
+
+        texts: List[str] = []
+        for client_id in client_ids:
+            async with session_factory(client_id) as db:
+                posts = await self._get_client_posts(db, client_id)
+            texts.extend(
+                passage.text
+                for post in posts
+                for passage in split_passages(
+                    post.content, settings.PASSAGE_MAX_WORDS, settings.PASSAGE_OVERLAP_WORDS
+                )
+            )
 
-        return ngrams
+        return await self.provider.fit(texts)
+
+    async def _get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Get embeddings for many texts, coalesced with concurrent callers
+        """
+        return await self.embedding_queue.embed(texts)
+
+    @staticmethod
+    def _shingles(text: str) -> np.ndarray:
+        """
+        Sorted 64-bit hashes of the text's word 2-grams and 3-grams
+        """
+        return shingle_set(text)
+
+    @staticmethod
+    def _jaccard(shingles1: np.ndarray, shingles2: np.ndarray) -> float:
+        """
+        Exact Jaccard similarity of two shingle hash arrays
+        """
+        return jaccard(shingles1, shingles2)
 
     def _find_matched_text(
         self,
-        answer_text: str,
+        answer_shingles: np.ndarray,
+        answer_words: np.ndarray,
         post_content: str,
         similarity_type: str,
     ) -> Optional[str]:
         """
         Find the text segment that matched
+
+        Matching is done on hashes; the text is read back from the post.
         """
         try:
-            if similarity_type == "ngram":
-                # Find common n-grams
-                answer_ngrams = self._get_ngrams(answer_text.lower(), 2)
-                post_ngrams = self._get_ngrams(post_content.lower(), 2)
+            words = tokenize(post_content)
+            hashes = word_hashes(words)
 
-                common_ngrams = answer_ngrams & post_ngrams
-                if common_ngrams:
-                    return " ".join(list(common_ngrams)[:3])  # Return first 3 matches
+            if similarity_type == "ngram":
+                # Post 2-grams that also occur in the answer
+                matched = np.flatnonzero(np.isin(ngram_hashes(hashes, 2), answer_shingles))
+                if len(matched):
+                    return " ".join(" ".join(words[i:i + 2]) for i in matched[:3])  # First 3 matches
 
             # For embedding similarity, return a sample of overlapping words
-            answer_words = set(answer_text.lower().split())
-            post_words = set(post_content.lower().split())
-
-            common_words = answer_words & post_words
+            common_words = list(dict.fromkeys(
+                words[i] for i in np.flatnonzero(np.isin(hashes, answer_words))
+            ))
             if len(common_words) > 5:
-                return " ".join(list(common_words)[:10])
+                return " ".join(common_words[:10])
 
             return None
 
@@ -268,7 +1551,26 @@ class SimilarityEngine:
             logger.warning("Failed to find matched text", error=str(e))
             return None
 
-
 # Create service instance
-similarity_engine = SimilarityEngine()</content>
-<parameter name="filePath">/Users/krisoldland/Documents/GitHub/1927MSuite/geo-tracker/app/services/similarity_service.py
\ No newline at end of file
+similarity_engine = SimilarityEngine()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Fit the shared local embedding model and make it the current version"""
+    parser = argparse.ArgumentParser(
+        description="Fit the local embedding model on all active clients' published posts"
+    )
+    parser.parse_args(argv)
+
+    async def run() -> str:
+        try:
+            return await similarity_engine.fit_embedding_model()
+        finally:
+            await similarity_engine.provider.close()
+
+    version = asyncio.run(run())
+    logger.info("Embedding model fit command finished", model=similarity_engine.model, version=version)
+
+
+if __name__ == "__main__":
+    main()
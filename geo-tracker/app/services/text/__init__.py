@@ -0,0 +1,21 @@
+"""
+Lexical text matching helpers for the similarity engine
+"""
+
+from .bm25 import BM25Index, term_counts
+from .minhash import LSHIndex, MinHasher
+from .passages import Passage, split_passages
+from .shingles import jaccard, shingle_set, tokenize
+
+
+__all__ = [
+    "BM25Index",
+    "LSHIndex",
+    "MinHasher",
+    "Passage",
+    "jaccard",
+    "shingle_set",
+    "split_passages",
+    "term_counts",
+    "tokenize",
+]
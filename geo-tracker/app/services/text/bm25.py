@@ -0,0 +1,132 @@
+"""
+BM25 ranking over an inverted index of hashed post terms
+"""
+
+import re
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .shingles import word_hashes
+
+# Okapi BM25 defaults: term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"\w+")
+
+
+def term_counts(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sorted unique term hashes of a text and how often each occurs
+
+    Terms are lowercased word characters, so punctuation does not split
+    "compost" from "compost.".
+    """
+    hashes = word_hashes(_WORD.findall((text or "").lower()))
+    terms, counts = np.unique(hashes, return_counts=True)
+    return terms, counts.astype(np.uint32)
+
+
+class BM25Index:
+    """
+    Term-major postings for a client's posts, scored with Okapi BM25
+
+    Each posting's saturated, length-normalized term weight is precomputed,
+    so a query only gathers the postings of its own terms.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        vocabulary: np.ndarray,
+        offsets: np.ndarray,
+        postings: np.ndarray,
+        weights: np.ndarray,
+        idf: np.ndarray,
+    ):
+        self.ids = ids
+        self.vocabulary = vocabulary  # Sorted term hashes
+        self.offsets = offsets        # Postings of vocabulary[t] are offsets[t]:offsets[t + 1]
+        self.postings = postings      # Document index of each posting
+        self.weights = weights        # BM25 term-frequency component of each posting
+        self.idf = idf
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        documents: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+    ) -> "BM25Index":
+        """
+        Build postings from each document's (terms, counts) arrays
+        """
+        ids = list(documents)
+        if not ids:
+            empty = np.zeros(0, dtype=np.uint64)
+            return cls([], empty, np.zeros(1, dtype=np.int64), empty.astype(np.int32),
+                       np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32))
+
+        terms = [np.asarray(documents[post_id][0], dtype=np.uint64) for post_id in ids]
+        counts = [np.asarray(documents[post_id][1], dtype=np.float32) for post_id in ids]
+        lengths = np.array([count.sum() for count in counts], dtype=np.float32)
+
+        all_terms = np.concatenate(terms)
+        all_counts = np.concatenate(counts)
+        documents_of = np.repeat(np.arange(len(ids), dtype=np.int32), [len(t) for t in terms])
+
+        vocabulary, term_index = np.unique(all_terms, return_inverse=True)
+        order = np.argsort(term_index, kind="stable")
+        frequencies = np.bincount(term_index, minlength=len(vocabulary))
+        offsets = np.concatenate(([0], np.cumsum(frequencies))).astype(np.int64)
+
+        average_length = max(float(lengths.mean()), 1.0)
+        norms = k1 * (1.0 - b + b * lengths / average_length)
+        weights = all_counts * (k1 + 1.0) / (all_counts + norms[documents_of])
+
+        idf = np.log1p((len(ids) - frequencies + 0.5) / (frequencies + 0.5)).astype(np.float32)
+
+        return cls(
+            ids,
+            vocabulary,
+            offsets,
+            documents_of[order],
+            weights[order].astype(np.float32),
+            idf,
+        )
+
+    def scores(self, query_terms: Sequence[int]) -> np.ndarray:
+        """
+        BM25 score of every document for a query's unique terms
+        """
+        if not self.ids or len(self.vocabulary) == 0:
+            return np.zeros(len(self.ids), dtype=np.float32)
+
+        terms = np.unique(np.asarray(query_terms, dtype=np.uint64))
+        positions = np.searchsorted(self.vocabulary, terms)
+        found = positions < len(self.vocabulary)
+        found[found] = self.vocabulary[positions[found]] == terms[found]
+        positions = positions[found]
+
+        slices = [slice(self.offsets[p], self.offsets[p + 1]) for p in positions]
+        if not slices:
+            return np.zeros(len(self.ids), dtype=np.float32)
+
+        documents = np.concatenate([self.postings[s] for s in slices])
+        contributions = np.concatenate([self.weights[s] * self.idf[p] for s, p in zip(slices, positions)])
+        return np.bincount(documents, weights=contributions, minlength=len(self.ids)).astype(np.float32)
+
+    def top_n(self, query_terms: Sequence[int], n: int) -> List[Tuple[str, float]]:
+        """
+        The n best-scoring documents that share a term with the query, best first
+        """
+        scores = self.scores(query_terms)
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > n:
+            matched = matched[np.argpartition(-scores[matched], n - 1)[:n]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in matched]
@@ -0,0 +1,117 @@
+"""
+MinHash signatures and LSH banding for sub-linear Jaccard candidate lookup
+"""
+
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Signature length and banding: 64 bands of 2 rows puts the LSH threshold
+# near 0.125, just under the similarity engine's Jaccard threshold
+NUM_PERM = 128
+LSH_BANDS = 64
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+class MinHasher:
+    """
+    Fixed family of hash permutations for MinHash signatures
+
+    The seed is constant so signatures stored by one process compare with
+    signatures computed by another.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a < 2**31 keeps a * hash (hash < 2**32) inside uint64
+        self.num_perm = num_perm
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        """
+        MinHash signature of a shingle hash array
+        """
+        if len(shingles) == 0:
+            return np.full(self.num_perm, MAX_HASH, dtype=np.uint32)
+
+        # Low 32 bits of the (already mixed) shingle hashes
+        hashes = np.asarray(shingles, dtype=np.uint64) & MAX_HASH
+        values = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME & MAX_HASH
+        return values.min(axis=0).astype(np.uint32)
+
+    @staticmethod
+    def estimate_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+        """
+        Jaccard similarity estimated from two signatures
+        """
+        return float(np.mean(first == second))
+
+
+class LSHIndex:
+    """
+    Banded LSH over MinHash signatures
+
+    Each signature is cut into bands; posts sharing any whole band with a
+    query are candidates. Candidates are then ranked by estimated Jaccard.
+    """
+
+    def __init__(self, bands: int = LSH_BANDS):
+        self.bands = bands
+        self.ids: List[str] = []
+        self.signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self._buckets: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, signatures: Dict[str, np.ndarray], bands: int = LSH_BANDS) -> "LSHIndex":
+        """
+        Index a mapping of post ID to signature
+        """
+        index = cls(bands)
+        index.ids = list(signatures)
+        if index.ids:
+            index.signatures = np.vstack([signatures[post_id] for post_id in index.ids])
+
+        for row, signature in enumerate(index.signatures):
+            for band, key in enumerate(index._band_keys(signature)):
+                index._buckets[band][key].append(row)
+
+        return index
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        rows = len(signature) // self.bands
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def candidates(self, signature: np.ndarray) -> np.ndarray:
+        """
+        Rows sharing at least one band with the signature
+        """
+        rows = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            rows.update(self._buckets[band].get(key, ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    def query(
+        self,
+        signature: np.ndarray,
+        threshold: float = 0.0,
+    ) -> List[Tuple[str, float]]:
+        """
+        Candidate posts with estimated Jaccard at or above the threshold
+        """
+        rows = self.candidates(signature)
+        if len(rows) == 0:
+            return []
+
+        estimates = (self.signatures[rows] == signature).mean(axis=1)
+        keep = estimates >= threshold
+        return [
+            (self.ids[row], float(estimate))
+            for row, estimate in zip(rows[keep], estimates[keep])
+        ]
@@ -0,0 +1,43 @@
+"""
+Split post content into overlapping word-window passages with exact spans
+"""
+
+import re
+from dataclasses import dataclass
+from typing import List
+
+_WORD = re.compile(r"\S+")
+
+
+@dataclass
+class Passage:
+    """A window of words and its character span in the source text"""
+
+    index: int
+    start: int
+    end: int
+    text: str
+
+
+def split_passages(text: str, max_words: int, overlap: int) -> List[Passage]:
+    """
+    Split text into passages of up to max_words, consecutive ones sharing overlap words
+
+    Spans index the original text, so text[start:end] is the passage verbatim.
+    """
+    text = text or ""
+    spans = [match.span() for match in _WORD.finditer(text)]
+    if not spans:
+        return []
+
+    stride = max(1, max_words - overlap)
+    passages = []
+    for first in range(0, len(spans), stride):
+        last = min(first + max_words, len(spans)) - 1
+        start, end = spans[first][0], spans[last][1]
+        passages.append(Passage(len(passages), start, end, text[start:end]))
+
+        if last == len(spans) - 1:
+            break
+
+    return passages
@@ -0,0 +1,91 @@
+"""
+Word n-gram shingles as sorted arrays of 64-bit hashes
+"""
+
+import hashlib
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# Shingle sizes used for Jaccard similarity
+SHINGLE_SIZES = (2, 3)
+
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+_COMBINE = np.uint64(0x9E3779B97F4A7C15)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased whitespace tokens, as used for shingling
+    """
+    return (text or "").lower().split()
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, applied element-wise"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * _MIX_1
+    values = values ^ (values >> np.uint64(27))
+    values = values * _MIX_2
+    return values ^ (values >> np.uint64(31))
+
+
+def word_hashes(words: Sequence[str]) -> np.ndarray:
+    """
+    Stable 64-bit hash of every word, in position order
+    """
+    cache: Dict[str, int] = {}
+    for word in words:
+        if word not in cache:
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            cache[word] = int.from_bytes(digest, "little")
+
+    return np.fromiter((cache[word] for word in words), dtype=np.uint64, count=len(words))
+
+
+def ngram_hashes(hashes: np.ndarray, n: int) -> np.ndarray:
+    """
+    Hash of every word n-gram, in position order
+    """
+    count = len(hashes) - n + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    # Seeding with n keeps 2-grams and 3-grams apart in one hash space
+    combined = _mix(hashes[:count] ^ np.uint64(n))
+    for offset in range(1, n):
+        combined = _mix(combined * _COMBINE + hashes[offset:offset + count])
+    return combined
+
+
+def shingle_set(text: str, sizes: Sequence[int] = SHINGLE_SIZES) -> np.ndarray:
+    """
+    Sorted, unique hashes of the text's word 2-grams and 3-grams
+    """
+    hashes = word_hashes(tokenize(text))
+    return np.unique(np.concatenate(
+        [ngram_hashes(hashes, n) for n in sizes] or [np.zeros(0, dtype=np.uint64)]
+    ))
+
+
+def jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Exact Jaccard similarity of two sorted, unique hash arrays
+    """
+    intersection = len(np.intersect1d(first, second, assume_unique=True))
+    union = len(first) + len(second) - intersection
+    if union == 0:
+        return 0.0
+
+    return intersection / union
+
+
+def to_bytes(shingles: np.ndarray) -> bytes:
+    """Serialized form stored with the post"""
+    return shingles.astype("<u8").tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    """Inverse of to_bytes"""
+    return np.frombuffer(data, dtype="<u8").astype(np.uint64)
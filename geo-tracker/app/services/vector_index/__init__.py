@@ -0,0 +1,16 @@
+"""
+Vector indexes over post embeddings
+"""
+
+from .matrix import CorpusMatrix, normalize, select_top_k
+from .ivf import IVFIndex
+from .quantized import QuantizedMatrix
+
+
+__all__ = [
+    "CorpusMatrix",
+    "IVFIndex",
+    "QuantizedMatrix",
+    "normalize",
+    "select_top_k",
+]
@@ -0,0 +1,322 @@
+"""
+In-process IVF approximate nearest neighbour index, persisted per client
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from .matrix import normalize, select_top_k
+
+# Retrain the clustering once the index has grown this much since training
+RETRAIN_FACTOR = 4
+
+
+def _normalize_rows(vectors: Sequence[Sequence[float]], dimensions: int) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, dimensions)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class IVFIndex:
+    """
+    Inverted-file index: vectors clustered with k-means and stored grouped by cluster
+
+    A query is scored only against the nprobe clusters with the closest
+    centroids. Updates assign new vectors to the existing centroids; the
+    clustering is retrained once the index outgrows it.
+
+    Saved indexes are versioned directories of .npy files that are
+    memory-mapped on load, so workers share pages through the OS cache and
+    a writer never changes files a reader has open.
+    """
+
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        centroids: np.ndarray,
+        vectors: np.ndarray,
+        offsets: np.ndarray,
+        nlist: int,
+        nprobe: int,
+        trained_size: int,
+    ):
+        self.ids: List[str] = list(ids)
+        self.centroids = centroids
+        self.vectors = vectors  # Rows grouped by cluster
+        self.offsets = offsets  # Cluster c owns rows offsets[c]:offsets[c + 1]
+        self.nlist = nlist  # Requested clusters (small corpora get fewer)
+        self.nprobe = nprobe
+        self.trained_size = trained_size
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        nlist: int,
+        nprobe: int,
+        dimensions: Optional[int] = None,
+        seed: int = 0,
+    ) -> "IVFIndex":
+        """
+        Cluster vectors with k-means and build the inverted lists
+        """
+        ids = list(ids)
+        if dimensions is None:
+            dimensions = len(vectors[0]) if ids else 0
+        matrix = _normalize_rows(vectors, dimensions)
+
+        if not ids:
+            return cls([], np.zeros((0, dimensions), dtype=np.float32), matrix,
+                       np.zeros(1, dtype=np.int64), nlist, nprobe, 0)
+
+        # Small corpora get fewer clusters (~sqrt(n)) so lists stay populated
+        kmeans = MiniBatchKMeans(
+            n_clusters=max(1, min(nlist, int(np.sqrt(len(ids))))),
+            n_init=3,
+            batch_size=1024,
+            random_state=seed,
+        ).fit(matrix)
+
+        centroids = _normalize_rows(kmeans.cluster_centers_, dimensions)
+        return cls._from_assignments(
+            ids, matrix, centroids, kmeans.labels_, nlist, nprobe, trained_size=len(ids)
+        )
+
+    @classmethod
+    def _from_assignments(
+        cls,
+        ids: List[str],
+        matrix: np.ndarray,
+        centroids: np.ndarray,
+        assignments: np.ndarray,
+        nlist: int,
+        nprobe: int,
+        trained_size: int,
+    ) -> "IVFIndex":
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=len(centroids)))
+
+        return cls(
+            [ids[i] for i in order],
+            centroids,
+            np.ascontiguousarray(matrix[order]),
+            offsets,
+            nlist,
+            nprobe,
+            trained_size,
+        )
+
+    def _assignments(self) -> np.ndarray:
+        """Cluster of every stored row"""
+        return np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+
+    def search(
+        self,
+        query: Sequence[float],
+        k: int,
+        threshold: float = -1.0,
+    ) -> List[Tuple[str, float]]:
+        """
+        Approximate top-k rows, scanning only the nprobe closest clusters
+        """
+        if not self.ids:
+            return []
+
+        q = normalize(query)
+        probe = select_top_k(self.centroids @ q, self.nprobe, -np.inf)
+        rows = np.concatenate([
+            np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe
+        ])
+        if len(rows) == 0:
+            return []
+
+        scores = self.vectors[rows] @ q
+        best = select_top_k(scores, k, threshold)
+        return [(self.ids[rows[i]], float(scores[i])) for i in best]
+
+    def search_exact(
+        self,
+        query: Sequence[float],
+        k: int,
+        threshold: float = -1.0,
+    ) -> List[Tuple[str, float]]:
+        """
+        Brute-force top-k over every row (fallback and recall baseline)
+        """
+        if not self.ids:
+            return []
+
+        scores = self.vectors @ normalize(query)
+        best = select_top_k(scores, k, threshold)
+        return [(self.ids[i], float(scores[i])) for i in best]
+
+    def recall(self, queries: Sequence[Sequence[float]], k: int) -> float:
+        """
+        Mean recall@k of search() against brute force for the given queries
+        """
+        recalls = []
+        for query in queries:
+            exact = {post_id for post_id, _ in self.search_exact(query, k)}
+            if not exact:
+                continue
+            found = {post_id for post_id, _ in self.search(query, k)}
+            recalls.append(len(found & exact) / len(exact))
+
+        return float(np.mean(recalls)) if recalls else 1.0
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+    ) -> "IVFIndex":
+        """
+        New index with the given rows added or replaced
+        """
+        ids = list(ids)
+        if not ids:
+            return self
+
+        keep = self._keep_mask(set(ids))
+        kept_ids = [post_id for post_id, kept in zip(self.ids, keep) if kept]
+        new_rows = _normalize_rows(vectors, len(vectors[0]))
+        matrix = np.concatenate([np.asarray(self.vectors[keep]), new_rows]) \
+            if kept_ids else new_rows
+        all_ids = kept_ids + ids
+
+        if not kept_ids or len(all_ids) > RETRAIN_FACTOR * self.trained_size:
+            return IVFIndex.build(
+                all_ids, matrix, self.nlist, self.nprobe, dimensions=matrix.shape[1]
+            )
+
+        assignments = np.concatenate([
+            self._assignments()[keep],
+            np.argmax(new_rows @ self.centroids.T, axis=1),
+        ])
+        return IVFIndex._from_assignments(
+            all_ids, matrix, self.centroids, assignments,
+            self.nlist, self.nprobe, self.trained_size,
+        )
+
+    def remove(self, ids: Sequence[str]) -> "IVFIndex":
+        """
+        New index without the given rows
+        """
+        keep = self._keep_mask(set(ids))
+        if keep.all():
+            return self
+
+        return IVFIndex._from_assignments(
+            [post_id for post_id, kept in zip(self.ids, keep) if kept],
+            np.asarray(self.vectors[keep]),
+            self.centroids,
+            self._assignments()[keep],
+            self.nlist,
+            self.nprobe,
+            self.trained_size,
+        )
+
+    def _keep_mask(self, ids: set) -> np.ndarray:
+        return np.fromiter(
+            (post_id not in ids for post_id in self.ids), dtype=bool, count=len(self.ids)
+        )
+
+    def save(self, path: Path) -> str:
+        """
+        Write the index as a new version directory and point CURRENT at it
+        """
+        path = Path(path)
+        previous = self.current_version(path)
+        version = f"v{time.time_ns()}"
+        version_dir = path / version
+        version_dir.mkdir(parents=True, exist_ok=True)
+
+        np.save(version_dir / "centroids.npy", self.centroids)
+        np.save(version_dir / "vectors.npy", self.vectors)
+        np.save(version_dir / "offsets.npy", self.offsets)
+        with open(version_dir / "meta.json", "w") as f:
+            json.dump({
+                "ids": self.ids,
+                "nlist": self.nlist,
+                "trained_size": self.trained_size,
+            }, f)
+
+        # Atomic switch; readers see either the old or the new version
+        pointer = path / f"{self.CURRENT_FILE}.{os.getpid()}"
+        pointer.write_text(version)
+        os.replace(pointer, path / self.CURRENT_FILE)
+
+        self._prune(path, previous)
+        return version
+
+    @staticmethod
+    def _prune(path: Path, previous: Optional[str]) -> None:
+        """
+        Remove versions older than the one just replaced (open memory maps stay valid)
+
+        The replaced version is kept for readers that resolved it just now,
+        and newer ones may still be being written by a concurrent save.
+        """
+        if previous is None:
+            return
+
+        for entry in path.iterdir():
+            if entry.is_dir() and entry.name.startswith("v") and entry.name[1:].isdigit() \
+                    and int(entry.name[1:]) < int(previous[1:]):
+                shutil.rmtree(entry, ignore_errors=True)
+
+    @classmethod
+    def current_version(cls, path: Path) -> Optional[str]:
+        """Version the CURRENT pointer names, if an index has been saved"""
+        try:
+            return (Path(path) / cls.CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path: Path, nprobe: int) -> Optional["IVFIndex"]:
+        """
+        Memory-map the current version of a saved index
+
+        Returns None if nothing is saved or the version was pruned while
+        loading, so the caller rebuilds.
+        """
+        path = Path(path)
+        version = cls.current_version(path)
+        if version is None:
+            return None
+
+        version_dir = path / version
+        try:
+            with open(version_dir / "meta.json") as f:
+                meta: Dict = json.load(f)
+
+            return cls(
+                meta["ids"],
+                np.load(version_dir / "centroids.npy", mmap_mode="r"),
+                np.load(version_dir / "vectors.npy", mmap_mode="r"),
+                np.load(version_dir / "offsets.npy"),
+                meta["nlist"],
+                nprobe,
+                meta["trained_size"],
+            )
+        except FileNotFoundError:
+            return None
@@ -0,0 +1,84 @@
+"""
+In-memory embedding matrix for vectorized cosine scoring
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize(vector: Sequence[float]) -> np.ndarray:
+    """
+    L2-normalize a vector as float32 (zero vectors stay zero)
+    """
+    array = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(array)
+    if norm == 0:
+        return array
+    return array / norm
+
+
+def select_top_k(scores: np.ndarray, k: int, threshold: float) -> np.ndarray:
+    """
+    Indices of the k best scores at or above threshold, best first
+    """
+    candidates = np.flatnonzero(scores >= threshold)
+    if len(candidates) > k:
+        best = np.argpartition(-scores[candidates], k - 1)[:k]
+        candidates = candidates[best]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class CorpusMatrix:
+    """
+    A client's post embeddings as one contiguous, pre-normalized float32 matrix
+
+    Cosine similarity against the whole corpus is a single matrix-vector product.
+    """
+
+    def __init__(self, ids: Sequence[str], vectors: Sequence[Sequence[float]]):
+        self.ids: List[str] = list(ids)
+
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.ndim != 2:  # Empty corpus
+            matrix = matrix.reshape(len(self.ids), 0)
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = np.ascontiguousarray(matrix / norms)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def score(self, query: Sequence[float]) -> np.ndarray:
+        """
+        Cosine similarity of the query against every row
+        """
+        if not self.ids:
+            return np.zeros(0, dtype=np.float32)
+        return self.matrix @ normalize(query)
+
+    def score_many(self, queries: Sequence[Sequence[float]]) -> np.ndarray:
+        """
+        Cosine similarity of every query against every row, as a (queries x rows) matrix
+        """
+        if not self.ids:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+
+        block = np.asarray(queries, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (block / norms) @ self.matrix.T
+
+    def top_k(
+        self,
+        query: Sequence[float],
+        k: int,
+        threshold: float = -1.0,
+    ) -> List[Tuple[str, float]]:
+        """
+        The k most similar rows at or above threshold, as (id, score) pairs
+        """
+        scores = self.score(query)
+        indices = select_top_k(scores, k, threshold)
+        return [(self.ids[i], float(scores[i])) for i in indices]
@@ -0,0 +1,204 @@
+"""
+Quantized, memory-mapped embedding matrix
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .matrix import CorpusMatrix, normalize, select_top_k
+
+# Rows dequantized per step, bounding the float32 copy made while scoring
+ROW_BLOCK = 65536
+
+
+class QuantizedMatrix:
+    """
+    A client's post embeddings as int8 or float16 codes with a per-row scale
+
+    Rows are normalized before quantization. Scoring dequantizes one block
+    of rows at a time, so a memory-mapped file is shared by every worker
+    process through the page cache and never copied whole.
+    """
+
+    DTYPES = ("float16", "int8")
+    CURRENT_FILE = "CURRENT"
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        codes: np.ndarray,
+        scales: np.ndarray,
+        corpus_version: Optional[str] = None,
+    ):
+        self.ids: List[str] = list(ids)
+        self.codes = codes
+        self.scales = scales
+        self.corpus_version = corpus_version
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dtype(self) -> str:
+        return self.codes.dtype.name
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        dtype: str = "int8",
+    ) -> "QuantizedMatrix":
+        """
+        Quantize vectors row by row
+        """
+        if dtype not in cls.DTYPES:
+            raise ValueError(f"Unsupported quantized dtype: {dtype}")
+
+        matrix = CorpusMatrix(ids, vectors).matrix
+
+        if dtype == "float16":
+            codes = matrix.astype(np.float16)
+            scales = np.ones(len(matrix), dtype=np.float32)
+        else:
+            # Symmetric int8: each row's largest component maps to +/-127
+            peaks = np.max(np.abs(matrix), axis=1, initial=0.0)
+            scales = np.where(peaks > 0, peaks / 127.0, 1.0).astype(np.float32)
+            codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+
+        return cls(ids, codes, scales)
+
+    def score(self, query: Sequence[float]) -> np.ndarray:
+        """
+        Cosine similarity of the query against every row
+        """
+        if not self.ids:
+            return np.zeros(0, dtype=np.float32)
+
+        query = normalize(query)
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), ROW_BLOCK):
+            end = start + ROW_BLOCK
+            scores[start:end] = (self.codes[start:end].astype(np.float32) @ query) * self.scales[start:end]
+        return scores
+
+    def score_many(self, queries: Sequence[Sequence[float]]) -> np.ndarray:
+        """
+        Cosine similarity of every query against every row, as a (queries x rows) matrix
+        """
+        if not self.ids:
+            return np.zeros((len(queries), 0), dtype=np.float32)
+
+        block = np.asarray(queries, dtype=np.float32).reshape(-1, self.codes.shape[1])
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        block = block / norms
+
+        scores = np.empty((len(block), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), ROW_BLOCK):
+            end = start + ROW_BLOCK
+            rows = self.codes[start:end].astype(np.float32)
+            scores[:, start:end] = (block @ rows.T) * self.scales[start:end]
+        return scores
+
+    def top_k(
+        self,
+        query: Sequence[float],
+        k: int,
+        threshold: float = -1.0,
+    ) -> List[Tuple[str, float]]:
+        """
+        The k most similar rows at or above threshold, as (id, score) pairs
+        """
+        scores = self.score(query)
+        indices = select_top_k(scores, k, threshold)
+        return [(self.ids[i], float(scores[i])) for i in indices]
+
+    def recall(
+        self,
+        reference: CorpusMatrix,
+        queries: Sequence[Sequence[float]],
+        k: int = 10,
+    ) -> float:
+        """
+        Fraction of the full-precision top-k that the quantized top-k finds
+        """
+        found = total = 0
+        for query in queries:
+            exact = {post_id for post_id, _ in reference.top_k(query, k)}
+            approximate = {post_id for post_id, _ in self.top_k(query, k)}
+            found += len(exact & approximate)
+            total += len(exact)
+        return found / total if total else 1.0
+
+    def save(self, path: Path, corpus_version: str) -> str:
+        """
+        Write the matrix as a new version directory and point CURRENT at it
+        """
+        path = Path(path)
+        previous = self.current_version(path)
+        version = f"v{time.time_ns()}"
+        version_dir = path / version
+        version_dir.mkdir(parents=True, exist_ok=True)
+
+        np.save(version_dir / "codes.npy", self.codes)
+        np.save(version_dir / "scales.npy", self.scales)
+        with open(version_dir / "meta.json", "w") as f:
+            json.dump({"ids": self.ids, "corpus_version": corpus_version}, f)
+
+        # Atomic switch; readers see either the old or the new version
+        pointer = path / f"{self.CURRENT_FILE}.{os.getpid()}"
+        pointer.write_text(version)
+        os.replace(pointer, path / self.CURRENT_FILE)
+
+        # Keep the replaced version for readers that resolved it just now,
+        # and newer ones a concurrent save may still be writing
+        if previous is not None:
+            for entry in path.iterdir():
+                if entry.is_dir() and entry.name.startswith("v") and entry.name[1:].isdigit() \
+                        and int(entry.name[1:]) < int(previous[1:]):
+                    shutil.rmtree(entry, ignore_errors=True)
+
+        self.corpus_version = corpus_version
+        return version
+
+    @classmethod
+    def current_version(cls, path: Path) -> Optional[str]:
+        """Version the CURRENT pointer names, if a matrix has been saved"""
+        try:
+            return (Path(path) / cls.CURRENT_FILE).read_text().strip()
+        except FileNotFoundError:
+            return None
+
+    @classmethod
+    def load(cls, path: Path, version: Optional[str] = None) -> Optional["QuantizedMatrix"]:
+        """
+        Memory-map the current (or the given) version of a saved matrix
+
+        Returns None if nothing is saved or the version was pruned while
+        loading, so the caller rebuilds.
+        """
+        path = Path(path)
+        version = version or cls.current_version(path)
+        if version is None:
+            return None
+
+        version_dir = path / version
+        try:
+            with open(version_dir / "meta.json") as f:
+                meta: Dict = json.load(f)
+
+            return cls(
+                meta["ids"],
+                np.load(version_dir / "codes.npy", mmap_mode="r"),
+                np.load(version_dir / "scales.npy", mmap_mode="r"),
+                corpus_version=meta["corpus_version"],
+            )
+        except FileNotFoundError:
+            return None
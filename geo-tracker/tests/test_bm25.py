@@ -0,0 +1,153 @@
+"""
+Tests for the BM25 prefilter stage
+"""
+
+import math
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services.similarity_service import SimilarityEngine
+from app.services.text import BM25Index, term_counts
+from app.services.text.bm25 import BM25_B, BM25_K1
+
+DOCUMENTS = {
+    "compost": "Compost needs green and brown material. Turn compost weekly.",
+    "roses": "Prune roses in late winter, before new growth.",
+    "tax": "File your tax return before the deadline.",
+    "mulch": "Mulch keeps soil moist; compost makes good mulch.",
+}
+
+
+def reference_bm25(query: str, documents: dict) -> dict:
+    """Textbook Okapi BM25 over plain word counts"""
+    tokenized = {
+        post_id: [word.strip(".,;").lower() for word in text.split()]
+        for post_id, text in documents.items()
+    }
+    average = sum(len(words) for words in tokenized.values()) / len(tokenized)
+    terms = {word.strip(".,;?").lower() for word in query.split()}
+
+    scores = {}
+    for post_id, words in tokenized.items():
+        score = 0.0
+        for term in terms:
+            frequency = words.count(term)
+            if not frequency:
+                continue
+            df = sum(term in other for other in tokenized.values())
+            idf = math.log(1 + (len(tokenized) - df + 0.5) / (df + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(words) / average)
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        scores[post_id] = score
+    return scores
+
+
+def build_index(documents: dict = DOCUMENTS) -> BM25Index:
+    return BM25Index.build({post_id: term_counts(text) for post_id, text in documents.items()})
+
+
+class TestBM25Index:
+    """Inverted index scoring"""
+
+    def test_term_counts_ignore_punctuation_and_case(self):
+        """Test terms are words without punctuation, counted"""
+        terms, counts = term_counts("Compost, compost. COMPOST and soil")
+
+        assert len(terms) == 3
+        assert sorted(counts.tolist()) == [1, 1, 3]
+        assert np.all(np.diff(terms.astype(np.float64)) > 0)
+
+    def test_scores_match_reference(self):
+        """Test scores equal a direct Okapi BM25 computation"""
+        query = "How often should compost be turned into mulch?"
+        index = build_index()
+
+        scores = dict(zip(index.ids, index.scores(term_counts(query)[0])))
+
+        assert scores == pytest.approx(reference_bm25(query, DOCUMENTS), abs=1e-5)
+
+    def test_top_n(self):
+        """Test results are best first, limited, and only share a query term"""
+        index = build_index()
+        query = term_counts("compost mulch")[0]
+
+        assert [post_id for post_id, _ in index.top_n(query, 10)] == ["mulch", "compost"]
+        assert [post_id for post_id, _ in index.top_n(query, 1)] == ["mulch"]
+        assert index.top_n(term_counts("unrelated words")[0], 10) == []
+
+    def test_empty_index(self):
+        """Test an index with no posts"""
+        index = BM25Index.build({})
+
+        assert index.top_n(term_counts("compost")[0], 5) == []
+
+
+class TestSimilarityStages:
+    """Configurable candidate stages in SimilarityEngine"""
+
+    def test_parse_stages(self):
+        """Test stage names are validated and bm25 must come first"""
+        assert SimilarityEngine._parse_stages(" BM25, embedding ,lsh") == ["bm25", "embedding", "lsh"]
+
+        for value in ("", "embedding,typo", "embedding,bm25"):
+            with pytest.raises(ValueError):
+                SimilarityEngine._parse_stages(value)
+
+    @pytest.mark.asyncio
+    async def test_prefilter_limits_later_stages(self):
+        """Test only the BM25 shortlist is loaded, embedded and scored, with stage timings"""
+        engine = SimilarityEngine()
+        engine.stages = ["bm25", "embedding"]
+        engine.bm25_top_n = 2
+        posts = {
+            post_id: SimpleNamespace(id=post_id, content=text, status="publish")
+            for post_id, text in DOCUMENTS.items()
+        }
+        answer = SimpleNamespace(
+            id=1, raw_response="compost and mulch", response_hash=None,
+            run=SimpleNamespace(client_id=1),
+        )
+        db = MagicMock()
+        db.execute = AsyncMock()
+        db.commit = AsyncMock()
+
+        async def by_id(db, client_id, post_ids):
+            return [posts[post_id] for post_id in post_ids]
+
+        async def embeddings(db, client_id, shortlisted):
+            return {post.id: [1.0, 0.0] for post in shortlisted}
+
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={1: [1.0, 0.0]})), \
+             patch.object(engine, "get_bm25_index", AsyncMock(return_value=build_index())), \
+             patch.object(engine, "_get_client_posts", AsyncMock()) as all_posts, \
+             patch.object(engine, "_get_posts_by_id", AsyncMock(side_effect=by_id)) as loaded, \
+             patch.object(engine, "get_post_embeddings", AsyncMock(side_effect=embeddings)), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value={})):
+            similarities = await engine.compute_similarities(db, answer)
+
+        all_posts.assert_not_awaited()
+        assert loaded.await_args.args[2] == ["mulch", "compost"]
+        assert sorted(s.post_id for s in similarities) == ["compost", "mulch"]
+
+        timings = engine.stage_timings()
+        assert {"answer_embedding", "bm25", "embedding", "passages", "scoring"} <= timings.keys()
+        assert "lsh" not in timings
+        assert timings["bm25"]["calls"] == 1
+
+    def test_bm25_only_scores_whole_shortlist(self):
+        """Test with no other stage every shortlisted post is a candidate"""
+        engine = SimilarityEngine()
+        engine.stages = ["bm25"]
+
+        assert engine._merge_candidates({"a", "b"}, {}, set()) == {"a", "b"}
+
+        engine.stages = ["bm25", "lsh"]
+        assert engine._merge_candidates({"a", "b"}, {}, {"b", "c"}) == {"b"}
@@ -0,0 +1,94 @@
+"""
+Tests for token-aware embedding batching
+"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import numpy as np
+import pytest
+
+from app.services.embeddings.batching import EmbeddingBatcher, estimate_tokens, split_text
+
+
+def make_client() -> MagicMock:
+    """Fake embeddings client: vector encodes the input's length, results reversed"""
+    async def create(input, model):
+        data = [
+            SimpleNamespace(index=i, embedding=[float(len(text)), 1.0])
+            for i, text in enumerate(input)
+        ]
+        return SimpleNamespace(data=list(reversed(data)))
+
+    client = MagicMock()
+    client.embeddings.create = AsyncMock(side_effect=create)
+    return client
+
+
+class TestSplitText:
+    """Test splitting of oversized texts"""
+
+    def test_short_text_is_not_split(self):
+        assert split_text("a short text", max_tokens=100) == ["a short text"]
+
+    def test_long_text_chunks_fit_budget(self):
+        text = " ".join(["word"] * 1000)
+        chunks = split_text(text, max_tokens=50)
+
+        assert len(chunks) > 1
+        assert all(estimate_tokens(chunk) <= 51 for chunk in chunks)
+        assert " ".join(chunks).split() == text.split()
+
+    def test_single_huge_word_is_cut(self):
+        chunks = split_text("x" * 1000, max_tokens=10)
+        assert "".join(chunks) == "x" * 1000
+
+
+class TestEmbeddingBatcher:
+    """Test packing and result mapping"""
+
+    @pytest.mark.asyncio
+    async def test_results_map_back_in_order(self):
+        """Test each text gets its own vector even if the API reorders results"""
+        batcher = EmbeddingBatcher(make_client(), "test-model", max_batch_size=2)
+        texts = ["a", "bbb", "cc", "dddd", "e"]
+
+        vectors = await batcher.embed(texts)
+
+        assert [v[0] for v in vectors] == [float(len(t)) for t in texts]
+
+    @pytest.mark.asyncio
+    async def test_batch_size_and_token_budget(self):
+        """Test batches respect both the input count and the token budget"""
+        client = make_client()
+        batcher = EmbeddingBatcher(client, "test-model", max_batch_size=100, max_batch_tokens=1000)
+        texts = ["x" * 900] * 20  # ~301 tokens each, so 3 per request
+
+        await batcher.embed(texts)
+
+        sizes = [len(call.kwargs["input"]) for call in client.embeddings.create.await_args_list]
+        assert sizes == [3] * 6 + [2]
+
+    @pytest.mark.asyncio
+    async def test_backfill_uses_few_requests(self):
+        """Test a 2,000 post backfill takes a few dozen requests"""
+        client = make_client()
+        batcher = EmbeddingBatcher(client, "test-model")
+
+        await batcher.embed(["post content " * 300] * 2000)
+
+        assert client.embeddings.create.await_count <= 50
+
+    @pytest.mark.asyncio
+    async def test_oversized_text_is_chunked_and_combined(self):
+        """Test a text over the input limit yields one normalized vector"""
+        client = make_client()
+        batcher = EmbeddingBatcher(client, "test-model", max_input_tokens=20)
+
+        vectors = await batcher.embed([" ".join(["word"] * 100), "short"])
+
+        sent = client.embeddings.create.await_args.kwargs["input"]
+        assert len(sent) > 2
+        assert len(vectors) == 2
+        assert np.linalg.norm(vectors[0]) == pytest.approx(1.0)
+        assert vectors[1] == [5.0, 1.0]
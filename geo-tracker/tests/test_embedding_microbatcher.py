@@ -0,0 +1,104 @@
+"""
+Tests for coalescing concurrent embedding requests
+"""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from app.services.embeddings import EmbeddingMicroBatcher
+
+
+def make_provider(delay: float = 0.0, fail: bool = False) -> MagicMock:
+    """Fake provider: each vector encodes its text's length; records every call"""
+    provider = MagicMock()
+    provider.calls = []
+    provider.active = 0
+    provider.peak = 0
+
+    async def embed(texts):
+        provider.calls.append(list(texts))
+        provider.active += 1
+        provider.peak = max(provider.peak, provider.active)
+        try:
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("provider down")
+            return [[float(len(text))] for text in texts]
+        finally:
+            provider.active -= 1
+
+    provider.embed = embed
+    return provider
+
+
+class TestEmbeddingMicroBatcher:
+    """Shared queue in front of an embedding provider"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_share_one_call(self):
+        """Test callers within the wait window get their own vectors from one request"""
+        provider = make_provider()
+        batcher = EmbeddingMicroBatcher(provider, max_wait_ms=20, max_batch_texts=100)
+
+        results = await asyncio.gather(
+            batcher.embed(["a"]),
+            batcher.embed(["bb", "ccc"]),
+            batcher.embed(["dddd"]),
+        )
+
+        assert results == [[[1.0]], [[2.0], [3.0]], [[4.0]]]
+        assert provider.calls == [["a", "bb", "ccc", "dddd"]]
+
+    @pytest.mark.asyncio
+    async def test_batch_limit_flushes_early(self):
+        """Test a full batch is sent without waiting and batches stay within the limit"""
+        provider = make_provider()
+        batcher = EmbeddingMicroBatcher(provider, max_wait_ms=10_000, max_batch_texts=3)
+
+        results = await asyncio.wait_for(
+            asyncio.gather(*(batcher.embed([str(i)]) for i in range(6))),
+            timeout=1,
+        )
+
+        assert len(results) == 6
+        assert [len(call) for call in provider.calls] == [3, 3]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        """Test no more than max_concurrency provider calls run at once"""
+        provider = make_provider(delay=0.01)
+        batcher = EmbeddingMicroBatcher(provider, max_wait_ms=1, max_batch_texts=1, max_concurrency=2)
+
+        await asyncio.gather(*(batcher.embed(["x"]) for _ in range(6)))
+
+        assert len(provider.calls) == 6
+        assert provider.peak == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_is_dropped(self):
+        """Test a caller cancelled while queued is not sent and others still complete"""
+        provider = make_provider()
+        batcher = EmbeddingMicroBatcher(provider, max_wait_ms=20, max_batch_texts=100)
+
+        cancelled = asyncio.create_task(batcher.embed(["gone"]))
+        kept = asyncio.create_task(batcher.embed(["kept"]))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+
+        assert await kept == [[4.0]]
+        assert cancelled.cancelled()
+        assert provider.calls == [["kept"]]
+
+    @pytest.mark.asyncio
+    async def test_failure_reaches_every_caller(self):
+        """Test a failed provider call raises in each caller of the batch"""
+        batcher = EmbeddingMicroBatcher(make_provider(fail=True), max_wait_ms=5)
+
+        results = await asyncio.gather(
+            batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True
+        )
+
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert await batcher.embed([]) == []
@@ -0,0 +1,231 @@
+"""
+Tests for embedding providers
+"""
+
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.core.config import settings
+from app.services.embeddings import (
+    EmbeddingMicroBatcher,
+    EmbeddingProviderFactory,
+    LocalEmbeddingProvider,
+    OpenAIEmbeddingProvider,
+)
+from app.services.embeddings.local import _transform, _vectorizer
+from app.services.similarity_service import SimilarityEngine
+
+CORPUS = [
+    "compost needs green nitrogen material and brown carbon material",
+    "turn the compost heap weekly so the material breaks down",
+    "a compost bin keeps kitchen scraps and garden waste together",
+    "file your tax return before the april deadline",
+    "tax deductions lower the income you pay tax on",
+    "keep receipts for every deduction on your tax return",
+    "prune roses in late winter before new growth starts",
+    "roses bloom best with full sun and regular feeding",
+]
+
+
+def cosine(first, second) -> float:
+    return float(np.dot(first, second) / (np.linalg.norm(first) * np.linalg.norm(second)))
+
+
+class TestEmbeddingProviderFactory:
+    """Providers are chosen by name"""
+
+    def test_create_providers(self, tmp_path):
+        """Test known names create their providers"""
+        with patch("app.core.config.settings.LOCAL_EMBEDDING_DIR", str(tmp_path)):
+            assert isinstance(EmbeddingProviderFactory.create_provider("OpenAI"), OpenAIEmbeddingProvider)
+            assert isinstance(EmbeddingProviderFactory.create_provider("local"), LocalEmbeddingProvider)
+
+    def test_unknown_provider(self):
+        """Test an unknown name is rejected"""
+        with pytest.raises(ValueError):
+            EmbeddingProviderFactory.create_provider("bogus")
+
+    @pytest.mark.asyncio
+    async def test_openai_client_created_on_first_use(self):
+        """Test an unused provider opens no client and a used one is closed"""
+        provider = OpenAIEmbeddingProvider(api_key="test-key")
+        assert provider._client is None
+        await provider.close()
+
+        client = provider.client
+        client.close = AsyncMock()
+        await provider.close()
+
+        client.close.assert_awaited_once()
+        assert provider._client is None
+
+
+class TestLocalEmbeddingProvider:
+    """Offline embeddings computed in worker processes"""
+
+    @pytest.mark.asyncio
+    async def test_fit_and_embed(self, tmp_path):
+        """Test related texts score higher than unrelated ones"""
+        provider = LocalEmbeddingProvider(str(tmp_path), dimensions=4, n_features=2 ** 12, workers=1)
+        try:
+            await provider.fit(CORPUS)
+            compost, heap, tax = await provider.embed([
+                "how do I balance compost material",
+                "compost heap material",
+                "tax return deadline",
+            ])
+        finally:
+            await provider.close()
+
+        assert len(compost) == 4
+        assert np.linalg.norm(compost) == pytest.approx(1.0, abs=1e-5)
+        assert cosine(compost, heap) > cosine(compost, tax)
+
+    @pytest.mark.asyncio
+    async def test_version_names_the_model(self, tmp_path):
+        """Test the fitted version is persisted and part of the model name"""
+        provider = LocalEmbeddingProvider(str(tmp_path), dimensions=4, n_features=2 ** 12, workers=1)
+        try:
+            version = await provider.fit(CORPUS)
+            refit = await provider.fit(CORPUS)
+        finally:
+            await provider.close()
+
+        reloaded = LocalEmbeddingProvider(str(tmp_path), dimensions=4, n_features=2 ** 12)
+        assert refit == version
+        assert reloaded.model == provider.model == f"local-lsa-{version}"
+
+    @pytest.mark.asyncio
+    async def test_follows_version_fitted_elsewhere(self, tmp_path):
+        """Test a running provider switches to a version another process fitted when refreshed"""
+        running = LocalEmbeddingProvider(str(tmp_path), dimensions=4, n_features=2 ** 12, workers=1)
+        fitter = LocalEmbeddingProvider(str(tmp_path), dimensions=4, n_features=2 ** 12, workers=1)
+        try:
+            first = await fitter.fit(CORPUS)
+            assert running.model == "local-lsa-unfitted"
+            running.refresh()
+            assert running.model == f"local-lsa-{first}"
+
+            second = await fitter.fit(CORPUS[:3])
+            assert running.version == first
+            running.refresh()
+            vectors = await running.embed(["compost"])
+        finally:
+            await running.close()
+            await fitter.close()
+
+        assert second != first
+        assert running.version == second
+        assert len(vectors[0]) == 4
+
+    @pytest.mark.asyncio
+    async def test_small_corpus_keeps_dimensions(self, tmp_path):
+        """Test fewer texts than dimensions still yields full-size vectors"""
+        provider = LocalEmbeddingProvider(str(tmp_path), dimensions=16, n_features=2 ** 12, workers=1)
+        try:
+            await provider.fit(CORPUS[:3])
+            vectors = await provider.embed(["compost"])
+        finally:
+            await provider.close()
+
+        assert len(vectors[0]) == 16
+
+    @pytest.mark.asyncio
+    async def test_unfitted_model(self, tmp_path):
+        """Test embedding before fitting fails instead of storing meaningless vectors"""
+        provider = LocalEmbeddingProvider(str(tmp_path))
+
+        assert provider.model == "local-lsa-unfitted"
+        with pytest.raises(RuntimeError):
+            await provider.embed(["text"])
+        assert await provider.embed([]) == []
+
+    def test_transform_matches_sklearn_pipeline(self):
+        """Test the worker projection equals TF-IDF followed by SVD"""
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfTransformer
+        from sklearn.preprocessing import normalize
+
+        counts = _vectorizer(2 ** 12).transform(CORPUS)
+        tfidf = TfidfTransformer(sublinear_tf=True).fit(counts)
+        svd = TruncatedSVD(n_components=4, random_state=0).fit(tfidf.transform(counts))
+
+        expected = normalize(svd.transform(tfidf.transform(counts)))
+        actual = _transform(CORPUS, tfidf.idf_.astype(np.float32), svd.components_.astype(np.float32))
+
+        assert actual == pytest.approx(expected, abs=1e-5)
+
+
+class TestEngineProvider:
+    """SimilarityEngine embeds through its provider"""
+
+    @pytest.mark.asyncio
+    async def test_engine_uses_provider(self):
+        """Test embeddings and model name come from the configured provider"""
+        engine = SimilarityEngine()
+        engine.provider = MagicMock(model="stub-model")
+        engine.provider.embed = AsyncMock(return_value=[[1.0, 0.0]])
+        engine.embedding_queue = EmbeddingMicroBatcher(engine.provider)
+
+        assert engine.model == "stub-model"
+        assert await engine._get_embeddings(["text"]) == [[1.0, 0.0]]
+
+    @pytest.mark.asyncio
+    async def test_fit_on_corpus_passages(self):
+        """Test the shared local model is fitted on every client's post passages, one tenant session each"""
+        engine = SimilarityEngine()
+        engine.provider = MagicMock()
+        engine.provider.fit = AsyncMock(return_value="v1")
+        posts = {
+            1: [SimpleNamespace(id="p1", content=" ".join(f"w{i}" for i in range(300)))],
+            2: [SimpleNamespace(id="p2", content="another client's post")],
+        }
+        sessions = []
+
+        def tenant_session(client_id):
+            sessions.append(client_id)
+            session = MagicMock()
+            session.__aenter__ = AsyncMock(return_value=client_id)
+            session.__aexit__ = AsyncMock(return_value=False)
+            return session
+
+        async def client_posts(db, client_id):
+            assert db == client_id
+            return posts[client_id]
+
+        with patch("app.services.kpi_service.kpi_service._active_client_ids", AsyncMock(return_value=[1, 2])), \
+             patch.object(engine, "_get_client_posts", side_effect=client_posts):
+            assert await engine.fit_embedding_model(session_factory=tenant_session) == "v1"
+
+        assert sessions == [1, 2]
+        texts = engine.provider.fit.await_args.args[0]
+        assert len(texts) > 2
+        assert texts[0].startswith("w0 w1")
+        assert texts[-1] == "another client's post"
+
+    def test_model_pinned_during_pass(self):
+        """Test the model version is refreshed only between scoring passes"""
+        engine = SimilarityEngine()
+        engine.provider = MagicMock()
+
+        with engine.model_pass():
+            with engine.model_pass():
+                pass
+
+        engine.provider.refresh.assert_called_once()
+
+    def test_pgvector_rejects_other_dimensions(self, monkeypatch):
+        """Test a provider whose vectors do not fit the pgvector column is rejected"""
+        monkeypatch.setattr(settings, "SIMILARITY_INDEX_BACKEND", "pgvector")
+        monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", 1536)
+        provider = MagicMock(model="local-lsa-v1", dimensions=256)
+
+        with patch.object(EmbeddingProviderFactory, "create_provider", return_value=provider):
+            with pytest.raises(ValueError):
+                SimilarityEngine()
@@ -0,0 +1,213 @@
+"""
+Tests for the in-process IVF similarity index
+"""
+
+import os
+import shutil
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.core.config import settings
+from app.services.similarity_service import SimilarityEngine
+from app.services.vector_index import IVFIndex
+
+
+def clustered_vectors(n: int, dimensions: int = 32, clusters: int = 10, seed: int = 0):
+    """Random vectors scattered around a few cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimensions))
+    labels = rng.integers(0, clusters, size=n)
+    return centres[labels] + 0.3 * rng.normal(size=(n, dimensions))
+
+
+def build_index(n: int = 2000, nprobe: int = 8) -> IVFIndex:
+    vectors = clustered_vectors(n)
+    return IVFIndex.build([f"p{i}" for i in range(n)], vectors, nlist=32, nprobe=nprobe)
+
+
+class TestIVFIndex:
+    """Approximate search, updates and persistence"""
+
+    def test_recall_against_brute_force(self):
+        """Test approximate top-k finds nearly all exact neighbours"""
+        index = build_index()
+        queries = clustered_vectors(50, seed=1)
+
+        assert index.recall(queries, k=10) >= 0.9
+
+    def test_all_clusters_probed_is_exact(self):
+        """Test probing every cluster gives the brute-force result"""
+        index = build_index(nprobe=1000)
+        query = clustered_vectors(1, seed=2)[0]
+
+        assert index.search(query, 10) == index.search_exact(query, 10)
+
+    def test_threshold_and_order(self):
+        """Test results are best first and respect the threshold"""
+        index = build_index()
+        query = clustered_vectors(1, seed=3)[0]
+
+        results = index.search(query, 20, threshold=0.5)
+
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+        assert all(score >= 0.5 for score in scores)
+
+    def test_save_and_load_memory_mapped(self, tmp_path):
+        """Test a saved index loads memory-mapped with the same results"""
+        index = build_index()
+        query = clustered_vectors(1, seed=4)[0]
+
+        version = index.save(tmp_path)
+        loaded = IVFIndex.load(tmp_path, nprobe=index.nprobe)
+
+        assert IVFIndex.current_version(tmp_path) == version
+        assert isinstance(loaded.vectors, np.memmap)
+        assert loaded.search(query, 10) == pytest.approx(index.search(query, 10))
+
+    def test_save_keeps_previous_version_only(self, tmp_path):
+        """Test superseded versions are pruned, keeping the one readers may hold"""
+        index = build_index(n=100)
+
+        first = index.save(tmp_path)
+        second = index.save(tmp_path)
+        third = index.save(tmp_path)
+
+        versions = {entry.name for entry in tmp_path.iterdir() if entry.is_dir()}
+        assert versions == {second, third}
+        assert first not in versions
+
+    def test_save_keeps_concurrent_writers_versions(self, tmp_path):
+        """Test a save does not prune a version another writer started after it read CURRENT"""
+        index = build_index(n=100)
+        first = index.save(tmp_path)
+        second = index.save(tmp_path)
+
+        # A concurrent writer's version, newer than anything saved here
+        (tmp_path / f"v{int(second[1:]) + 1}").mkdir()
+        with patch.object(IVFIndex, "current_version", return_value=first):
+            index.save(tmp_path)
+
+        assert f"v{int(second[1:]) + 1}" in {entry.name for entry in tmp_path.iterdir()}
+
+    def test_load_missing_index(self, tmp_path):
+        """Test loading before anything is saved"""
+        assert IVFIndex.load(tmp_path, nprobe=4) is None
+
+    def test_load_pruned_version(self, tmp_path):
+        """Test a version removed under a reader loads as missing, so it is rebuilt"""
+        version = build_index(n=100).save(tmp_path)
+        shutil.rmtree(tmp_path / version)
+
+        assert IVFIndex.load(tmp_path, nprobe=4) is None
+
+    def test_upsert_and_remove(self):
+        """Test updated rows are searchable and removed rows are gone"""
+        index = build_index(n=500)
+        new_vector = clustered_vectors(1, seed=5)[0]
+
+        updated = index.upsert(["p0", "new"], [new_vector, new_vector])
+
+        assert len(updated) == 501
+        assert updated.trained_size == index.trained_size
+        top_ids = {post_id for post_id, _ in updated.search(new_vector, 2)}
+        assert top_ids == {"p0", "new"}
+
+        removed = updated.remove(["new"])
+
+        assert len(removed) == 500
+        assert "new" not in removed.ids
+
+    def test_upsert_retrains_after_growth(self):
+        """Test the clustering is retrained once the index outgrows it"""
+        index = build_index(n=100)
+
+        grown = index.upsert(
+            [f"n{i}" for i in range(400)], clustered_vectors(400, seed=6)
+        )
+
+        assert grown.trained_size == 500
+
+    def test_upsert_into_empty_index(self):
+        """Test the first rows added to an empty index train it"""
+        empty = IVFIndex.build([], [], nlist=8, nprobe=2, dimensions=4)
+
+        index = empty.upsert(["p1"], [[1.0, 0.0, 0.0, 0.0]])
+
+        assert index.search([1.0, 0.0, 0.0, 0.0], 1) == [("p1", pytest.approx(1.0))]
+
+
+class TestIVFBackend:
+    """SimilarityEngine queries the IVF index for candidates"""
+
+    async def candidates(self, engine, posts, lexical=frozenset()):
+        db = MagicMock()
+        db.execute = AsyncMock()
+        db.commit = AsyncMock()
+        answer = SimpleNamespace(
+            id=1, raw_response="answer text", response_hash=None, run=SimpleNamespace(client_id=1)
+        )
+
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "_get_client_posts", AsyncMock(return_value=posts)), \
+             patch.object(engine, "sync_post_fingerprints", AsyncMock()) as fingerprints, \
+             patch.object(engine, "_lexical_candidates", AsyncMock(return_value=set(lexical))), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value={})), \
+             patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={1: [1.0, 0.0]})):
+            similarities = await engine.compute_similarities(db, answer)
+
+        fingerprints.assert_awaited_once_with(db, 1, posts)
+        return [s.post_id for s in similarities]
+
+    @pytest.mark.asyncio
+    async def test_candidates_come_from_index(self, tmp_path, monkeypatch):
+        """Test embedding candidates come from the index, not a corpus scan"""
+        monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+        engine = SimilarityEngine()
+        engine.index_backend = "ivf"
+
+        IVFIndex.build(
+            ["p1", "p2"], [[1.0, 0.0], [0.0, 1.0]], nlist=1, nprobe=1
+        ).save(engine._ivf_path(1))
+        posts = [
+            SimpleNamespace(id="p1", content="answer text", status="publish"),
+            SimpleNamespace(id="p2", content="unrelated", status="publish"),
+        ]
+
+        with patch.object(engine, "_nearest_posts", AsyncMock()) as scan:
+            assert await self.candidates(engine, posts) == ["p1"]
+
+        scan.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_post_added_after_index_built(self, tmp_path, monkeypatch):
+        """Test a post missing from the saved index is fingerprinted and still found by LSH"""
+        monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+        engine = SimilarityEngine()
+        engine.index_backend = "ivf"
+
+        IVFIndex.build(["p1"], [[0.0, 1.0]], nlist=1, nprobe=1).save(engine._ivf_path(1))
+        posts = [
+            SimpleNamespace(id="p1", content="unrelated", status="publish"),
+            SimpleNamespace(id="p2", content="answer text", status="publish"),
+        ]
+
+        assert await self.candidates(engine, posts, lexical={"p2"}) == ["p2"]
+
+    def test_sync_updates_saved_index(self, tmp_path, monkeypatch):
+        """Test synced embeddings and removals are applied to the saved index"""
+        monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+        engine = SimilarityEngine()
+        path = engine._ivf_path(1)
+        IVFIndex.build(["p1", "p2"], [[1.0, 0.0], [0.0, 1.0]], nlist=1, nprobe=1).save(path)
+
+        engine.update_ivf_index(1, {"p3": [0.6, 0.8]}, ["p2"])
+
+        index = IVFIndex.load(path, nprobe=1)
+        assert sorted(index.ids) == ["p1", "p3"]
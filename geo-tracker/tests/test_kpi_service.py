@@ -0,0 +1,793 @@
+"""
+Tests for set-based daily KPI computation
+
+The grouped queries run against an in-memory SQLite copy of the KPI tables.
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from unittest.mock import AsyncMock, patch
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app import models
+from app.services.kpi_service import COUNT_FIELDS, KpiService
+from app.services.search_service import SearchService
+
+TABLES = [
+    "clients", "queries", "runs", "answers", "citations", "similarities",
+    "answer_features", "metrics", "metric_rollups", "kpi_weight_profiles", "kpi_backfill_jobs", "kpi_backfill_units",
+    "posts", "wordpress_entities",
+]
+
+DAY = date(2024, 3, 1)
+
+
+class SyncSession:
+    """Awaitable facade over a synchronous session"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.statements = 0
+        self.add = session.add
+        self.commit = AsyncMock(side_effect=session.commit)
+
+    async def flush(self):
+        self.session.flush()
+
+    async def get(self, entity, ident):
+        return self.session.get(entity, ident)
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements += 1
+        return self.session.execute(statement, *args, **kwargs)
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        with self.session.begin_nested():
+            yield
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(
+        engine, tables=[models.Base.metadata.tables[name] for name in TABLES]
+    )
+    with Session(engine) as session:
+        session.add_all([
+            models.Client(id=1, name="Acme", domain="acme.com", wordpress_url="https://acme.com", jwt_secret="s"),
+            models.Client(id=2, name="Other", domain="other.com", wordpress_url="https://other.com", jwt_secret="s"),
+            models.Client(id=3, name="Gone", domain="gone.com", wordpress_url="https://gone.com",
+                          jwt_secret="s", is_active=False),
+            models.Query(id=10, client_id=1, query_text="best anvils", topic="anvils"),
+            models.Query(id=11, client_id=1, query_text="old query", topic="anvils", is_active=False),
+            models.Query(id=20, client_id=2, query_text="other", topic="misc"),
+            models.Query(id=30, client_id=3, query_text="gone", topic="misc"),
+        ])
+        session.flush()
+        yield SyncSession(session)
+
+
+def add_run(db, run_id, client_id, query_id, engine="perplexity", status="completed",
+            created_at=datetime(2024, 3, 1, 12), answer=None, citations=(), score=None):
+    """A run with an optional answer, its cited domains, best similarity score and features"""
+    session = db.session
+    session.add(models.Run(
+        id=run_id, client_id=client_id, query_id=query_id, engine=engine,
+        status=status, created_at=created_at,
+    ))
+    if answer is not None:
+        client = session.get(models.Client, client_id)
+        session.add(models.Answer(id=run_id, run_id=run_id, raw_response=answer, response_hash=str(run_id)))
+        for position, domain in enumerate(citations):
+            session.add(models.Citation(
+                answer_id=run_id, url=f"https://{domain}/{position}", domain=domain, position=position,
+            ))
+        if score is not None:
+            session.add(models.Similarity(
+                answer_id=run_id, post_id="p1", similarity_score=score, similarity_type="embedding",
+            ))
+        session.add(models.AnswerFeature(
+            client_id=client_id,
+            answer_id=run_id,
+            cites_client=client.domain in citations,
+            cited_domains=len(set(citations)),
+            citation_count=len(citations),
+            mentions_client=client.name.lower() in answer.lower(),
+            mentions_entity=False,
+            best_similarity=score,
+        ))
+    session.flush()
+
+
+class TestDailyMetrics:
+    """One grouped query per day instead of per-combination loops"""
+
+    @pytest.mark.asyncio
+    async def test_rates_per_client_query_engine(self, db):
+        """Test each group's rates, counts and metadata"""
+        add_run(db, 1, 1, 10, answer="Acme makes anvils", citations=["acme.com", "acme.com", "wiki.org"], score=0.9)
+        add_run(db, 2, 1, 10, answer="anvils are heavy", citations=["wiki.org"], score=0.5)
+        add_run(db, 3, 1, 10, answer="ACME again", citations=["acme.com"])
+        add_run(db, 4, 1, 10, status="failed")
+        add_run(db, 5, 1, 10, engine="brave", answer="nothing", citations=[])
+        add_run(db, 6, 2, 20, status="failed", answer="Other")
+
+        metrics = await KpiService()._compute_day_metrics(db, DAY)
+
+        by_key = {(m.client_id, m.query_id, m.engine): m for m in metrics}
+        assert set(by_key) == {(1, 10, "perplexity"), (1, 10, "brave"), (2, 20, "perplexity")}
+
+        metric = by_key[(1, 10, "perplexity")]
+        assert metric.total_queries == 4
+        assert metric.successful_runs == 3
+        assert metric.inclusion_rate == pytest.approx(200 / 3)
+        assert metric.extraction_rate == pytest.approx(100 / 3)
+        assert metric.presence_rate == pytest.approx(200 / 3)
+        assert metric.co_visibility_rate == pytest.approx(100 / 3)
+        assert metric.total_citations == 5
+        assert metric.client_mentions == 2
+        assert metric.metadata_json["answer_ids"] == [1, 2, 3]
+        assert metric.visibility_index == pytest.approx(
+            0.4 * 200 / 3 + 0.3 * 100 / 3 + 0.2 * 200 / 3 + 0.1 * 100 / 3
+        )
+
+        assert by_key[(1, 10, "brave")].inclusion_rate == 0.0
+        # No successful runs: zero rates, counts still recorded
+        failed = by_key[(2, 20, "perplexity")]
+        assert failed.total_queries == 1
+        assert failed.presence_rate == 0.0
+        assert failed.metadata_json["successful_runs"] == 0
+
+    @pytest.mark.asyncio
+    async def test_only_active_clients_queries_and_the_day(self, db):
+        """Test inactive clients and queries and other days are left out"""
+        add_run(db, 1, 1, 11, answer="Acme")
+        add_run(db, 2, 3, 30, answer="Gone")
+        add_run(db, 3, 1, 10, answer="Acme", created_at=datetime(2024, 3, 2, 0, 0, 1))
+        add_run(db, 4, 1, 10, answer="Acme", created_at=datetime(2024, 3, 1, 23, 59, 59))
+
+        metrics = await KpiService()._compute_day_metrics(db, DAY)
+
+        assert [(m.client_id, m.query_id, m.total_queries) for m in metrics] == [(1, 10, 1)]
+
+    @pytest.mark.asyncio
+    async def test_query_count_independent_of_combinations(self, db):
+        """Test the day costs the same few statements however many groups there are"""
+        for run_id in range(1, 41):
+            engine = ["perplexity", "brave", "bing", "google_sge"][run_id % 4]
+            add_run(db, run_id, 1 + run_id % 2, 10 if run_id % 2 == 0 else 20, engine=engine,
+                    answer=f"answer {run_id}", citations=["acme.com"])
+        db.statements = 0
+
+        metrics = await KpiService().compute_daily_metrics(db, DAY)
+
+        assert len(metrics) == 4
+        # Grouped counts, answer ids, stored rows, one upsert, delete of stale rows,
+        # then a delete and insert for each of the day's week and month rollups
+        assert db.statements == 9
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_kpis_read_features_not_text(self, db):
+        """Test presence comes from stored flags, including entity mentions"""
+        add_run(db, 1, 1, 10, answer="Acme")
+        add_run(db, 2, 1, 10, answer="the Roadrunner 3000")
+        db.session.get(models.AnswerFeature, 1).mentions_client = False
+        db.session.get(models.AnswerFeature, 2).mentions_entity = True
+        db.session.flush()
+
+        metrics = await KpiService()._compute_day_metrics(db, DAY)
+
+        assert metrics[0].presence_rate == pytest.approx(50.0)
+        assert metrics[0].client_mentions == 0
+
+
+class TestIncrementalMetrics:
+    """Day metrics updated as runs finish"""
+
+    @pytest.mark.asyncio
+    async def test_recorded_runs_match_recompute(self, db):
+        """Test run-by-run counts and rates equal the nightly recompute, with no drift"""
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme makes anvils", citations=["acme.com", "wiki.org"], score=0.9)
+        add_run(db, 2, 1, 10, answer="anvils are heavy", citations=["wiki.org"])
+        add_run(db, 3, 1, 10, status="failed")
+        add_run(db, 4, 1, 10, engine="brave", answer="ACME", citations=["acme.com"])
+
+        for run_id in (1, 2, 3):
+            metric = await service.record_run(db, db.session.get(models.Run, run_id))
+        await service.record_run(db, db.session.get(models.Run, 4))
+        db.session.flush()
+
+        assert metric.total_queries == 3
+        assert metric.successful_runs == 2
+        assert metric.answer_count == 2
+        assert metric.inclusion_rate == pytest.approx(50.0)
+        assert metric.extraction_rate == pytest.approx(50.0)
+        assert metric.metadata_json["answer_ids"] == [1, 2]
+
+        incremental = {
+            (m.client_id, m.query_id, m.engine): [getattr(m, f) for f in COUNT_FIELDS] + [m.visibility_index]
+            for m in db.session.query(models.Metric).all()
+        }
+        recomputed = await service.compute_daily_metrics(db, DAY)
+
+        assert incremental == {
+            (m.client_id, m.query_id, m.engine): [getattr(m, f) for f in COUNT_FIELDS] + [m.visibility_index]
+            for m in recomputed
+        }
+        assert db.session.query(models.Metric).count() == 2
+
+    @pytest.mark.asyncio
+    async def test_recompute_reports_drift(self, db):
+        """Test the nightly job replaces a drifted row"""
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme")
+        metric = await service.record_run(db, db.session.get(models.Run, 1))
+        metric.total_queries += 1
+        db.session.flush()
+
+        await service.compute_daily_metrics(db, DAY)
+
+        (stored,) = db.session.query(models.Metric).all()
+        assert stored.total_queries == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_does_not_break_run(self, db):
+        """Test a failed update is logged and returns None"""
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme")
+
+        with patch.object(service, "_apply_run", AsyncMock(side_effect=RuntimeError("lock timeout"))):
+            assert await service.record_run(db, db.session.get(models.Run, 1)) is None
+
+
+class TestMetricUpsert:
+    """Daily rows written in place under their unique key"""
+
+    @pytest.mark.asyncio
+    async def test_rerun_updates_rows_in_place(self, db):
+        """Test recomputing a day keeps one row per key with the same ids"""
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme")
+        add_run(db, 2, 1, 10, engine="brave", answer="Acme")
+
+        await service.compute_daily_metrics(db, DAY)
+        ids = sorted(m.id for m in db.session.query(models.Metric))
+        add_run(db, 3, 1, 10, answer="nothing")
+        await service.compute_daily_metrics(db, DAY)
+
+        stored = {m.engine: m for m in db.session.query(models.Metric)}
+        assert sorted(m.id for m in stored.values()) == ids
+        assert stored["perplexity"].total_queries == 2
+        assert stored["perplexity"].presence_rate == pytest.approx(50.0)
+
+    @pytest.mark.asyncio
+    async def test_duplicate_key_rejected_and_stale_rows_removed(self, db):
+        """Test the unique key holds and combinations without runs are deleted"""
+        from sqlalchemy.exc import IntegrityError
+
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme")
+        await service.compute_daily_metrics(db, DAY)
+
+        with pytest.raises(IntegrityError):
+            with db.session.begin_nested():
+                db.session.add(models.Metric(client_id=1, query_id=10, engine="perplexity", date=datetime(2024, 3, 1)))
+                db.session.flush()
+
+        db.session.add(models.Metric(client_id=1, query_id=11, engine="perplexity", date=datetime(2024, 3, 1)))
+        db.session.flush()
+        await service.compute_daily_metrics(db, DAY)
+
+        assert [(m.query_id, m.engine) for m in db.session.query(models.Metric)] == [(10, "perplexity")]
+
+
+class TestParallelMetrics:
+    """Clients computed concurrently in their own sessions"""
+
+    @pytest.mark.asyncio
+    async def test_bounded_concurrency_and_isolation(self):
+        """Test at most `concurrency` clients run at once and a failure is contained"""
+        service = KpiService()
+        active, peak, finished = 0, 0, []
+
+        async def compute(session_factory, client_id, target_date):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            if client_id == 3:
+                raise RuntimeError("deadlock detected")
+            return 2, client_id % 2
+
+        with patch.object(service, "_compute_client_day", AsyncMock(side_effect=compute)):
+            summary = await service.compute_daily_metrics_parallel(
+                DAY, client_ids=list(range(1, 9)), concurrency=3,
+                session_factory=object, progress=lambda done, total: finished.append((done, total)),
+            )
+
+        assert peak == 3
+        assert summary["succeeded"] == 7
+        assert summary["failed"] == 1
+        assert summary["metrics"] == 14
+        assert summary["drifted"] == 3
+        assert summary["errors"] == {3: "deadlock detected"}
+        assert finished[-1] == (8, 8)
+
+    @pytest.mark.asyncio
+    async def test_client_scoped_session(self, db):
+        """Test each client's day is recomputed and replaced only in its own session"""
+        add_run(db, 1, 1, 10, answer="Acme")
+        add_run(db, 2, 2, 20, answer="Other")
+        db.session.add(models.Metric(client_id=2, query_id=20, engine="perplexity", date=datetime(2024, 3, 1)))
+        db.session.flush()
+        opened = []
+
+        @asynccontextmanager
+        async def session_factory(client_id):
+            opened.append(client_id)
+            yield db
+
+        summary = await KpiService().compute_daily_metrics_parallel(
+            DAY, client_ids=[1], session_factory=session_factory
+        )
+
+        assert opened == [1]
+        assert summary["metrics"] == 1
+        assert sorted(m.client_id for m in db.session.query(models.Metric)) == [1, 2]
+
+
+class TestAnswerFeatures:
+    """Flags computed while an answer is stored"""
+
+    @pytest.mark.asyncio
+    async def test_features_of_stored_answer(self, db):
+        """Test domain, citation and name/entity flags from the collector result"""
+        db.session.add_all([
+            models.Post(id="p1", client_id=1, title="t", content="c", url="https://acme.com/p1", slug="p1"),
+            models.WordPressEntity(id="e1", client_id=1, post_id="p1", name="Roadrunner", type="product"),
+            models.WordPressEntity(id="e2", client_id=2, post_id=None, name="Coyote", type="person"),
+        ])
+        add_run(db, 1, 1, 10)
+        answer = models.Answer(id=1, run_id=1, raw_response="The ROADRUNNER beats the coyote", response_hash="h")
+        citations = [{"domain": "acme.com"}, {"domain": "wiki.org"}, {"domain": "acme.com"}]
+
+        service = SearchService()
+        run = db.session.get(models.Run, 1)
+        matchers = await service._client_matchers(db, 1)
+        features = service._answer_features(run, answer, citations, matchers)
+
+        assert features.cites_client is True
+        assert features.cited_domains == 2
+        assert features.citation_count == 3
+        assert features.mentions_client is False
+        assert features.mentions_entity is True
+        assert features.best_similarity is None
+
+        # Whole words only, and the client's names are loaded once
+        db.statements = 0
+        answer.raw_response = "Acmeville sells roadrunners; ask (acme) first"
+        features = service._answer_features(run, answer, citations, await service._client_matchers(db, 1))
+        assert (features.mentions_client, features.mentions_entity) == (True, False)
+        assert db.statements == 0
+
+    @pytest.mark.asyncio
+    async def test_best_similarity_follows_rows(self, db):
+        """Test the stored best score is refreshed from similarity rows"""
+        from app.services.similarity_service import SimilarityEngine
+
+        add_run(db, 1, 1, 10, answer="Acme", score=0.5)
+        db.session.add(models.Similarity(answer_id=1, post_id="p2", similarity_score=0.9, similarity_type="ngram"))
+
+        await SimilarityEngine().update_best_similarity(db, [1])
+        db.session.expire_all()
+
+        assert db.session.get(models.AnswerFeature, 1).best_similarity == pytest.approx(0.9)
+
+
+class TestRollups:
+    """Week and month rollups and the reports read from them"""
+
+    @staticmethod
+    def rollups(db):
+        return {
+            (r.client_id, r.period, r.period_start.date(), r.engine, r.topic): (r.total_queries, r.successful_runs)
+            for r in db.session.query(models.MetricRollup)
+        }
+
+    @pytest.mark.asyncio
+    async def test_rollups_sum_days_and_refresh_changed_periods(self, db):
+        """Test week and month rows are the sums of their days, rewritten only where a day changed"""
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme", created_at=datetime(2024, 3, 1, 9))
+        add_run(db, 2, 1, 10, status="failed", created_at=datetime(2024, 3, 1, 10))
+        add_run(db, 3, 1, 10, answer="anvils", created_at=datetime(2024, 3, 4, 9))
+        add_run(db, 4, 1, 10, engine="brave", answer="Acme", created_at=datetime(2024, 3, 4, 9))
+
+        await service.compute_daily_metrics(db, DAY)
+        await service.compute_daily_metrics(db, date(2024, 3, 4))
+
+        assert self.rollups(db) == {
+            (1, "week", date(2024, 2, 26), "perplexity", "anvils"): (2, 1),
+            (1, "week", date(2024, 3, 4), "perplexity", "anvils"): (1, 1),
+            (1, "week", date(2024, 3, 4), "brave", "anvils"): (1, 1),
+            (1, "month", date(2024, 3, 1), "perplexity", "anvils"): (3, 2),
+            (1, "month", date(2024, 3, 1), "brave", "anvils"): (1, 1),
+        }
+        week_id = db.session.query(models.MetricRollup.id).filter_by(
+            period="week", period_start=datetime(2024, 2, 26)
+        ).scalar()
+
+        add_run(db, 5, 1, 10, answer="late", created_at=datetime(2024, 3, 4, 18))
+        await service.compute_daily_metrics(db, date(2024, 3, 4))
+
+        rollups = self.rollups(db)
+        assert rollups[(1, "week", date(2024, 3, 4), "perplexity", "anvils")] == (2, 2)
+        assert rollups[(1, "month", date(2024, 3, 1), "perplexity", "anvils")] == (4, 3)
+        # The earlier week was not rewritten
+        assert db.session.query(models.MetricRollup.id).filter_by(
+            period="week", period_start=datetime(2024, 2, 26)
+        ).scalar() == week_id
+
+    def test_plan_prefers_closed_months_then_weeks(self):
+        """Test whole closed months, then whole closed weeks, then days"""
+        from app.services.report_service import ReportService
+
+        plan = ReportService().plan_segments
+
+        assert plan(date(2024, 1, 29), date(2024, 3, 5), today=date(2024, 3, 10)) == [
+            ("day", date(2024, 1, 29), date(2024, 2, 1)),
+            ("month", date(2024, 2, 1), date(2024, 3, 1)),
+            ("day", date(2024, 3, 1), date(2024, 3, 6)),
+        ]
+        assert plan(date(2024, 3, 1), date(2024, 3, 20), today=date(2024, 3, 19)) == [
+            ("day", date(2024, 3, 1), date(2024, 3, 4)),
+            ("week", date(2024, 3, 4), date(2024, 3, 11)),
+            ("week", date(2024, 3, 11), date(2024, 3, 18)),
+            ("day", date(2024, 3, 18), date(2024, 3, 21)),
+        ]
+        # The current month is still changing, so it is read day by day
+        assert plan(date(2024, 3, 1), date(2024, 3, 31), today=date(2024, 3, 31))[-1] == (
+            "day", date(2024, 3, 25), date(2024, 4, 1)
+        )
+
+    @pytest.mark.asyncio
+    async def test_report_from_rollups_matches_daily_rows(self, db):
+        """Test a report read from rollups equals one summed from daily metrics"""
+        from app.services.report_service import ReportService
+
+        service = KpiService()
+        days = [date(2024, 2, 5), date(2024, 2, 20), DAY]
+        for run_id, day in enumerate(days * 2, start=1):
+            add_run(
+                db, run_id, 1, 10, engine="brave" if run_id % 2 else "perplexity",
+                answer="Acme anvils" if run_id % 3 else "anvils",
+                citations=["acme.com", "wiki.org"] if run_id < 4 else ["wiki.org"],
+                created_at=datetime.combine(day, datetime.min.time()).replace(hour=12),
+            )
+        for day in days:
+            await service.compute_daily_metrics(db, day)
+
+        client = db.session.get(models.Client, 1)
+        reports = ReportService()
+        from_rollups = await reports.get_report(db, client, date(2024, 2, 1), DAY, today=date(2024, 4, 1))
+        from_days = await reports.get_report(db, client, date(2024, 2, 1), DAY, today=date(2024, 2, 1))
+
+        assert reports.plan_segments(date(2024, 2, 1), DAY, today=date(2024, 4, 1))[0][0] == "month"
+        for key in ("metrics", "engine_breakdown", "topic_breakdown", "top_citations"):
+            assert from_rollups[key] == from_days[key]
+        assert from_rollups["metrics"]["total_queries"] == 6
+        assert from_rollups["top_citations"] == [
+            {"domain": "wiki.org", "citations": 6},
+            {"domain": "acme.com", "citations": 3},
+        ]
+
+        brave = await reports.get_report(db, client, date(2024, 2, 1), DAY, engines=["brave"], today=date(2024, 4, 1))
+        assert set(brave["engine_breakdown"]) == {"brave"}
+        assert brave["metrics"]["total_queries"] == 3
+
+    @pytest.mark.asyncio
+    async def test_recorded_run_in_closed_week_reaches_report(self, db):
+        """Test a run recorded into an ended week updates its rollups and the cached report"""
+        from app.services.report_service import ReportService
+
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme", created_at=datetime(2024, 3, 4, 9))
+        await service.compute_daily_metrics(db, date(2024, 3, 4))
+
+        client = db.session.get(models.Client, 1)
+        week = (date(2024, 3, 4), date(2024, 3, 10))
+        reports = ReportService()
+        before = await reports.get_report(db, client, *week, today=date(2024, 3, 11))
+        assert reports.plan_segments(*week, today=date(2024, 3, 11)) == [
+            ("week", date(2024, 3, 4), date(2024, 3, 11))
+        ]
+
+        add_run(db, 2, 1, 10, status="failed", created_at=datetime(2024, 3, 5, 9))
+        await service.record_run(db, db.session.get(models.Run, 2))
+
+        after = await reports.get_report(db, client, *week, today=date(2024, 3, 11))
+        assert (before["metrics"]["total_queries"], after["metrics"]["total_queries"]) == (1, 2)
+        assert after["metrics"]["successful_runs"] == 1
+        assert self.rollups(db)[(1, "week", date(2024, 3, 4), "perplexity", "anvils")] == (2, 1)
+
+
+    @pytest.mark.asyncio
+    async def test_recompute_reaches_cached_report(self, db):
+        """Test a recompute of an ended day replaces a report another process cached"""
+        from app.services.report_service import ReportService
+
+        service = KpiService()
+        add_run(db, 1, 1, 10, answer="Acme", created_at=datetime(2024, 3, 4, 9))
+        await service.compute_daily_metrics(db, date(2024, 3, 4))
+
+        client = db.session.get(models.Client, 1)
+        week = (date(2024, 3, 4), date(2024, 3, 10))
+        reports = ReportService()
+        before = await reports.get_report(db, client, *week, today=date(2024, 3, 11))
+
+        # Written straight to the runs, as a late import would, then recomputed nightly
+        add_run(db, 2, 1, 10, answer="Acme", created_at=datetime(2024, 3, 6, 9))
+        await service.compute_daily_metrics(db, date(2024, 3, 6))
+
+        after = await reports.get_report(db, client, *week, today=date(2024, 3, 11))
+        assert (before["metrics"]["total_queries"], after["metrics"]["total_queries"]) == (1, 2)
+
+class TestBackfill:
+    """Checkpointed recomputation of date ranges"""
+
+    @staticmethod
+    def session_factory(db):
+        @asynccontextmanager
+        async def factory(client_id):
+            # A savepoint stands in for each unit's own transaction
+            async with db.begin_nested():
+                yield db
+        return factory
+
+    @pytest.mark.asyncio
+    async def test_failed_units_resume_and_writes_are_idempotent(self, db):
+        """Test a rerun only runs the units that did not commit, and replaces rather than adds"""
+        from app.services.kpi_backfill_service import KpiBackfillService
+        from app.services.kpi_service import kpi_service
+
+        for run_id, day in enumerate((29, 1, 2), start=1):
+            created_at = datetime(2024, 2 if day == 29 else 3, day, 12)
+            add_run(db, run_id, 1, 10, answer="Acme", created_at=created_at)
+            add_run(db, run_id + 10, 2, 20, answer="Other", created_at=created_at)
+
+        service = KpiBackfillService()
+        service.chunk_size = 4
+        factory = self.session_factory(db)
+        job_id = await service.create_job(date(2024, 2, 29), date(2024, 3, 2), [2, 1], session_factory=factory)
+
+        compute = kpi_service._compute_day_metrics
+
+        async def flaky(db, target_date, client_id=None):
+            if (client_id, target_date) == (2, DAY):
+                raise RuntimeError("statement timeout")
+            return await compute(db, target_date, client_id)
+
+        progress = []
+        with patch.object(kpi_service, "_compute_day_metrics", side_effect=flaky):
+            summary = await service.run_job(
+                job_id, concurrency=2, session_factory=factory,
+                progress=lambda finished, total: progress.append((finished, total)),
+            )
+
+        assert (summary["units"], summary["succeeded"], summary["failed"], summary["remaining"]) == (6, 5, 1, 1)
+        assert progress == [(4, 6), (6, 6)]
+        job = await service.get_job(job_id, session_factory=factory)
+        assert job["status"] == "failed"
+        assert job["units"] == {"completed": 5, "failed": 1}
+        assert db.session.query(models.Metric).count() == 5
+
+        summary = await service.run_job(job_id, session_factory=factory)
+
+        assert (summary["units"], summary["succeeded"], summary["remaining"]) == (1, 1, 0)
+        job = await service.get_job(job_id, session_factory=factory)
+        assert job["status"] == "completed"
+        assert job["units"] == {"completed": 6}
+        assert db.session.query(models.Metric).count() == 6
+        assert db.session.query(models.MetricRollup).filter_by(client_id=2, period="month").count() == 2
+
+        second = await service.create_job(date(2024, 2, 29), date(2024, 3, 2), [1, 2], session_factory=factory)
+        await service.run_job(second, session_factory=factory)
+        assert db.session.query(models.Metric).count() == 6
+
+    @pytest.mark.asyncio
+    async def test_attempts_are_bounded(self, db):
+        """Test a unit that keeps failing stops being retried after max_attempts runs"""
+        from app.services.kpi_backfill_service import KpiBackfillService
+        from app.services.kpi_service import kpi_service
+
+        service = KpiBackfillService()
+        service.max_attempts = 2
+        factory = self.session_factory(db)
+        job_id = await service.create_job(DAY, DAY, [1], session_factory=factory)
+
+        with patch.object(kpi_service, "_compute_day_metrics", AsyncMock(side_effect=RuntimeError("boom"))):
+            assert (await service.run_job(job_id, session_factory=factory))["units"] == 1
+            assert (await service.run_job(job_id, session_factory=factory))["units"] == 1
+            assert (await service.run_job(job_id, session_factory=factory))["units"] == 0
+
+        (unit,) = db.session.query(models.KpiBackfillUnit).all()
+        assert (unit.status, unit.attempts, unit.error_message) == ("failed", 2, "boom")
+
+    @pytest.mark.asyncio
+    async def test_rejects_reversed_range(self, db):
+        """Test date_from after date_to is refused"""
+        from app.services.kpi_backfill_service import KpiBackfillService
+
+        with pytest.raises(ValueError):
+            await KpiBackfillService().create_job(DAY, date(2024, 2, 1), [1], session_factory=self.session_factory(db))
+
+    @pytest.mark.asyncio
+    async def test_job_visible_only_to_its_client(self, db):
+        """Test a client sees only jobs covering just itself"""
+        from app.services.kpi_backfill_service import KpiBackfillService
+
+        service = KpiBackfillService()
+        factory = self.session_factory(db)
+        own = await service.create_job(DAY, DAY, [1], session_factory=factory)
+        shared = await service.create_job(DAY, DAY, [1, 2], session_factory=factory)
+
+        assert (await service.get_job(own, session_factory=factory, client_id=1))["id"] == own
+        assert await service.get_job(own, session_factory=factory, client_id=2) is None
+        assert await service.get_job(shared, session_factory=factory, client_id=1) is None
+        assert (await service.get_job(shared, session_factory=factory))["client_ids"] == [1, 2]
+
+
+class TestWhatIf:
+    """Vectorized KPIs over an in-memory extract"""
+
+    @staticmethod
+    def seed(db):
+        add_run(db, 1, 1, 10, answer="Acme makes anvils", citations=["acme.com", "wiki.org"], score=0.9)
+        add_run(db, 2, 1, 10, answer="anvils are heavy", citations=["wiki.org"], score=0.6)
+        add_run(db, 3, 1, 10, status="failed")
+        add_run(db, 4, 1, 10, engine="brave", answer="ACME", citations=["acme.com"], score=0.85,
+                created_at=datetime(2024, 3, 2, 8))
+        add_run(db, 5, 2, 20, answer="Other", citations=["other.com"], score=0.99)
+
+    @pytest.mark.asyncio
+    async def test_matches_stored_metrics(self, db):
+        """Test counts and rates per query, engine and day equal the stored daily metrics"""
+        from app.services.kpi_frame_service import KpiFrameService
+
+        self.seed(db)
+        service = KpiService()
+        await service.compute_daily_metrics(db, DAY)
+        await service.compute_daily_metrics(db, date(2024, 3, 2))
+
+        frame = await KpiFrameService().load_extract(db, 1, DAY, date(2024, 3, 2))
+        result = KpiFrameService().compute(frame, by=("query_id", "engine", "date"))
+
+        assert len(frame) == 4
+        stored = db.session.query(models.Metric).filter_by(client_id=1).all()
+        assert len(result) == len(stored)
+        for metric in stored:
+            row = result.loc[(metric.query_id, metric.engine, pd.Timestamp(metric.date))]
+            assert [int(row[f]) for f in COUNT_FIELDS] == [getattr(metric, f) for f in COUNT_FIELDS]
+            for rate in ("inclusion_rate", "extraction_rate", "presence_rate", "co_visibility_rate", "visibility_index"):
+                assert row[rate] == pytest.approx(getattr(metric, rate))
+
+    @pytest.mark.asyncio
+    async def test_threshold_weights_and_sweep(self, db):
+        """Test other thresholds and weights, and that a sweep agrees with single computations"""
+        from app.services.kpi_frame_service import KpiFrameService
+
+        self.seed(db)
+        service = KpiFrameService()
+        frame = await service.load_extract(db, 1, DAY, date(2024, 3, 2))
+
+        overall = service.compute(frame, by=(), extraction_threshold=0.5, weights={"inclusion": 1.0})
+        assert overall["extraction_rate"].iloc[0] == pytest.approx(100.0)
+        assert overall["visibility_index"].iloc[0] == pytest.approx(
+            1.0 * 200 / 3 + 0.3 * 100.0 + 0.2 * 200 / 3 + 0.1 * 100 / 3
+        )
+
+        sweep = service.sweep_extraction_thresholds(frame, [0.5, 0.82, 0.95], by=("engine",))
+        for threshold in (0.5, 0.82, 0.95):
+            single = service.compute(frame, by=("engine",), extraction_threshold=threshold)
+            for engine in ("perplexity", "brave"):
+                row = sweep.loc[(engine, threshold)]
+                assert row["extraction_rate"] == pytest.approx(single.loc[engine, "extraction_rate"])
+                assert row["visibility_index"] == pytest.approx(single.loc[engine, "visibility_index"])
+
+        with pytest.raises(ValueError):
+            service.compute(frame, by=("client_name",))
+        with pytest.raises(ValueError):
+            service.compute(frame, weights={"typo": 1.0})
+
+    @pytest.mark.asyncio
+    async def test_extract_cached(self, db):
+        """Test repeated what-ifs reuse the extract until refreshed"""
+        from app.services.kpi_frame_service import KpiFrameService
+
+        self.seed(db)
+        service = KpiFrameService()
+        db.statements = 0
+
+        first = await service.get_extract(db, 1, DAY, DAY)
+        assert await service.get_extract(db, 1, DAY, DAY) is first
+        assert db.statements == 1
+
+        await service.get_extract(db, 1, DAY, DAY, refresh=True)
+        assert db.statements == 2
+
+
+class TestWeightProfiles:
+    """Per-client visibility weights applied at read time"""
+
+    @pytest.mark.asyncio
+    async def test_versions_and_validation(self, db):
+        """Test defaults are version 0, each change bumps the version and bad weights are refused"""
+        service = KpiService()
+
+        assert await service.get_weight_profile(db, 1) == (0, {
+            "inclusion": 0.4, "extraction": 0.3, "presence": 0.2, "co_visibility": 0.1,
+        })
+
+        version, weights = await service.set_weight_profile(db, 1, {"inclusion": 0.7})
+        assert (version, weights["inclusion"], weights["presence"]) == (1, 0.7, 0.2)
+
+        version, weights = await service.set_weight_profile(db, 1, {"presence": 0.0})
+        assert (version, weights["inclusion"], weights["presence"]) == (2, 0.7, 0.0)
+        assert (await service.get_weight_profile(db, 2))[0] == 0
+
+        # Unchanged weights, including an empty update, keep the version
+        assert (await service.set_weight_profile(db, 1, {}))[0] == 2
+        assert (await service.set_weight_profile(db, 1, {"inclusion": 0.7}))[0] == 2
+        assert await service.set_weight_profile(db, 2, {"inclusion": 0.4}) == (0, {
+            "inclusion": 0.4, "extraction": 0.3, "presence": 0.2, "co_visibility": 0.1,
+        })
+        assert db.session.query(models.KpiWeightProfile).filter_by(client_id=2).count() == 0
+
+        for bad in ({"typo": 1.0}, {"inclusion": -1.0}, dict.fromkeys(("inclusion", "extraction", "presence", "co_visibility"), 0.0)):
+            with pytest.raises(ValueError):
+                await service.set_weight_profile(db, 1, bad)
+
+    @pytest.mark.asyncio
+    async def test_report_uses_profile_without_recompute(self, db):
+        """Test a weight change shows in reports at once while stored metrics stay untouched"""
+        from app.services.report_service import ReportService
+
+        add_run(db, 1, 1, 10, answer="Acme", citations=["acme.com"], score=0.9)
+        add_run(db, 2, 1, 10, answer="anvils", citations=["wiki.org"])
+        service = KpiService()
+        await service.compute_daily_metrics(db, DAY)
+        stored = {m.id: (m.updated_at, m.visibility_index) for m in db.session.query(models.Metric)}
+
+        reports = ReportService()
+        client = db.session.get(models.Client, 1)
+        today = date(2024, 3, 10)
+        before = await reports.get_report(db, client, DAY, DAY, today=today)
+        assert before["weights_version"] == 0
+        assert before["metrics"]["visibility_index"] == pytest.approx(0.4 * 50 + 0.3 * 50 + 0.2 * 50)
+
+        await service.set_weight_profile(db, 1, {"inclusion": 1.0, "extraction": 0.0, "presence": 0.0, "co_visibility": 0.0})
+        db.statements = 0
+        after = await reports.get_report(db, client, DAY, DAY, today=today)
+
+        assert after["weights_version"] == 1
+        assert after["metrics"]["visibility_index"] == pytest.approx(50.0)
+        assert after["metrics"]["inclusion_rate"] == before["metrics"]["inclusion_rate"]
+        assert {m.id: (m.updated_at, m.visibility_index) for m in db.session.query(models.Metric)} == stored
+
+        # Same profile version and stored data: served from cache after the two lookups
+        statements = db.statements
+        cached = await reports.get_report(db, client, DAY, DAY, today=today)
+        assert db.statements == statements + 2
+        assert cached["metrics"] == after["metrics"]
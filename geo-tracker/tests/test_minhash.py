@@ -0,0 +1,136 @@
+"""
+Tests for MinHash signatures and the LSH candidate index
+"""
+
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services.similarity_service import SimilarityEngine
+from app.services.text import LSHIndex, MinHasher
+
+
+def random_shingles(seed: int, size: int = 200, vocabulary: int = 600) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return shingle_hashes(rng.integers(0, vocabulary, size))
+
+
+def shingle_hashes(values) -> np.ndarray:
+    """Distinct values spread over 64 bits, like real shingle hashes"""
+    return np.unique(np.asarray(values, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+def exact_jaccard(first: np.ndarray, second: np.ndarray) -> float:
+    return len(np.intersect1d(first, second)) / len(np.union1d(first, second))
+
+
+class TestMinHasher:
+    """Signatures estimate Jaccard similarity"""
+
+    def test_estimate_close_to_exact(self):
+        """Test estimated Jaccard is within a few standard errors of exact"""
+        hasher = MinHasher()
+        errors = []
+        for seed in range(50):
+            first, second = random_shingles(seed), random_shingles(seed + 1000)
+            estimate = MinHasher.estimate_jaccard(
+                hasher.signature(first), hasher.signature(second)
+            )
+            errors.append(estimate - exact_jaccard(first, second))
+
+        assert abs(np.mean(errors)) < 0.02
+        assert np.max(np.abs(errors)) < 0.15
+
+    def test_signatures_are_stable(self):
+        """Test separate hashers produce identical signatures for stored comparison"""
+        shingles = random_shingles(0)
+
+        assert np.array_equal(MinHasher().signature(shingles), MinHasher().signature(shingles))
+
+    def test_empty_shingle_set(self):
+        """Test empty text gets a constant signature"""
+        signature = MinHasher().signature(np.zeros(0, dtype=np.uint64))
+
+        assert signature.dtype == np.uint32
+        assert len(signature) == MinHasher().num_perm
+
+
+class TestLSHIndex:
+    """Banded lookup returns similar posts without scanning the corpus"""
+
+    def test_similar_posts_are_candidates(self):
+        """Test near-duplicates are found and unrelated posts are not"""
+        hasher = MinHasher()
+        base = random_shingles(0)
+        near = np.union1d(base[:150], shingle_hashes(range(1000, 1030)))
+        unrelated = shingle_hashes(range(2000, 2200))
+
+        index = LSHIndex.build({
+            "near": hasher.signature(near),
+            "unrelated": hasher.signature(unrelated),
+        })
+        results = dict(index.query(hasher.signature(base), threshold=0.1))
+
+        assert "near" in results
+        assert "unrelated" not in results
+        assert results["near"] == pytest.approx(exact_jaccard(base, near), abs=0.15)
+
+    def test_candidates_are_a_small_fraction(self):
+        """Test a query touches only a small part of an unrelated corpus"""
+        hasher = MinHasher()
+        index = LSHIndex.build({
+            f"p{i}": hasher.signature(shingle_hashes(range(10000 + 100 * i, 10100 + 100 * i)))
+            for i in range(500)
+        })
+
+        candidates = index.candidates(hasher.signature(random_shingles(0)))
+
+        assert len(candidates) < 25
+
+    def test_empty_index(self):
+        """Test querying an index with no posts"""
+        assert LSHIndex.build({}).query(MinHasher().signature(shingle_hashes([1]))) == []
+
+
+class TestLexicalCandidates:
+    """SimilarityEngine scores Jaccard only for shortlisted posts"""
+
+    @pytest.mark.asyncio
+    async def test_lexical_match_without_embedding_score(self):
+        """Test a post found only by LSH is scored with exact Jaccard"""
+        engine = SimilarityEngine()
+        text = "compost bins need air water and a mix of green and brown material"
+        posts = [
+            SimpleNamespace(id="match", content=text, status="publish"),
+            SimpleNamespace(id="other", content="tax returns are due in april", status="publish"),
+        ]
+        lsh = LSHIndex.build({
+            post.id: engine.minhasher.signature(engine._shingles(post.content))
+            for post in posts
+        })
+        db = MagicMock()
+        db.execute = AsyncMock()
+        db.commit = AsyncMock()
+        answer = SimpleNamespace(
+            id=1, raw_response=text, response_hash=None, run=SimpleNamespace(client_id=1)
+        )
+
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "_get_client_posts", AsyncMock(return_value=posts)), \
+             patch.object(engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(engine, "_nearest_posts", AsyncMock(return_value=[])), \
+             patch.object(engine, "get_lsh_index", AsyncMock(return_value=lsh)), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value={})), \
+             patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={1: [1.0, 0.0]})), \
+             patch.object(engine, "_jaccard", wraps=engine._jaccard) as jaccard:
+            similarities = await engine.compute_similarities(db, answer)
+
+        assert jaccard.call_count == 1
+        assert [(s.post_id, s.similarity_type) for s in similarities] == [("match", "ngram")]
+        assert similarities[0].similarity_score == pytest.approx(1.0)
@@ -0,0 +1,124 @@
+"""
+Tests for passage-level similarity
+"""
+
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services.similarity_service import SimilarityEngine
+from app.services.text import split_passages
+from app.services.text.shingles import to_bytes
+
+
+def make_db() -> MagicMock:
+    db = MagicMock()
+    db.execute = AsyncMock()
+    db.commit = AsyncMock()
+    return db
+
+
+class TestSplitPassages:
+    """Word windows with exact spans"""
+
+    def test_spans_index_original_text(self):
+        """Test each passage is the verbatim slice of the source text"""
+        text = "  One two\nthree   four five\n\nsix seven eight nine ten  "
+        passages = split_passages(text, max_words=4, overlap=1)
+
+        for passage in passages:
+            assert text[passage.start:passage.end] == passage.text
+        assert [p.text.split() for p in passages] == [
+            ["One", "two", "three", "four"],
+            ["four", "five", "six", "seven"],
+            ["seven", "eight", "nine", "ten"],
+        ]
+
+    def test_short_text_is_one_passage(self):
+        """Test text under the window size is a single passage"""
+        passages = split_passages("just a few words", max_words=120, overlap=20)
+
+        assert len(passages) == 1
+        assert passages[0].text == "just a few words"
+
+    def test_empty_text(self):
+        """Test empty or missing content has no passages"""
+        assert split_passages("", max_words=10, overlap=2) == []
+        assert split_passages(None, max_words=10, overlap=2) == []
+
+    def test_every_word_is_covered(self):
+        """Test the windows cover the whole text with no gaps"""
+        words = [f"w{i}" for i in range(257)]
+        passages = split_passages(" ".join(words), max_words=50, overlap=10)
+
+        covered = [word for passage in passages for word in passage.text.split()]
+        assert set(covered) == set(words)
+        assert passages[-1].text.split()[-1] == "w256"
+
+
+class TestPassageMatching:
+    """Answers are matched against passages"""
+
+    @pytest.mark.asyncio
+    async def test_passages_embedded_in_one_batch(self):
+        """Test passages of several posts are embedded with one call"""
+        engine = SimilarityEngine()
+        posts = [
+            SimpleNamespace(id="p1", content=" ".join(f"a{i}" for i in range(300))),
+            SimpleNamespace(id="p2", content="short post"),
+        ]
+        db = make_db()
+        db.execute.return_value = MagicMock()
+        db.execute.return_value.scalars.return_value.all.return_value = []
+
+        async def embed(texts):
+            return [[1.0, 0.0] for _ in texts]
+
+        with patch.object(engine, "_get_embeddings", AsyncMock(side_effect=embed)) as calls:
+            passages = await engine.get_post_passages(db, 1, posts)
+
+        assert calls.await_count == 1
+        assert len(passages["p1"]) > 1
+        assert len(passages["p2"]) == 1
+        first = passages["p1"][0]
+        assert posts[0].content[first.start_offset:first.end_offset].startswith("a0 a1")
+
+    @pytest.mark.asyncio
+    async def test_best_passage_span_is_matched_text(self):
+        """Test the best-scoring passage is returned verbatim and lifts the score"""
+        engine = SimilarityEngine()
+        intro = "Welcome to our garden blog where we talk about many things."
+        section = "Compost needs a balance of green nitrogen and brown carbon material."
+        post = SimpleNamespace(id="p1", content=f"{intro} {section}", status="publish")
+
+        def passage(index, text, embedding):
+            start = post.content.index(text)
+            return SimpleNamespace(
+                passage_index=index, start_offset=start, end_offset=start + len(text),
+                embedding=embedding, shingles=to_bytes(engine._shingles(text)),
+            )
+
+        passages = {"p1": [passage(0, intro, [0.0, 1.0]), passage(1, section, [1.0, 0.1])]}
+        answer = SimpleNamespace(
+            id=1, raw_response="How should compost be balanced?", response_hash=None,
+            run=SimpleNamespace(client_id=1),
+        )
+
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "_candidate_posts", AsyncMock(return_value=([post], {"p1": 0.5}))), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value=passages)), \
+             patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={1: [1.0, 0.0]})):
+            similarities = await engine.compute_similarities(make_db(), answer)
+
+        assert len(similarities) == 1
+        similarity = similarities[0]
+        assert similarity.matched_text == section
+        assert similarity.similarity_score == pytest.approx(1 / np.linalg.norm([1.0, 0.1]))
+        assert similarity.metadata_json["document_similarity"] == 0.5
+        assert similarity.metadata_json["passage_index"] == 1
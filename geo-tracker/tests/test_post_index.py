@@ -0,0 +1,90 @@
+"""
+Tests for change-driven post indexing and similarity recomputation
+"""
+
+import os
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services.post_index_service import post_index_service
+from app.services.similarity_batch_service import similarity_batch_service
+from app.services.similarity_service import similarity_engine
+
+
+def result(scalars=None, rows=None, rowcount=0) -> MagicMock:
+    value = MagicMock()
+    value.scalars.return_value.all.return_value = scalars or []
+    value.all.return_value = rows or []
+    value.rowcount = rowcount
+    return value
+
+
+class TestIndexPosts:
+    """Synced posts update the index and their similarity rows"""
+
+    @pytest.mark.asyncio
+    async def test_only_changed_posts_are_rescored(self):
+        """Test edited and new posts are re-scored, unchanged ones are not"""
+        unchanged = SimpleNamespace(id="p1", content="same text", status="publish")
+        edited = SimpleNamespace(id="p2", content="new text", status="publish")
+        new = SimpleNamespace(id="p3", content="brand new", status="publish")
+        stored = [
+            ("p1", similarity_engine._content_hash("same text")),
+            ("p2", similarity_engine._content_hash("old text")),
+        ]
+
+        db = MagicMock()
+        db.execute = AsyncMock(side_effect=[
+            result(scalars=[unchanged, edited, new]),
+            result(rows=stored),
+        ])
+        db.commit = AsyncMock()
+
+        with patch.object(similarity_engine, "get_post_embeddings", AsyncMock(return_value={})), \
+             patch.object(similarity_engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(similarity_engine, "get_post_passages", AsyncMock()), \
+             patch.object(similarity_engine, "index_backend", "matrix"), \
+             patch.object(similarity_batch_service, "rescore_posts",
+                          AsyncMock(return_value={"answers": 12, "similarities": 3})) as rescore:
+            stats = await post_index_service.index_posts(db, 1, ["p1", "p2", "p3"])
+
+        assert rescore.await_args.args[2] == ["p2", "p3"]
+        since = rescore.await_args.kwargs["since"]
+        assert abs(since - (datetime.utcnow() - timedelta(days=180))) < timedelta(minutes=1)
+        assert stats["rescored"] == 12
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unpublished_posts_lose_similarities(self):
+        """Test similarity rows and fingerprints of unpublished posts are deleted in bulk"""
+        trashed = SimpleNamespace(id="p9", content="gone", status="trash")
+
+        db = MagicMock()
+        db.execute = AsyncMock(side_effect=[
+            result(scalars=[trashed]),
+            result(scalars=[5, 6]),
+            result(rowcount=4),
+            result(),
+            result(),
+        ])
+        db.commit = AsyncMock()
+
+        with patch.object(similarity_engine, "get_post_embeddings", AsyncMock(return_value={})), \
+             patch.object(similarity_engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(similarity_engine, "get_post_passages", AsyncMock()), \
+             patch.object(similarity_engine, "index_backend", "matrix"), \
+             patch.object(similarity_batch_service, "rescore_posts", AsyncMock()) as rescore:
+            stats = await post_index_service.index_posts(db, 1, ["p9"])
+
+        rescore.assert_not_awaited()
+        statements = [str(call.args[0]) for call in db.execute.await_args_list[2:]]
+        assert statements[0].startswith("DELETE FROM similarities")
+        assert statements[1].startswith("UPDATE answer_features SET best_similarity")
+        assert statements[2].startswith("DELETE FROM post_fingerprints")
+        assert stats["removed"] == 1
+        assert stats["similarities_removed"] == 4
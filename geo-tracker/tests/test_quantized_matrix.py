@@ -0,0 +1,134 @@
+"""
+Tests for quantized, memory-mapped embedding matrices
+"""
+
+import os
+import shutil
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.core.config import settings
+from app.services.similarity_service import SimilarityEngine
+from app.services.vector_index import CorpusMatrix, QuantizedMatrix
+
+
+def clustered_vectors(n: int, dimensions: int = 64, clusters: int = 20, seed: int = 0):
+    """Random vectors scattered around a few cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimensions))
+    labels = rng.integers(0, clusters, size=n)
+    return centres[labels] + 0.5 * rng.normal(size=(n, dimensions))
+
+
+class TestQuantizedMatrix:
+    """Reduced-precision scoring and persistence"""
+
+    def setup_method(self):
+        self.ids = [f"p{i}" for i in range(2000)]
+        self.vectors = clustered_vectors(2000)
+        self.reference = CorpusMatrix(self.ids, self.vectors)
+        self.queries = clustered_vectors(50, seed=1)
+
+    @pytest.mark.parametrize("dtype,tolerance,min_recall", [
+        ("float16", 1e-3, 0.98),
+        ("int8", 2e-2, 0.9),
+    ])
+    def test_accuracy_against_full_precision(self, dtype, tolerance, min_recall):
+        """Test scores stay close to float32 and top-k recall stays high"""
+        quantized = QuantizedMatrix.build(self.ids, self.vectors, dtype)
+
+        assert quantized.dtype == dtype
+        assert quantized.score(self.queries[0]) == pytest.approx(
+            self.reference.score(self.queries[0]), abs=tolerance
+        )
+        assert quantized.recall(self.reference, self.queries, k=10) >= min_recall
+
+    def test_score_many_matches_score(self):
+        """Test block scoring equals scoring queries one at a time"""
+        quantized = QuantizedMatrix.build(self.ids, self.vectors, "int8")
+
+        scores = quantized.score_many(self.queries[:3])
+
+        for row, query in zip(scores, self.queries[:3]):
+            assert row == pytest.approx(quantized.score(query), abs=1e-5)
+
+    def test_save_and_load_memory_mapped(self, tmp_path):
+        """Test a saved matrix loads memory-mapped with the same results"""
+        quantized = QuantizedMatrix.build(self.ids, self.vectors, "int8")
+
+        quantized.save(tmp_path, "corpus-v1")
+        loaded = QuantizedMatrix.load(tmp_path)
+
+        assert isinstance(loaded.codes, np.memmap)
+        assert loaded.corpus_version == "corpus-v1"
+        assert loaded.top_k(self.queries[0], 10) == quantized.top_k(self.queries[0], 10)
+
+    def test_load_pruned_version(self, tmp_path):
+        """Test a version removed under a reader loads as missing, and a given version loads"""
+        quantized = QuantizedMatrix.build(self.ids, self.vectors, "int8")
+
+        first = quantized.save(tmp_path, "corpus-v1")
+        second = quantized.save(tmp_path, "corpus-v2")
+
+        assert QuantizedMatrix.load(tmp_path, first).corpus_version == "corpus-v1"
+        shutil.rmtree(tmp_path / second)
+        assert QuantizedMatrix.load(tmp_path) is None
+
+    def test_empty_and_invalid(self):
+        """Test an empty corpus and an unsupported dtype"""
+        empty = QuantizedMatrix.build([], [], "int8")
+
+        assert len(empty.score([1.0, 0.0])) == 0
+        assert empty.score_many([[1.0, 0.0]]).shape == (1, 0)
+        with pytest.raises(ValueError):
+            QuantizedMatrix.build(self.ids, self.vectors, "int4")
+
+
+class TestQuantizedCorpus:
+    """SimilarityEngine shares quantized matrices through files"""
+
+    @pytest.mark.asyncio
+    async def test_matrix_saved_once_and_reused(self, tmp_path, monkeypatch):
+        """Test a second engine maps the saved matrix instead of loading embeddings"""
+        monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "SIMILARITY_MATRIX_DTYPE", "int8")
+        posts = [SimpleNamespace(id=f"p{i}", content=f"post {i}") for i in range(3)]
+        embeddings = {post.id: vector for post, vector in zip(posts, np.eye(3).tolist())}
+
+        first = SimilarityEngine()
+        with patch.object(first, "get_post_embeddings", AsyncMock(return_value=embeddings)):
+            built = await first.get_corpus_matrix(MagicMock(), 1, posts)
+
+        second = SimilarityEngine()
+        with patch.object(second, "get_post_embeddings", AsyncMock()) as load:
+            mapped = await second.get_corpus_matrix(MagicMock(), 1, posts)
+
+        load.assert_not_awaited()
+        assert isinstance(built, QuantizedMatrix)
+        assert isinstance(mapped.codes, np.memmap)
+        assert mapped.top_k([0.0, 1.0, 0.0], 1) == [("p1", pytest.approx(1.0, abs=1e-2))]
+
+    @pytest.mark.asyncio
+    async def test_changed_corpus_rebuilds(self, tmp_path, monkeypatch):
+        """Test a saved matrix for an older corpus is not used"""
+        monkeypatch.setattr(settings, "VECTOR_INDEX_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "SIMILARITY_MATRIX_DTYPE", "float16")
+        posts = [SimpleNamespace(id="p1", content="old")]
+        engine = SimilarityEngine()
+
+        with patch.object(engine, "get_post_embeddings", AsyncMock(return_value={"p1": [1.0, 0.0]})):
+            await engine.get_corpus_matrix(MagicMock(), 1, posts)
+
+        posts.append(SimpleNamespace(id="p2", content="new"))
+        fresh = SimilarityEngine()
+        embeddings = {"p1": [1.0, 0.0], "p2": [0.0, 1.0]}
+        with patch.object(fresh, "get_post_embeddings", AsyncMock(return_value=embeddings)) as load:
+            corpus = await fresh.get_corpus_matrix(MagicMock(), 1, posts)
+
+        load.assert_awaited_once()
+        assert corpus.ids == ["p1", "p2"]
@@ -0,0 +1,102 @@
+"""
+Tests for hashed shingle sets
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services.similarity_service import SimilarityEngine
+from app.services.text import jaccard, shingle_set, tokenize
+from app.services.text.shingles import from_bytes, to_bytes, word_hashes
+
+
+def string_shingles(text: str) -> set:
+    """Reference 2-gram and 3-gram string sets, as the engine used to build them"""
+    words = text.lower().split()
+    return {
+        " ".join(words[i:i + n])
+        for n in (2, 3)
+        for i in range(len(words) - n + 1)
+    }
+
+
+TEXTS = [
+    "How to build a raised garden bed from reclaimed timber",
+    "A raised garden bed needs good drainage and reclaimed timber that is untreated",
+    "Quarterly tax returns for small businesses",
+    "",
+    "single",
+]
+
+
+class TestShingleSet:
+    """Hashed shingles match the string n-gram sets they replace"""
+
+    def test_sorted_unique_uint64(self):
+        """Test shingles are a sorted, unique uint64 array"""
+        shingles = shingle_set("the cat sat on the cat sat on the mat")
+
+        assert shingles.dtype == np.uint64
+        assert np.array_equal(shingles, np.unique(shingles))
+        assert len(shingles) == len(string_shingles("the cat sat on the cat sat on the mat"))
+
+    @pytest.mark.parametrize("first", TEXTS)
+    @pytest.mark.parametrize("second", TEXTS)
+    def test_jaccard_matches_string_sets(self, first, second):
+        """Test hashed Jaccard equals Jaccard over string n-gram sets"""
+        expected_first, expected_second = string_shingles(first), string_shingles(second)
+        union = len(expected_first | expected_second)
+        expected = len(expected_first & expected_second) / union if union else 0.0
+
+        assert jaccard(shingle_set(first), shingle_set(second)) == pytest.approx(expected)
+
+    def test_case_insensitive(self):
+        """Test shingles ignore case like the original n-grams"""
+        assert np.array_equal(shingle_set("Raised Garden Bed"), shingle_set("raised garden bed"))
+
+    def test_bytes_round_trip(self):
+        """Test the stored form restores the same array"""
+        shingles = shingle_set(TEXTS[1])
+
+        assert np.array_equal(from_bytes(to_bytes(shingles)), shingles)
+
+    def test_smaller_than_string_sets(self):
+        """Test the array is a fraction of the size of the string set it replaces"""
+        text = " ".join(f"word{i % 400}" for i in range(5000))
+        strings = string_shingles(text)
+        string_bytes = sum(len(s) + 49 for s in strings) + 8 * len(strings)
+
+        assert shingle_set(text).nbytes * 5 < string_bytes
+
+
+class TestMatchedText:
+    """Matched text is read back from the post using hashes"""
+
+    def test_ngram_match_returns_shared_bigrams(self):
+        """Test n-gram matches return 2-grams present in both texts"""
+        engine = SimilarityEngine()
+        answer = "reclaimed timber makes a sturdy raised garden bed"
+        answer_words = np.unique(word_hashes(tokenize(answer)))
+
+        matched = engine._find_matched_text(
+            shingle_set(answer), answer_words, TEXTS[0], "ngram"
+        )
+
+        # Shared 2-grams in post order
+        assert matched == "raised garden garden bed reclaimed timber"
+
+    def test_embedding_match_returns_shared_words(self):
+        """Test other matches return shared words once each, in post order"""
+        engine = SimilarityEngine()
+        answer = "build a raised bed from reclaimed timber to start"
+        answer_words = np.unique(word_hashes(tokenize(answer)))
+
+        matched = engine._find_matched_text(
+            shingle_set(answer), answer_words, TEXTS[0], "embedding"
+        )
+
+        assert matched == "to build a raised bed from reclaimed timber"
@@ -0,0 +1,290 @@
+"""
+Tests for bulk similarity scoring
+"""
+
+import dataclasses
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from sqlalchemy import Select
+
+from app.core.config import settings
+from app.services.similarity_batch_service import ClientCorpus, SimilarityBatchService
+from app.services.similarity_service import SimilarityEngine
+from app.services.text import BM25Index, LSHIndex, split_passages, term_counts
+from app.services.text.shingles import to_bytes
+from app.services.vector_index import CorpusMatrix
+
+WORDS = "soil compost seed water light frost prune mulch bed root leaf bloom".split()
+
+
+def make_db() -> MagicMock:
+    db = MagicMock()
+    db.execute = AsyncMock()
+    db.commit = AsyncMock()
+    return db
+
+
+def make_corpus(engine: SimilarityEngine, posts_count: int = 40, dimensions: int = 16):
+    rng = np.random.default_rng(0)
+    posts, passages, embeddings = [], {}, {}
+
+    for i in range(posts_count):
+        content = " ".join(rng.choice(WORDS, size=60))
+        post = SimpleNamespace(id=f"p{i}", content=content, status="publish")
+        posts.append(post)
+        embeddings[post.id] = rng.normal(size=dimensions)
+        passages[post.id] = [
+            SimpleNamespace(
+                passage_index=passage.index,
+                start_offset=passage.start,
+                end_offset=passage.end,
+                embedding=(embeddings[post.id] + rng.normal(size=dimensions)).tolist(),
+                shingles=to_bytes(engine._shingles(passage.text)),
+            )
+            for passage in split_passages(content, max_words=25, overlap=5)
+        ]
+
+    documents = CorpusMatrix([post.id for post in posts], [embeddings[post.id] for post in posts])
+    lsh = LSHIndex.build({
+        post.id: engine.minhasher.signature(engine._shingles(post.content)) for post in posts
+    })
+    return posts, passages, embeddings, documents, lsh
+
+
+def make_answers(count: int = 12, dimensions: int = 16):
+    rng = np.random.default_rng(1)
+    answers = [
+        SimpleNamespace(
+            id=i, raw_response=" ".join(rng.choice(WORDS, size=40)), response_hash=None,
+            run=SimpleNamespace(client_id=1),
+        )
+        for i in range(count)
+    ]
+    vectors = {answer.id: rng.normal(size=dimensions).tolist() for answer in answers}
+    return answers, vectors
+
+
+class TestSimilarityBatch:
+    """Bulk scoring matches per-answer scoring"""
+
+    def setup_method(self):
+        self.engine = SimilarityEngine()
+        self.engine.similarity_threshold = 0.3
+        self.engine.top_k = 5
+        self.posts, self.passages, self.embeddings, self.documents, self.lsh = make_corpus(self.engine)
+        self.answers, self.vectors = make_answers()
+
+        flat, passage_matrix, ranges = self.engine._passage_matrix(self.passages)
+        self.corpus = ClientCorpus(
+            posts={post.id: post for post in self.posts},
+            documents=self.documents,
+            post_shingles={post.id: self.engine._shingles(post.content) for post in self.posts},
+            lsh=self.lsh,
+            passages=flat,
+            passage_matrix=passage_matrix,
+            passage_ranges=ranges,
+            bm25=BM25Index.build({post.id: term_counts(post.content) for post in self.posts}),
+        )
+
+    async def single_answer_rows(self, answer):
+        engine = self.engine
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={answer.id: self.vectors[answer.id]})), \
+             patch.object(engine, "_get_client_posts", AsyncMock(return_value=self.posts)), \
+             patch.object(engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(engine, "get_corpus_matrix", AsyncMock(return_value=self.documents)), \
+             patch.object(engine, "get_lsh_index", AsyncMock(return_value=self.lsh)), \
+             patch.object(engine, "get_bm25_index", AsyncMock(return_value=self.corpus.bm25)), \
+             patch.object(engine, "_get_posts_by_id", AsyncMock(side_effect=lambda db, client_id, post_ids: [
+                 post for post in self.posts if post.id in post_ids
+             ])), \
+             patch.object(engine, "get_post_embeddings", AsyncMock(side_effect=lambda db, client_id, posts: {
+                 post.id: self.embeddings[post.id] for post in posts
+             })), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(side_effect=lambda db, client_id, posts: {
+                 post.id: self.passages[post.id] for post in posts
+             })):
+            similarities = await engine.compute_similarities(make_db(), answer)
+
+        return {
+            (s.answer_id, s.post_id): (s.similarity_score, s.similarity_type, s.matched_text)
+            for s in similarities
+        }
+
+    async def bulk_rows(self, db):
+        service = SimilarityBatchService(self.engine)
+        with patch.object(self.engine, "get_answer_embeddings", AsyncMock(return_value=self.vectors)):
+            count = await service.score_answers(db, 1, self.corpus, self.answers)
+
+        rows = db.execute.await_args_list[-2].args[1]
+        assert count == len(rows)
+        return {
+            (row["answer_id"], row["post_id"]): (
+                row["similarity_score"], row["similarity_type"], row["matched_text"]
+            )
+            for row in rows
+        }
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("stages", [["embedding", "lsh"], ["bm25", "embedding", "lsh"], ["bm25"]])
+    async def test_bulk_matches_single_answer_path(self, stages):
+        """Test block scoring stores the same rows as scoring answers one by one"""
+        self.engine.stages = stages
+        self.engine.bm25_top_n = 8
+        expected = {}
+        for answer in self.answers:
+            expected.update(await self.single_answer_rows(answer))
+
+        bulk = await self.bulk_rows(make_db())
+
+        assert expected
+        assert bulk.keys() == expected.keys()
+        for key, (score, similarity_type, matched_text) in expected.items():
+            assert bulk[key][0] == pytest.approx(score, abs=1e-5)
+            assert bulk[key][1:] == (similarity_type, matched_text)
+
+    @pytest.mark.asyncio
+    async def test_block_size_does_not_change_results(self):
+        """Test results are the same when the memory cap forces one answer per block"""
+        service = SimilarityBatchService(self.engine)
+        whole = await self.bulk_rows(make_db())
+
+        with patch.object(SimilarityBatchService, "_block_size", return_value=1):
+            blocks = list(service._score_blocks(self.corpus, list(self.vectors.values())))
+            tiny = await self.bulk_rows(make_db())
+
+        assert len(blocks) == len(self.answers)
+        assert tiny.keys() == whole.keys()
+
+    def test_block_size_respects_memory_cap(self, monkeypatch):
+        """Test a block of float32 scores stays within the configured cap"""
+        from app.core.config import settings
+        monkeypatch.setattr(settings, "SIMILARITY_BATCH_MEMORY_MB", 1)
+        service = SimilarityBatchService(self.engine)
+
+        block = service._block_size(10_000)
+
+        assert block * 10_000 * 4 <= 1024 * 1024
+        assert service._block_size(10**9) == 1
+
+    @pytest.mark.asyncio
+    async def test_answers_embedded_once_per_chunk(self):
+        """Test a chunk costs one batched embedding lookup and replaces old rows"""
+        service = SimilarityBatchService(self.engine)
+        db = make_db()
+
+        with patch.object(self.engine, "get_answer_embeddings", AsyncMock(return_value=self.vectors)) as embed:
+            await service.score_answers(db, 1, self.corpus, self.answers)
+
+        embed.assert_awaited_once()
+        assert embed.await_args.args[2] == self.answers
+        statements = [str(call.args[0]) for call in db.execute.await_args_list]
+        assert statements[0].startswith("DELETE FROM similarities")
+        assert statements[1].startswith("INSERT INTO similarities")
+        assert statements[2].startswith("UPDATE answer_features SET best_similarity")
+
+    @pytest.mark.asyncio
+    async def test_answers_paged_by_keyset(self, monkeypatch):
+        """Test every answer is scored once across chunks fetched after the last seen id"""
+        monkeypatch.setattr(settings, "SIMILARITY_BATCH_ANSWERS", 5)
+        whole = await self.bulk_rows(make_db())
+        pages, rows = [], {}
+
+        async def execute(statement, *args):
+            result = MagicMock()
+            if isinstance(statement, Select):
+                params = statement.compile().params
+                page = [
+                    answer for answer in self.answers if answer.id > params.get("id_1", -1)
+                ][:params["param_1"]]
+                pages.append([answer.id for answer in page])
+                result.scalars.return_value.all.return_value = page
+            elif str(statement).startswith("INSERT INTO similarities"):
+                rows.update({(row["answer_id"], row["post_id"]): row["similarity_type"] for row in args[0]})
+            return result
+
+        db = make_db()
+        db.execute = AsyncMock(side_effect=execute)
+        with patch.object(self.engine, "get_answer_embeddings", AsyncMock(return_value=self.vectors)):
+            stats = await SimilarityBatchService(self.engine)._score_stream(
+                db, 1, self.corpus, None, None, version="v1"
+            )
+
+        assert pages == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9], [10, 11], []]
+        assert stats == {"answers": 12, "similarities": len(whole)}
+        assert rows == {key: value[1] for key, value in whole.items()}
+        versioned = [
+            call.args[0] for call in db.execute.await_args_list
+            if str(call.args[0]).startswith("UPDATE answers")
+        ]
+        assert len(versioned) == 3
+
+    @pytest.mark.asyncio
+    async def test_changed_posts_match_full_rescore(self):
+        """Test re-scoring only some posts gives their rows from a full re-score"""
+        engine = self.engine
+        targets = ["p3", "p7", "p11", "p20"]
+
+        with patch.object(engine, "_get_client_posts", AsyncMock(return_value=self.posts)), \
+             patch.object(engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(engine, "get_corpus_matrix", AsyncMock(return_value=self.documents)), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(side_effect=lambda db, client_id, posts: {
+                 post.id: self.passages[post.id] for post in posts
+             })), \
+             patch.object(engine, "get_lsh_index", AsyncMock(return_value=self.lsh)):
+            corpus = await SimilarityBatchService(engine).load_corpus(make_db(), 1, targets)
+
+        assert sorted(corpus.posts) == sorted(targets)
+        assert len(corpus.documents) == len(self.posts)
+
+        whole = await self.bulk_rows(make_db())
+        db = make_db()
+        with patch.object(engine, "get_answer_embeddings", AsyncMock(return_value=self.vectors)):
+            await SimilarityBatchService(engine).score_answers(db, 1, corpus, self.answers, targets)
+
+        rows = db.execute.await_args_list[-2].args[1]
+        partial = {(row["answer_id"], row["post_id"]): row["similarity_type"] for row in rows}
+        assert partial
+        assert partial == {key: value[1] for key, value in whole.items() if key[1] in targets}
+        assert "post_id IN" in str(db.execute.await_args_list[0].args[0])
+
+    @pytest.mark.asyncio
+    async def test_changed_post_leaves_displaced_row_when_cap_binds(self):
+        """Test a post pushed out of an answer's top_k by a changed post keeps its row"""
+        engine = self.engine
+        engine.stages = ["embedding"]
+        engine.top_k = 1
+        engine.similarity_threshold = engine.jaccard_threshold = 0.0
+        answer = self.answers[0]
+
+        before = await self.bulk_rows(make_db())
+        (displaced,) = [post_id for answer_id, post_id in before if answer_id == answer.id]
+        changed = next(post.id for post in self.posts if post.id != displaced)
+
+        # The changed post now matches the answer best
+        self.embeddings[changed] = np.array(self.vectors[answer.id])
+        self.corpus = dataclasses.replace(self.corpus, documents=CorpusMatrix(
+            [post.id for post in self.posts], [self.embeddings[post.id] for post in self.posts]
+        ))
+        after = await self.bulk_rows(make_db())
+
+        db = make_db()
+        with patch.object(engine, "get_answer_embeddings", AsyncMock(return_value=self.vectors)):
+            await SimilarityBatchService(engine).score_answers(db, 1, self.corpus, self.answers, [changed])
+        partial = {(row["answer_id"], row["post_id"]) for row in db.execute.await_args_list[-2].args[1]}
+
+        assert [post_id for answer_id, post_id in after if answer_id == answer.id] == [changed]
+        assert (answer.id, changed) in partial
+        # A full re-score drops the displaced post's row; the partial one only replaces the changed post's
+        assert (answer.id, displaced) not in after
+        stale = db.execute.await_args_list[0].args[0]
+        assert stale.compile().params["post_id_1"] == [changed]
@@ -0,0 +1,255 @@
+"""
+Tests for the similarity engine
+"""
+
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.core.config import settings
+from app.services.similarity_service import SimilarityEngine
+from app.services.vector_index import CorpusMatrix
+
+
+def make_post(post_id: str, content: str) -> SimpleNamespace:
+    return SimpleNamespace(id=post_id, content=content, status="publish")
+
+
+def make_answer(answer_id: int, text: str, client_id: int = 1) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=answer_id,
+        raw_response=text,
+        response_hash=None,
+        run=SimpleNamespace(client_id=client_id),
+    )
+
+
+def make_db() -> MagicMock:
+    db = MagicMock()
+    db.execute = AsyncMock()
+    db.commit = AsyncMock()
+    return db
+
+
+class TestPostEmbeddingStore:
+    """Post embeddings are stored once and reused across answers"""
+
+    @pytest.mark.asyncio
+    async def test_stored_embeddings_need_single_embedding_call(self):
+        """Test an answer costs one embedding call when all posts are stored"""
+        engine = SimilarityEngine()
+        posts = [make_post(f"p{i}", f"post number {i} about gardening") for i in range(5)]
+        stored = {post.id: [1.0, 0.0, 0.0] for post in posts}
+
+        with patch.object(engine, "similarity_version", AsyncMock(return_value="v1")), \
+             patch.object(engine, "_get_client_posts", AsyncMock(return_value=posts)), \
+             patch.object(engine, "_load_post_embeddings", AsyncMock(return_value=stored)), \
+             patch.object(engine, "sync_post_fingerprints", AsyncMock()), \
+             patch.object(engine, "_lexical_candidates", AsyncMock(return_value=set())), \
+             patch.object(engine, "_load_post_shingles", AsyncMock(return_value={})), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value={})), \
+             patch.object(engine, "_load_answer_embeddings", AsyncMock(return_value={})), \
+             patch.object(engine, "_get_embeddings", AsyncMock(return_value=[[1.0, 0.0, 0.0]])) as embed:
+            similarities = await engine.compute_similarities(
+                make_db(), make_answer(1, "an answer about gardening")
+            )
+
+        assert embed.await_count == 1
+        assert len(similarities) == len(posts)
+        assert all(s.similarity_type == "embedding" for s in similarities)
+
+    @pytest.mark.asyncio
+    async def test_only_new_or_changed_posts_are_embedded(self):
+        """Test posts without a matching stored embedding are embedded and stored"""
+        engine = SimilarityEngine()
+        posts = [make_post("p1", "first post"), make_post("p2", "second post")]
+        db = make_db()
+
+        with patch.object(engine, "_load_post_embeddings", AsyncMock(return_value={"p1": [0.0, 1.0]})), \
+             patch.object(engine, "_get_embeddings", AsyncMock(return_value=[[1.0, 0.0]])) as embed:
+            embeddings = await engine.get_post_embeddings(db, 1, posts)
+
+        assert embed.await_count == 1
+        embed.assert_awaited_with(["second post"])
+        assert embeddings == {"p1": [0.0, 1.0], "p2": [1.0, 0.0]}
+
+        stored = db.add.call_args[0][0]
+        assert stored.post_id == "p2"
+        assert stored.model == engine.model
+        assert stored.content_hash == SimilarityEngine._content_hash("second post")
+
+    def test_content_hash_tracks_content(self):
+        """Test content hash changes only when the content changes"""
+        assert SimilarityEngine._content_hash("same") == SimilarityEngine._content_hash("same")
+        assert SimilarityEngine._content_hash("same") != SimilarityEngine._content_hash("edited")
+
+
+class TestCorpusMatrix:
+    """Vectorized answer-vs-corpus scoring"""
+
+    def test_scores_match_cosine_similarity(self):
+        """Test matrix scores equal per-pair cosine similarity"""
+        rng = np.random.default_rng(7)
+        vectors = rng.normal(size=(20, 16))
+        query = rng.normal(size=16)
+        corpus = CorpusMatrix([f"p{i}" for i in range(20)], vectors)
+
+        expected = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+
+        assert corpus.matrix.dtype == np.float32
+        assert np.allclose(corpus.score(query), expected, atol=1e-5)
+
+    def test_top_k_applies_threshold_and_order(self):
+        """Test top-k keeps the best rows above threshold, best first"""
+        corpus = CorpusMatrix(
+            ["a", "b", "c", "d"],
+            [[1.0, 0.0], [0.8, 0.6], [0.0, 1.0], [-1.0, 0.0]],
+        )
+
+        assert [post_id for post_id, _ in corpus.top_k([1.0, 0.0], k=2)] == ["a", "b"]
+        assert [post_id for post_id, _ in corpus.top_k([1.0, 0.0], k=10, threshold=0.5)] == ["a", "b"]
+
+    def test_empty_corpus(self):
+        """Test an empty corpus scores nothing"""
+        assert CorpusMatrix([], []).top_k([1.0, 0.0], k=5) == []
+
+    @pytest.mark.asyncio
+    async def test_corpus_matrix_cached_until_posts_change(self):
+        """Test the matrix is rebuilt only when post content changes"""
+        engine = SimilarityEngine()
+        posts = [make_post("p1", "first post"), make_post("p2", "second post")]
+        stored = {"p1": [1.0, 0.0], "p2": [0.0, 1.0]}
+
+        with patch.object(engine, "get_post_embeddings", AsyncMock(return_value=stored)) as load:
+            first = await engine.get_corpus_matrix(make_db(), 1, posts)
+            second = await engine.get_corpus_matrix(make_db(), 1, posts)
+            posts[0].content = "first post, edited"
+            await engine.get_corpus_matrix(make_db(), 1, posts)
+
+        assert first is second
+        assert load.await_count == 2
+
+
+class TestPgvectorFallback:
+    """Exact scan when the shared HNSW index returns too few of a client's posts"""
+
+    @pytest.mark.asyncio
+    async def test_short_index_result_uses_exact_scan(self):
+        """Test fewer than top_k neighbours falls back to the matrix, enough does not"""
+        engine = SimilarityEngine()
+        engine.index_backend = "pgvector"
+        engine.top_k = 2
+        engine.similarity_threshold = engine.jaccard_threshold = 0.5
+        posts = [make_post("p1", "a"), make_post("p2", "b"), make_post("p3", "c")]
+        corpus = CorpusMatrix(["p1", "p2", "p3"], [[1.0, 0.0], [0.0, 1.0], [0.8, 0.6]])
+
+        with patch.object(engine, "sync_post_vectors", AsyncMock()), \
+             patch.object(engine, "_pgvector_nearest", AsyncMock(return_value=[("p3", 0.8)])), \
+             patch.object(engine, "get_corpus_matrix", AsyncMock(return_value=corpus)) as exact:
+            nearest = await engine._nearest_posts(make_db(), 1, posts, [1.0, 0.0])
+
+        exact.assert_awaited_once()
+        assert [post_id for post_id, _ in nearest] == ["p1", "p3"]
+
+        found = [("p1", 1.0), ("p2", 0.1)]
+        with patch.object(engine, "sync_post_vectors", AsyncMock()), \
+             patch.object(engine, "_pgvector_nearest", AsyncMock(return_value=found)), \
+             patch.object(engine, "get_corpus_matrix", AsyncMock()) as exact:
+            nearest = await engine._nearest_posts(make_db(), 1, posts, [1.0, 0.0])
+
+        exact.assert_not_awaited()
+        assert nearest == [("p1", 1.0)]
+
+
+def db_result(one=None, scalar=None, scalars=None) -> MagicMock:
+    result = MagicMock()
+    result.one.return_value = one
+    result.scalar_one_or_none.return_value = scalar
+    result.scalars.return_value.all.return_value = scalars or []
+    return result
+
+
+class TestDuplicateAnswers:
+    """Identical answers reuse earlier similarity rows"""
+
+    @pytest.mark.asyncio
+    async def test_rows_copied_without_embedding(self):
+        """Test a duplicate answer copies rows with INSERT ... SELECT and embeds nothing"""
+        engine = SimilarityEngine()
+        answer = make_answer(2, "same answer")
+        answer.response_hash = "abc"
+        copied = [SimpleNamespace(answer_id=2, post_id="p1")]
+        db = make_db()
+        db.execute.side_effect = [
+            db_result(one=(3, 10)),
+            db_result(scalar=1),
+            db_result(),
+            db_result(),
+            db_result(),
+            db_result(),
+            db_result(scalars=copied),
+        ]
+
+        with patch.object(engine, "get_answer_embeddings", AsyncMock()) as embed:
+            similarities = await engine.compute_similarities(db, answer)
+
+        embed.assert_not_awaited()
+        assert similarities == copied
+        assert answer.similarity_corpus_version == await engine.similarity_version(
+            MagicMock(execute=AsyncMock(return_value=db_result(one=(3, 10)))), 1
+        )
+        statements = [str(call.args[0]) for call in db.execute.await_args_list]
+        assert statements[2].startswith("INSERT INTO similarities (answer_id, post_id")
+        assert "FROM similarities" in statements[2]
+        assert statements[4].startswith("INSERT INTO answer_embeddings")
+        assert statements[5].startswith("UPDATE answer_features SET best_similarity")
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_no_earlier_answer_computes(self):
+        """Test an answer with no scored duplicate goes through the full pipeline"""
+        engine = SimilarityEngine()
+        answer = make_answer(2, "new answer")
+        answer.response_hash = "abc"
+        db = make_db()
+        db.execute.side_effect = [db_result(one=(3, 10)), db_result(scalar=None)]
+
+        with patch.object(engine, "get_answer_embeddings", AsyncMock(return_value={2: [1.0, 0.0]})) as embed, \
+             patch.object(engine, "_candidate_posts", AsyncMock(return_value=([], {}))), \
+             patch.object(engine, "get_post_passages", AsyncMock(return_value={})), \
+             patch.object(engine, "similarity_version", wraps=engine.similarity_version), \
+             patch.object(engine, "_fingerprint_version", AsyncMock(return_value=(3, 10))):
+            await engine.compute_similarities(db, answer)
+
+        embed.assert_awaited_once()
+        assert answer.similarity_corpus_version is not None
+
+    @pytest.mark.asyncio
+    async def test_version_tracks_corpus_and_settings(self):
+        """Test the version changes with the fingerprints and scoring settings"""
+        engine = SimilarityEngine()
+
+        async def version(count, max_id):
+            with patch.object(engine, "_fingerprint_version", AsyncMock(return_value=(count, max_id))):
+                return await engine.similarity_version(make_db(), 1)
+
+        base = await version(3, 10)
+        assert base == await version(3, 10)
+        assert base != await version(3, 11)
+        assert base != await version(2, 10)
+
+        engine.similarity_threshold = 0.9
+        changed = await version(3, 10)
+        assert base != changed
+
+        # Approximate candidate indexes change which posts are scored
+        engine.index_backend, engine.matrix_dtype = "ivf", "int8"
+        backend = await version(3, 10)
+        assert backend != changed
+        with patch.object(settings, "IVF_NPROBE", settings.IVF_NPROBE + 1):
+            assert await version(3, 10) != backend